@@ -1,6 +1,69 @@
+import os
+import time
+from contextlib import contextmanager
 import numpy as np
 import pyclifford as pc
 from numba import njit
+from streams import generator
+import tableau
+
+# Set MIPT_PROFILE=1 to accumulate the wall time of each phase of sample and sample_batch in phase_times
+PROFILE = bool(os.environ.get('MIPT_PROFILE'))
+phase_times = {}
+
+@contextmanager
+def phase(name):
+    """Times a block as one call of a phase of the simulation, if profiling is enabled (see PROFILE).
+
+    Args:
+        name (str): The phase.
+
+    Yields:
+        None
+    """
+    if not PROFILE:
+        yield
+        return
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds, calls = phase_times.get(name, (0.0, 0))
+        phase_times[name] = (seconds + time.perf_counter() - start_time, calls + 1)
+
+def zero_state(N, backend = 'native'):
+    """Creates the state |0...0>.
+
+    Args:
+        N (int): The number of qubits.
+        backend (str, optional): The simulation backend, 'native' or 'pyclifford'. Defaults to 'native'.
+
+    Returns:
+        tableau.StabilizerTableau or pc.stabilizer.StabilizerState: The zero state.
+    """
+    if backend == 'native':
+        return tableau.zero_state(N)
+    elif backend == 'pyclifford':
+        return pc.zero_state(N)
+    raise ValueError("Unknown backend {}".format(backend))
+
+def empty_circuit(N, backend = 'native', rng = None):
+    """Creates an empty circuit.
+
+    Args:
+        N (int): The number of qubits.
+        backend (str, optional): The simulation backend, 'native' or 'pyclifford'. Defaults to 'native'.
+        rng (numpy.random.Generator, optional): The random number generator of a native circuit; PyClifford draws from
+            the global NumPy state. Defaults to None (fresh entropy).
+
+    Returns:
+        tableau.Circuit or pc.circuit.Circuit: The empty circuit.
+    """
+    if backend == 'native':
+        return tableau.Circuit(N, rng)
+    elif backend == 'pyclifford':
+        return pc.circuit.Circuit(N)
+    raise ValueError("Unknown backend {}".format(backend))
 
 @njit
 def qubit_pos(i, D = 1):
@@ -16,10 +79,10 @@ def qubit_pos(i, D = 1):
     return [i * D + j for j in range(D)]
 
 def random_clifford(circ, even = True, D = 1):
-    """Adds a layer of random Clifford gates to the circuit.
+    """Adds a layer of random Clifford gates to the circuit, drawn from the random number generator of the circuit.
 
     Args:
-        circ (pc.circuit.Circuit): The circuit to add gates to.
+        circ (tableau.Circuit or pc.circuit.Circuit): The circuit to add gates to.
         even (bool, optional): Whether to add gates starting with even or odd qudits. Defaults to True.
         D (int, optional): The number of qubits per qudit. Defaults to 1.
     
@@ -30,50 +93,53 @@ def random_clifford(circ, even = True, D = 1):
     assert N % D == 0
     L = N // D
 
-    for i in range(L // 2):
-        if even:
-            q1 = 2 * i
-            q2 = q1 + 1
-        else:
-            q1 = 2 * i + 1
-            q2 = (q1 + 1) % L
-        circ.gate(*qubit_pos(q1, D), *qubit_pos(q2, D))
+    pairs = tableau.brickwork_pairs(L, even, D)
+    if isinstance(circ, tableau.Circuit):
+        circ.layer(pairs)
+    else:
+        for qubits in pairs:
+            circ.gate(*qubits.tolist())
 
 @njit
-def generate_measurement_position(L, p, D = 1):
+def generate_measurement_position(L, p, D, rng):
     """Generates a random list of positions to measure.
 
     Args:
         L (int): The number of qudits in the circuit.
         p (float): The probability of measuring each qudit.
-        D (int, optional): The number of qubits per qudit. Defaults to 1.
+        D (int): The number of qubits per qudit.
+        rng (numpy.random.Generator): The random number generator.
 
     Returns:
         list: The list of qubit positions to measure.
     """
     positions = []
     for i in range(L):
-        if np.random.rand()<p:
+        if rng.random() < p:
             positions.extend(qubit_pos(i, D))
     return positions
 
-def random_measurement(circ, p, D = 1):
+def random_measurement(circ, p, D = 1, rng = None):
     """Adds a layer of random measurements to the circuit.
 
     Args:
-        circ (pc.circuit.Circuit): The circuit to add measurements to.
+        circ (tableau.Circuit or pc.circuit.Circuit): The circuit to add measurements to.
         p (float): The probability of measuring each qudit.
         D (int, optional): The number of qubits per qudit. Defaults to 1.
+        rng (numpy.random.Generator, optional): The random number generator. Defaults to None (that of a native
+            circuit, else fresh entropy).
 
     Returns:
         None
     """
+    if rng is None:
+        rng = generator(getattr(circ, 'rng', None))
     L = circ.N // D
-    pos = generate_measurement_position(L, p, D)
+    pos = generate_measurement_position(L, p, D, rng)
     if pos: # not empty
         circ.measure(*pos)
 
-def create_circuit(L, depth, p, D = 1):
+def create_circuit(L, depth, p, D = 1, backend = 'native', rng = None):
     """Creates a random Clifford circuit with random measurements.
     
     Args:
@@ -81,46 +147,115 @@ def create_circuit(L, depth, p, D = 1):
         depth (int): The number of time steps in the circuit.
         p (float): The probability of measuring each qudit.
         D (int, optional): The number of qubits per qudit. Defaults to 1.
+        backend (str, optional): The simulation backend, 'native' or 'pyclifford'. Defaults to 'native'.
+        rng (numpy.random.Generator, optional): The random number generator. Defaults to None (fresh entropy).
     
     Returns:
-        pc.circuit.Circuit: The random Clifford circuit.
+        tableau.CompactCircuit or pc.circuit.Circuit: The random Clifford circuit, drawn in bulk for the native backend.
     """
     N = L * D
+    rng = generator(rng)
+    if backend == 'native':
+        return tableau.CompactCircuit.generate(L, 2 * depth, p, D, rng)
     if p > 0:
-        circ = pc.circuit.Circuit(N)
+        circ = empty_circuit(N, backend, rng)
         for _ in range(depth):
             random_clifford(circ, even = True, D = D)
-            random_measurement(circ, p, D)
+            random_measurement(circ, p, D, rng)
             random_clifford(circ, even = False, D = D)
-            random_measurement(circ, p, D)
+            random_measurement(circ, p, D, rng)
     else:
-        circ = pc.circuit.Circuit(N) # TODO: use tc.circuit.CliffordCircuit for greater speedup
+        circ = empty_circuit(N, backend, rng)
         for _ in range(depth):
             random_clifford(circ, even = True, D = D)
             random_clifford(circ, even = False, D = D)
     return circ
 
-def me_state(L, D = 1):
+def me_state(L, D = 1, backend = 'native', rng = None):
     """Creates a random maximally entangled state.
 
+    With the native backend this is a uniformly random stabilizer state, sampled directly (see tableau.random_state),
+    and with PyClifford the state after L // 2 timesteps of the random circuit without measurements.
+
     Args:
         L (int): The number of qudits in the state.
         D (int, optional): The number of qubits per qudit. Defaults to 1.
+        backend (str, optional): The simulation backend, 'native' or 'pyclifford'. Defaults to 'native'.
+        rng (numpy.random.Generator, optional): The random number generator. Defaults to None (fresh entropy).
     
     Returns:
-        pc.stabilizer.StabilizerState: The maximally entangled state.
+        tableau.StabilizerTableau or pc.stabilizer.StabilizerState: The maximally entangled state.
     """
     N = L * D
-    state = pc.zero_state(N)
-    circ = create_circuit(L, L // 2, 0, D)
+    if backend == 'native':
+        return tableau.random_state(N, rng)
+    state = zero_state(N, backend)
+    circ = create_circuit(L, L // 2, 0, D, backend, rng)
     circ.forward(state)
     return state
 
+def burn_in(L, p, D = 1, depth = None, backend = 'native', rng = None, record = None):
+    """Evolves the zero state by a random circuit towards the steady state.
+
+    Args:
+        L (int): The number of qudits in the state.
+        p (float): The probability of measuring each qudit.
+        D (int, optional): The number of qubits per qudit. Defaults to 1.
+        depth (int, optional): The depth of the circuit. Defaults to None (L // 2).
+        backend (str, optional): The simulation backend, 'native' or 'pyclifford'. Defaults to 'native'.
+        rng (numpy.random.Generator, optional): The random number generator. Defaults to None (fresh entropy).
+        record (list, optional): A list to append the circuit to, see sample. Defaults to None.
+
+    Returns:
+        tableau.StabilizerTableau or pc.stabilizer.StabilizerState: The state, whose next layer is even.
+    """
+    if depth is None:
+        depth = L // 2
+    state = zero_state(L * D, backend)
+    with phase('construction'):
+        circ = create_circuit(L, depth, p, D, backend, rng)
+    if record is not None:
+        record.append(circ)
+    with phase('initial'):
+        circ.forward(state)
+    return state
+
+def evolve(state, p, D = 1, layers = 1, even = True, backend = 'native', rng = None, record = None):
+    """Applies alternating layers of random Clifford gates, each followed by random measurements, to a state in place.
+
+    Args:
+        state (tableau.StabilizerTableau or pc.stabilizer.StabilizerState): The state.
+        p (float): The probability of measuring each qudit.
+        D (int, optional): The number of qubits per qudit. Defaults to 1.
+        layers (int, optional): The number of layers. Defaults to 1.
+        even (bool, optional): Whether the first layer starts with even or odd qudits. Defaults to True.
+        backend (str, optional): The simulation backend, 'native' or 'pyclifford'. Defaults to 'native'.
+        rng (numpy.random.Generator, optional): The random number generator. Defaults to None (fresh entropy).
+        record (list, optional): A list to append the circuit of a native state to, see sample. Defaults to None.
+
+    Returns:
+        None
+    """
+    rng = generator(rng)
+    if backend == 'native':
+        circ = tableau.CompactCircuit.generate(state.N // D, layers, p, D, rng, even)
+        if record is not None:
+            record.append(circ)
+        circ.forward(state)
+        return
+    for _ in range(layers):
+        circ = empty_circuit(state.N, backend, rng)
+        random_clifford(circ, even = even, D = D)
+        if p > 0:
+            random_measurement(circ, p, D, rng)
+        circ.forward(state)
+        even = not even
+
 def entropy(state, D = 1, A = None, log2 = False):
     """Calculates the bipartite entanglement entropy of the state.
 
     Args:
-        state (pc.stabilizer.StabilizerState): The state to calculate the entropy of.
+        state (tableau.StabilizerTableau or pc.stabilizer.StabilizerState): The state to calculate the entropy of.
         D (int, optional): The number of qubits per qudit. Defaults to 1.
         A (list, optional): The list of qudit positions to calculate the entropy of. Defaults to None (first half of the qudits)
         log2 (bool, optional): Whether to return the entropy in base e or base 2. Defaults to False.
@@ -138,16 +273,90 @@ def entropy(state, D = 1, A = None, log2 = False):
     else:
         return entropy_log2 * np.log(2)
 
+def entropies(state, D = 1, regions = None, log2 = False):
+    """Calculates the entanglement entropies of several subsystems at once.
+
+    For the native backend the Gaussian elimination is shared between regions with common qudits, see tableau.subsystem_ranks,
+    and all trajectories of a tableau.StabilizerBatch are evaluated in one parallel call.
+
+    Args:
+        state (tableau.StabilizerTableau, tableau.StabilizerBatch or pc.stabilizer.StabilizerState): The state to calculate the entropies of.
+        D (int, optional): The number of qubits per qudit. Defaults to 1.
+        regions (list, optional): The subsystems, each a list of qudit positions. Defaults to None (first half of the qudits).
+        log2 (bool, optional): Whether to return the entropies in base e or base 2. Defaults to False.
+
+    Returns:
+        numpy.ndarray: The entanglement entropy of each region, of shape (B, R) for a batch.
+    """
+    N = state.N
+    L = N // D
+    if regions is None:
+        regions = [[i for i in range(L // 2)]]
+    if isinstance(state, (tableau.StabilizerTableau, tableau.StabilizerBatch)):
+        qubit_regions = [[j for i in A for j in qubit_pos(i, D)] for A in regions]
+        sizes = np.array([len(set(A)) for A in qubit_regions])
+        if isinstance(state, tableau.StabilizerBatch):
+            entropies_log2 = tableau.subsystem_ranks_batch(state.bits, qubit_regions) - sizes
+        else:
+            entropies_log2 = tableau.subsystem_ranks(state.bits, qubit_regions) - sizes
+    else:
+        entropies_log2 = np.array([entropy(state, D, A, log2 = True) for A in regions])
+    if log2:
+        return entropies_log2
+    else:
+        return entropies_log2 * np.log(2)
+
+def entropy_profile(state, D = 1, periodic = False, log2 = False):
+    """Calculates the entanglement entropy of every contiguous subsystem starting at the first qudit.
+
+    For the native backend the whole profile comes from a single clipped-gauge pass over the tableau, and all trajectories
+    of a tableau.StabilizerBatch are evaluated in one parallel call.
+
+    Args:
+        state (tableau.StabilizerTableau, tableau.StabilizerBatch or pc.stabilizer.StabilizerState): The state to calculate the entropies of.
+        D (int, optional): The number of qubits per qudit. Defaults to 1.
+        periodic (bool, optional): Whether to calculate the profile starting at every qudit, under periodic boundary conditions. Defaults to False.
+        log2 (bool, optional): Whether to return the entropies in base e or base 2. Defaults to False.
+
+    Returns:
+        numpy.ndarray: Array of length L + 1 whose entry x is the entropy of qudits 0, ..., x - 1.
+            If periodic, array of shape (L, L + 1) whose entry (i, x) is the entropy of qudits i, ..., i + x - 1 (mod L).
+            For a batch, with the trajectories along an extra first axis.
+    """
+    N = state.N
+    L = N // D
+    sizes = D * np.arange(L + 1)
+    if isinstance(state, tableau.StabilizerBatch):
+        if periodic:
+            profile = tableau.interval_ranks_batch(state.bits, D) - sizes
+        else:
+            profile = tableau.prefix_ranks_batch(state.bits, np.arange(N))[:, ::D] - sizes
+    elif isinstance(state, tableau.StabilizerTableau):
+        if periodic:
+            profile = tableau.interval_ranks(state.bits, D) - sizes
+        else:
+            profile = tableau.prefix_ranks(state.bits, np.arange(N))[::D] - sizes
+    else:
+        starts = range(L) if periodic else [0]
+        profile = np.array([[entropy(state, D, [(i + j) % L for j in range(x)], log2 = True) if x > 0 else 0
+                             for x in range(L + 1)] for i in starts])
+        if not periodic:
+            profile = profile[0]
+    if log2:
+        return profile
+    else:
+        return profile * np.log(2)
+
 def bip_info(state, D = 1, recip_size = 8):
     """Calculates the bipartite mutual information of two opposite subsystems.
 
     Args:
-        state (pc.stabilizer.StabilizerState): The state to calculate the mutual information of.
+        state (tableau.StabilizerTableau, tableau.StabilizerBatch or pc.stabilizer.StabilizerState): The state to calculate the mutual information of.
         D (int, optional): The number of qubits per qudit. Defaults to 1.
         recip_size (int, optional): The reciprocal size of the subsystems, in terms of L. Defaults to 8.
     
     Returns:
-        float: The bipartite mutual information.
+        float or numpy.ndarray: The bipartite mutual information, of each trajectory of a batch.
     """
     N = state.N
     L = N // D
@@ -155,18 +364,78 @@ def bip_info(state, D = 1, recip_size = 8):
     subsys_size = L // recip_size
     subsys_1 = [i for i in range(subsys_size)]
     subsys_2 = [L // 2 + i for i in range(subsys_size)]
-    return entropy(state, D, subsys_1) + entropy(state, D, subsys_2) - entropy(state, D, subsys_1 + subsys_2)
+    S = entropies(state, D, [subsys_1, subsys_2, subsys_1 + subsys_2])
+    return S[..., 0] + S[..., 1] - S[..., 2]
+
+def pair_info(state, D = 1, size = 1, log2 = False):
+    """Calculates the mutual information between every pair of blocks of consecutive qudits.
+
+    For the native backend the rows of every block are reduced once and shared between all pairs, see tableau.pair_ranks,
+    so that all pairs cost the order of one Gaussian elimination of the tableau rather than one each.
+
+    Args:
+        state (tableau.StabilizerTableau or pc.stabilizer.StabilizerState): The state to calculate the mutual information of.
+        D (int, optional): The number of qubits per qudit. Defaults to 1.
+        size (int, optional): The number of qudits per block, dividing L. Defaults to 1.
+        log2 (bool, optional): Whether to return the mutual information in base e or base 2. Defaults to False.
+
+    Returns:
+        numpy.ndarray: Array of shape (M, M), M = L // size, whose entry (a, b) is the mutual information of blocks a
+            and b, and (a, a) is twice the entropy of block a.
+    """
+    N = state.N
+    L = N // D
+    M = L // size
+    n = size * D
+    if isinstance(state, tableau.StabilizerTableau):
+        ranks = tableau.pair_ranks(state.bits, n)
+        S = np.diag(ranks) - n
+        S_pairs = ranks - 2 * n
+    else:
+        blocks = [[a * size + i for i in range(size)] for a in range(M)]
+        S = entropies(state, D, blocks, log2 = True)
+        S_pairs = np.array([[entropy(state, D, blocks[a] + blocks[b], log2 = True) if a != b else 0 for b in range(M)]
+                            for a in range(M)])
+    info = S[:, None] + S[None, :] - S_pairs
+    info[np.arange(M), np.arange(M)] = 2 * S
+    if log2:
+        return info
+    else:
+        return info * np.log(2)
+
+def binned_pair_info(state, D = 1, size = 1, bins = 16):
+    """Calculates the mutual information of pairs of blocks averaged over all pairs in each bin of xi, see xi_bins.
+
+    Sampling this with sample accumulates the statistics of the mutual information against xi.
+
+    Args:
+        state (tableau.StabilizerTableau or pc.stabilizer.StabilizerState): The state to calculate the mutual information of.
+        D (int, optional): The number of qubits per qudit. Defaults to 1.
+        size (int, optional): The number of qudits per block. Defaults to 1.
+        bins (int, optional): The number of bins. Defaults to 16.
+
+    Returns:
+        numpy.ndarray: The mean mutual information in each non-empty bin.
+    """
+    L = state.N // D
+    _, index = xi_bins(L, size, bins)
+    info = pair_info(state, D, size)
+    M = info.shape[0]
+    # Mean over the pairs (a, a + r) at each distance r, then over the distances in each bin
+    a = np.arange(M)[:, None]
+    by_distance = info[a, (a + np.arange(1, M)[None, :]) % M].mean(axis = 0)
+    return np.bincount(index, weights = by_distance) / np.bincount(index)
 
 def trip_info(state, D = 1, recip_size = 4):
     """Calculates the negative tripartite mutual information of three adjacent subsystems.
     
     Args:
-        state (pc.stabilizer.StabilizerState): The state to calculate the mutual information of.
+        state (tableau.StabilizerTableau, tableau.StabilizerBatch or pc.stabilizer.StabilizerState): The state to calculate the mutual information of.
         D (int, optional): The number of qubits per qudit. Defaults to 1.
         recip_size (int, optional): The reciprocal size of the subsystems, in terms of L. Defaults to 4.
     
     Returns:
-        float: The negative tripartite mutual information.
+        float or numpy.ndarray: The negative tripartite mutual information, of each trajectory of a batch.
     """
     N = state.N
     L = N // D
@@ -177,67 +446,320 @@ def trip_info(state, D = 1, recip_size = 4):
     subsys_2 = [i + subsys_size for i in range(subsys_size)]
     subsys_3 = [i + 2 * subsys_size for i in range(subsys_size)]
 
-    info_1 = entropy(state, D, subsys_1) + entropy(state, D, subsys_2) + entropy(state, D, subsys_3)
-    info_2 = entropy(state, D, subsys_1 + subsys_2) + entropy(state, D, subsys_2 + subsys_3) + entropy(state, D, subsys_3 + subsys_1)
-    info_3 = entropy(state, D, subsys_1 + subsys_2 + subsys_3)
+    S = entropies(state, D, [subsys_1, subsys_2, subsys_3,
+                             subsys_1 + subsys_2, subsys_2 + subsys_3, subsys_3 + subsys_1,
+                             subsys_1 + subsys_2 + subsys_3])
+    info_1 = S[..., 0] + S[..., 1] + S[..., 2]
+    info_2 = S[..., 3] + S[..., 4] + S[..., 5]
+    info_3 = S[..., 6]
     return -info_1 + info_2 - info_3
 
-def sample(f, L, p, D = 1, timesteps = 128, depth = None):
+def sample(f, L, p, D = 1, timesteps = 128, depth = None, backend = 'native', state = None, seed = None, return_state = False, stats = None,
+           decorrelation = 0, record = None):
     """
     Samples a function f from a stabilizer state.
 
     Args:
-        f (function): The function to sample. Takes a pc.stabilizer.StabilizerState as input and returns a numpy.ndarray.
+        f (function): The function to sample. Takes a stabilizer state of the chosen backend as input and returns a numpy.ndarray.
         L (int): The number of qudits in the state.
         p (float): The probability of measuring each qudit.
         D (int, optional): The number of qubits per qudit. Defaults to 1.
         timesteps (int, optional): The number of timesteps to sample for. Defaults to 128.
         depth (int, optional): The initial depth of the circuit. Defaults to None (L // 2).
+        backend (str, optional): The simulation backend, 'native' or 'pyclifford'. Defaults to 'native'.
+        state (optional): A steady state to continue from in place of the zero state, skipping the initial circuit. Defaults to None.
+            Its next layer is taken to be even, as it is after an even number of timesteps.
+        seed (optional): The random number generator or its seed, see streams.generator. Defaults to None (fresh entropy).
+        return_state (bool, optional): Whether to also return the final state. Defaults to False.
+        stats (stats.RunningStats, optional): Streaming statistics to push every sample of f into. Defaults to None.
+        decorrelation (int, optional): The number of timesteps to evolve before sampling, e.g. to decorrelate a trajectory
+            forked from a state shared with others from its siblings. Defaults to 0.
+        record (list, optional): A list to append the tableau.CompactCircuit of the initial circuit, the decorrelation and
+            the sampled timesteps to, in order, with the native backend. Applying them to the zero state (or the given
+            state) replays the trajectory exactly, and they can be saved to audit it. Defaults to None.
     Returns:
         numpy.ndarray: An array with two columns containing the mean of f and f^2 over the samples.
+            If return_state, a tuple of this array and the final state.
     """
+    rng = generator(seed)
+    if backend == 'pyclifford':
+        np.random.seed(rng.integers(2**32)) # PyClifford draws its gates from the global NumPy state
     N = L * D
-    state = pc.zero_state(N)
+    if state is None:
+        state = burn_in(L, p, D, depth, backend, rng, record)
+    parity = decorrelation % 2 == 0
+    if decorrelation > 0:
+        with phase('decorrelation'):
+            evolve(state, p, D, decorrelation, True, backend, rng, record)
+    if backend == 'native':
+        # Draw the circuit of all timesteps at once, to apply it layer by layer
+        with phase('construction'):
+            circ = tableau.CompactCircuit.generate(L, timesteps, p, D, rng, parity)
+        if record is not None:
+            record.append(circ)
     accumulator = np.zeros_like(f(state))
     accumulator_sq = np.zeros_like(accumulator)
 
-    if depth is None:
-        depth = L // 2
-    circ = create_circuit(L, depth, p, D)
-    circ.forward(state)
+    for t in range(timesteps):
+        with phase('observable'):
+            result = f(state)
+        accumulator += result
+        accumulator_sq += result ** 2
+        if stats is not None:
+            stats.push(result)
+        with phase('gates'):
+            if backend == 'native':
+                circ.apply_gates(state, t)
+            else:
+                layer = empty_circuit(N, backend, rng)
+                random_clifford(layer, even = parity, D = D)
+                layer.forward(state)
+        if p > 0:
+            with phase('measurement'):
+                if backend == 'native':
+                    circ.apply_measurements(state, t)
+                else:
+                    layer = empty_circuit(N, backend, rng)
+                    random_measurement(layer, p, D, rng)
+                    layer.forward(state)
+        parity = not parity
+    
+    accumulator /= timesteps
+    accumulator_sq /= timesteps
+
+    if return_state:
+        return np.stack((accumulator, accumulator_sq)), state
+    return np.stack((accumulator, accumulator_sq))
+
+def sample_batch(f, L, p, D = 1, timesteps = 128, depth = None, batch = 16, states = None, seed = None, return_states = False, stats = None,
+                 decorrelation = 0):
+    """
+    Samples a function f from a batch of independent trajectories evolved together with the native backend.
+
+    The observable is evaluated for all trajectories in one call of f, e.g. trip_info or entropy_profile of the whole
+    tableau.StabilizerBatch, which evaluate the trajectories in parallel.
+
+    Args:
+        f (function): The function to sample. Takes a tableau.StabilizerBatch as input and returns a numpy.ndarray with
+            the trajectories along the first axis.
+        L (int): The number of qudits in the state.
+        p (float): The probability of measuring each qudit.
+        D (int, optional): The number of qubits per qudit. Defaults to 1.
+        timesteps (int, optional): The number of timesteps to sample for. Defaults to 128.
+        depth (int, optional): The initial depth of the circuit. Defaults to None (L // 2).
+        batch (int, optional): The number of trajectories. Defaults to 16.
+        states (tableau.StabilizerBatch, optional): Steady states to continue from, skipping the initial circuit, see sample. Defaults to None.
+        seed (optional): The random number generator or its seed, see streams.generator. Defaults to None (fresh entropy).
+        return_states (bool, optional): Whether to also return the final states. Defaults to False.
+        stats (stats.RunningStats, optional): Streaming statistics to push every sample of f into, one series per trajectory
+            along the first axis, see RunningStats.stack. Defaults to None.
+        decorrelation (int, optional): The number of timesteps to evolve before sampling, see sample. Defaults to 0.
+    Returns:
+        numpy.ndarray: An array of shape (batch, 2, ...) containing the mean of f and f^2 over the samples of each trajectory.
+            If return_states, a tuple of this array and the final tableau.StabilizerBatch.
+    """
+    rng = generator(seed)
+    N = L * D
+    if states is None:
+        states = tableau.zero_batch(batch, N)
+        if depth is None:
+            depth = L // 2
+        with phase('initial'):
+            for _ in range(depth):
+                tableau.brickwork_batch(states.bits, True, D, rng)
+                if p > 0:
+                    tableau.measurement_batch(states.bits, p, D, rng)
+                tableau.brickwork_batch(states.bits, False, D, rng)
+                if p > 0:
+                    tableau.measurement_batch(states.bits, p, D, rng)
     parity = True
+    with phase('decorrelation'):
+        for _ in range(decorrelation):
+            tableau.brickwork_batch(states.bits, parity, D, rng)
+            if p > 0:
+                tableau.measurement_batch(states.bits, p, D, rng)
+            parity = not parity
+    accumulator = np.zeros(np.shape(f(states)))
+    accumulator_sq = np.zeros_like(accumulator)
 
     for _ in range(timesteps):
-        result = f(state)
+        with phase('observable'):
+            result = f(states)
         accumulator += result
         accumulator_sq += result ** 2
-        circ = pc.circuit.Circuit(N)
-        if parity:
-            random_clifford(circ, even = True, D = D)
-        else:
-            random_clifford(circ, even = False, D = D)
+        if stats is not None:
+            stats.push(result)
+        with phase('gates'):
+            tableau.brickwork_batch(states.bits, parity, D, rng)
         if p > 0:
-            random_measurement(circ, p, D)
-        circ.forward(state)
+            with phase('measurement'):
+                tableau.measurement_batch(states.bits, p, D, rng)
         parity = not parity
-    
+
     accumulator /= timesteps
     accumulator_sq /= timesteps
 
+    if return_states:
+        return np.stack((accumulator, accumulator_sq), axis = 1), states
+    return np.stack((accumulator, accumulator_sq), axis = 1)
+
+def sample_sweep(f, L, ps, D = 1, timesteps = 128, depth = None, state = None, seed = None, return_state = False, stats = None,
+                 decorrelation = 0):
+    """
+    Samples a function f from coupled trajectories, one per measurement probability, with the native backend.
+
+    The trajectories share their random numbers (common random numbers): every layer of gates is drawn once and applied
+    to all of them, and qudit i is measured in the trajectory at p if the uniform drawn for it this layer is below p,
+    with outcomes shared too. Differences between neighbouring p then fluctuate far less than between independent
+    trajectories, and drawing and compiling the gates is paid once for the whole sweep.
+
+    Args:
+        f (function): The function to sample. Takes the tableau.StabilizerBatch of the trajectories, in the order of ps,
+            and returns a numpy.ndarray, e.g. the observable of each trajectory and their differences.
+        L (int): The number of qudits in the state.
+        ps (numpy.ndarray): The probabilities of measuring each qudit.
+        D (int, optional): The number of qubits per qudit. Defaults to 1.
+        timesteps (int, optional): The number of timesteps to sample for. Defaults to 128.
+        depth (int, optional): The initial depth of the circuit. Defaults to None (L // 2).
+        state (tableau.StabilizerBatch, optional): Coupled steady states to continue from, skipping the initial circuit, see sample. Defaults to None.
+        seed (optional): The random number generator or its seed, see streams.generator. Defaults to None (fresh entropy).
+        return_state (bool, optional): Whether to also return the final states. Defaults to False.
+        stats (stats.RunningStats, optional): Streaming statistics to push every sample of f into. Defaults to None.
+        decorrelation (int, optional): The number of timesteps to evolve before sampling, see sample. Defaults to 0.
+    Returns:
+        numpy.ndarray: An array with two columns containing the mean of f and f^2 over the samples.
+            If return_state, a tuple of this array and the final tableau.StabilizerBatch.
+    """
+    rng = generator(seed)
+    ps = np.asarray(ps, dtype = float)
+    if state is None:
+        state = tableau.zero_batch(len(ps), L * D)
+        if depth is None:
+            depth = L // 2
+        with phase('initial'):
+            for _ in range(depth):
+                for even in (True, False):
+                    tableau.brickwork_shared(state.bits, even, D, rng)
+                    tableau.measurement_sweep(state.bits, ps, D, rng)
+    parity = True
+    with phase('decorrelation'):
+        for _ in range(decorrelation):
+            tableau.brickwork_shared(state.bits, parity, D, rng)
+            tableau.measurement_sweep(state.bits, ps, D, rng)
+            parity = not parity
+    accumulator = np.zeros_like(f(state), dtype = float)
+    accumulator_sq = np.zeros_like(accumulator)
+
+    for _ in range(timesteps):
+        with phase('observable'):
+            result = f(state)
+        accumulator += result
+        accumulator_sq += result ** 2
+        if stats is not None:
+            stats.push(result)
+        with phase('gates'):
+            tableau.brickwork_shared(state.bits, parity, D, rng)
+        with phase('measurement'):
+            tableau.measurement_sweep(state.bits, ps, D, rng)
+        parity = not parity
+
+    accumulator /= timesteps
+    accumulator_sq /= timesteps
+
+    if return_state:
+        return np.stack((accumulator, accumulator_sq)), state
     return np.stack((accumulator, accumulator_sq))
 
-@njit
-def xi(L, z1, z2):
+def evolve_entropies(L, T, p, me, shots, D = 1, logging = False, seed = None, log2 = False):
+    """Records the half-chain entanglement entropy of independent trajectories after every layer, with the native backend.
+
+    All shots are evolved in place as one tableau.StabilizerBatch. Instead of a rank computation per layer, an echelon
+    basis of the rows of the half chain is carried along: gates inside either half leave it unchanged, measurements
+    outside it update it in place (tableau.measure_cut), and it is only rebuilt after layers with a gate straddling the
+    cut or a measurement inside the half chain.
+
+    Args:
+        L (int): The number of qudits.
+        T (int): The number of time steps, each an even and an odd layer.
+        p (float): The probability of measuring each qudit after each layer.
+        me (bool): Whether to start from a random maximally entangled state, see me_state, else from the zero state.
+        shots (int): The number of independent trajectories.
+        D (int, optional): The number of qubits per qudit. Defaults to 1.
+        logging (bool, optional): Whether to print the mean entropy after every time step. Defaults to False.
+        seed (optional): The random number generator or its seed, see streams.generator. Defaults to None (fresh entropy).
+        log2 (bool, optional): Whether to return the entropies in base e or base 2. Defaults to False.
+
+    Returns:
+        numpy.ndarray: Array of shape (shots, 2T + 1) of the entropies of qudits 0, ..., L // 2 - 1, initially and after
+            every layer, so that column 2t is the entropy after t time steps.
+    """
+    rng = generator(seed)
+    N = L * D
+    if me:
+        bits = np.stack([tableau.random_stabilizers(N, rng) for _ in range(shots)])
+    else:
+        bits = tableau.zero_batch(shots, N).bits
+    A = np.arange(L // 2 * D)
+    inside = np.arange(L) < L // 2
+    straddles = {}
+    for even in (True, False):
+        pairs = tableau.brickwork_pairs(L, even, D)
+        straddles[even] = np.any(inside[pairs[:, 0] // D] != inside[pairs[:, -1] // D])
+    basis, owner, r = tableau.cut_basis_batch(bits, A)
+    entropies = np.empty((shots, 2 * T + 1))
+    entropies[:, 0] = r - len(A)
+    for t in range(T):
+        for layer, even in enumerate((True, False)):
+            tableau.brickwork_batch(bits, even, D, rng)
+            if straddles[even]:
+                basis, owner, r = tableau.cut_basis_batch(bits, A)
+            if p > 0:
+                # The draws of tableau.measurement_batch
+                measured = rng.random((shots, L)) < p
+                outcomes = rng.integers(2, size = (shots, N))
+                tableau.measure_cut_batch(bits, measured, outcomes, D, basis, owner, r, A, inside)
+            entropies[:, 2 * t + layer + 1] = r - len(A)
+        if logging:
+            print("t = {}: S = {:.2f}".format(t + 1, entropies[:, 2 * t + 2].mean()))
+    if log2:
+        return entropies
+    else:
+        return entropies * np.log(2)
+
+def xi(L, z1, z2, size = 1):
     """Calculates xi, as defined by Li et al. in https://arxiv.org/abs/2003.12721.
 
+    Works elementwise on arrays of positions, e.g. xi(L, z[:, None], z[None, :]) over a grid of pairs.
+
     Args:
         L (int): The number of qudits in the state.
-        z1 (int): The first qudit position.
-        z2 (int): The second qudit position.
+        z1 (int or numpy.ndarray): The first qudit position.
+        z2 (int or numpy.ndarray): The second qudit position.
+        size (int, optional): The number of qudits in the blocks starting at z1 and z2. Defaults to 1.
 
     Returns:
-        float: xi.
+        float or numpy.ndarray: xi.
     """
-    if z1 == z2:
+    if np.any(np.asarray(z1) == np.asarray(z2)):
         raise ValueError("z1 and z2 must be different")
-    return (np.pi / L / np.sin(np.pi * (z1 - z2) / L)) ** 2
+    return (np.pi * size / L / np.sin(np.pi * (np.asarray(z1) - np.asarray(z2)) / L)) ** 2
+
+def xi_bins(L, size = 1, bins = 16):
+    """Bins the distances between blocks of a periodic chain logarithmically in xi, see binned_pair_info.
+
+    Args:
+        L (int): The number of qudits.
+        size (int, optional): The number of qudits per block. Defaults to 1.
+        bins (int, optional): The number of bins, of which empty ones are dropped. Defaults to 16.
+
+    Returns:
+        tuple: The mean xi of each bin, and the bin of each distance 1, ..., M - 1 between M = L // size blocks.
+    """
+    M = L // size
+    distances = np.arange(1, M)
+    x = xi(L, size * distances, 0, size)
+    edges = np.geomspace(x.min(), x.max(), bins + 1)
+    index = np.clip(np.searchsorted(edges, x, side = 'right') - 1, 0, bins - 1)
+    used, index = np.unique(index, return_inverse = True)
+    centres = np.bincount(index, weights = x) / np.bincount(index)
+    return centres, index
@@ -2,10 +2,17 @@ import sys
 sys.path.insert(0, 'clifford')
 
 import numpy as np
-from MIPT import entropy, sample
+from archive import StateArchive
+from MIPT import entropy_profile, sample_batch
+import checkpoint
+from results import ResultsStore
+from stats import RunningStats
+from streams import PARENTS, root_entropy, spawn, stream
+from tasks import entropies_task
+import tableau
 import time
 import os
-from multiprocess import Pool
+from workers import TrajectoryPool, fork
 num_cpus = len(os.sched_getaffinity(0))
 print("Using {} CPUs.".format(num_cpus))
 
@@ -13,85 +20,127 @@ print("Using {} CPUs.".format(num_cpus))
 import argparse
 parser = argparse.ArgumentParser(
     description = 'Run the Clifford circuit simulation.',
-    epilog = 'Saves entropies to the current directory.'
+    epilog = 'Saves entropies to the results store in the data directory.'
 )
 parser.add_argument('-t', type = int, default = 1)
+parser.add_argument('-b', '--batched', action = 'store_true', help = 'evolve all shots as one batch in this process')
+parser.add_argument('-r', '--resume', action = 'store_true', help = 'continue statistics and trajectories from the checkpoint')
+parser.add_argument('--seed', type = int, default = None)
+parser.add_argument('--burn-in', action = 'store_true', help = 'restart every trajectory from the zero state each run')
+parser.add_argument('-e', '--target-error', type = float, default = 0, help = 'stop once every standard error is below this')
+parser.add_argument('-s', '--shots', type = int, default = 16, help = 'number of trajectories')
+parser.add_argument('-T', '--timesteps', type = int, default = 256, help = 'timesteps per trajectory per run')
+parser.add_argument('-m', '--max-runs', type = int, default = 64)
+parser.add_argument('--time-limit', type = float, default = 18, help = 'hours of wall time, no run is started that would overrun it')
+parser.add_argument('--parents', type = int, default = 0, help = 'burn in this many states and fork the trajectories from them, 0 to burn in every trajectory')
+parser.add_argument('--decorrelation', type = int, default = None, help = 'timesteps a forked trajectory evolves before it is sampled, defaults to depth // 4')
+parser.add_argument('--archive', action = 'store_true', help = 'append the state of every trajectory after each run to the state archive data/states')
 args = parser.parse_args()
-t = args.t
-
-# Parameter space [30]
-# D: {1-5} [5]
-# L: 2**{4-9} [6]
-# p: pc
-# depth: L // 2
-# timesteps: 256
-
-t -= 1
-# t is 0 to 29
-
-D = 1 + t // 6
-t = t % 6
-
-# t is 0 to 5
-L = 2**(4 + t)
+if args.burn_in and args.parents > 0:
+    parser.error('--burn-in restarts every trajectory from the zero state, which discards the states forked by --parents')
+L, D, p = entropies_task(args.t)
 
 depth = L // 2
-shots = 16
-timesteps = 256
-TIMELIMIT = 60 * 60 * 18 # 18 hours
-MAXRUNS = 64
+shots = args.shots
+timesteps = args.timesteps
+TIMELIMIT = 60 * 60 * args.time_limit
+MAXRUNS = args.max_runs
 
 N = L * D
 
-p_dict = {
-    1: 0.15967,
-    2: 0.32865,
-    3: 0.416,
-    4: 0.458,
-    5: 0.4792
-}
-p = p_dict[D]
-
 start_time = time.time()
 
 print("Sampling all entropies for L = {}, D = {}, p = {}:".format(L, D, p))
 
 def f(state):
-    result = []
-    qudits = [0]
-    for i in range(1, L // 2 + 1):
-        qudits.append(i)
-        result.append(entropy(state, D, qudits))
-    return np.array(result)
+    # Entropies of qudits 0, ..., i for i = 1, ..., L // 2, of each trajectory of a batch
+    return entropy_profile(state, D)[..., 2 : L // 2 + 2]
 
 run = 0
 accumulator = np.zeros((2, L // 2))
+entropy = root_entropy(args.seed) # Trajectory i of run r samples the stream (r, i) below it
+states = [None] * shots
+stats = RunningStats() # Of trajectories that have ended, restarted from the zero state by --burn-in
+trajectory_stats = [RunningStats() for _ in range(shots)] # Of the current trajectories, continued across runs
+
+checkpoint_file = "data/{}_{}_{}_{}_entropies_all_checkpoint.npz".format(L, depth, p, D)
+if args.resume and os.path.exists(checkpoint_file):
+    saved = checkpoint.load(checkpoint_file)
+    run = int(saved['run'])
+    accumulator = saved['accumulator']
+    entropy = int(str(saved['entropy']))
+    states = saved['states']
+    stats = saved['stats']
+    trajectory_stats = saved['trajectory_stats']
+    print("Resuming after {} runs.".format(run))
 
 start_time = time.time()
+run_start = start_time
 
 it_time = 0
 
 time_f = True # hacky do-while loop
-
-while time_f and run < MAXRUNS:
-    with Pool(num_cpus) as pool:
-        results = pool.starmap(lambda: sample(f, L, p, D, timesteps, depth), [[]] * shots)
-    results = np.mean(np.array(results), axis = 0)
+converged = False
+
+decorrelation = 0
+if args.parents > 0 and states[0] is None:
+    decorrelation = args.decorrelation if args.decorrelation is not None else depth // 4
+    states = fork(L, p, D, depth, spawn(entropy, (PARENTS,), args.parents), shots, num_cpus)
+    print("Forked {} trajectories from {} parents.".format(shots, args.parents))
+
+initial_states = states
+initial_stats = trajectory_stats
+pool = None if args.batched else TrajectoryPool(f, L, p, D, timesteps, depth, num_cpus)
+
+while time_f and run < MAXRUNS and not converged:
+    seeds = spawn(entropy, (run,), shots)
+    if args.burn_in:
+        stats.merge(RunningStats.merged(trajectory_stats))
+        trajectory_stats = [RunningStats() for _ in range(shots)]
+    if args.batched:
+        # Like the workers, start from the zero state each run with --burn-in, and else from the last (or forked) states
+        batch = None if args.burn_in or states[0] is None else tableau.StabilizerBatch(np.stack([state.bits for state in states]))
+        run_stats = RunningStats.stack(trajectory_stats)
+        results, batch = sample_batch(f, L, p, D, timesteps, depth, shots, batch, stream(entropy, run), return_states = True, stats = run_stats,
+                                      decorrelation = decorrelation)
+        results = np.mean(results, axis = 0)
+        states = [batch[i] for i in range(shots)]
+        trajectory_stats = [run_stats[i] for i in range(shots)]
+    else:
+        results = 0
+        busy = 0
+        for i, result, state, elapsed, series in pool.run(seeds, initial_states, args.burn_in, decorrelation, initial_stats):
+            results = results + result / shots
+            states[i] = state
+            busy += elapsed
+            trajectory_stats[i] = series
+        initial_states = None
+        initial_stats = None
+        print("Run {}: {:.1f} timesteps/s per worker".format(run + 1, shots * timesteps / busy))
+    decorrelation = 0
     accumulator += results
     run += 1
-
-    mean = accumulator[0, :] / run
-    std = np.sqrt(accumulator[1, :] / run - mean**2) / np.sqrt(run * shots * timesteps)
-    result = np.stack((mean, std))
-    stub = "data/{}_{}_{}_{}_{}_".format(L, depth, shots * timesteps, p, D)
-    with open(stub + "entropies_all.npy", 'wb') as filename:
-        np.save(filename, result)
+    if args.archive:
+        StateArchive().extend(states, L, D, p, depth, timesteps if args.burn_in else run * timesteps, entropy, run - 1)
+    checkpoint.save(checkpoint_file, states = states, stats = stats, trajectory_stats = trajectory_stats, run = run, accumulator = accumulator,
+                    entropy = str(entropy))
+    converged = np.max(RunningStats.merged([stats] + trajectory_stats).error()) < args.target_error
     
-    if it_time == 0:
-        it_time = time.time() - start_time
+    # The first run also pays for the initial circuits, so later runs are estimated from the latest one
+    it_time = time.time() - run_start
+    run_start = time.time()
     
     remain = start_time + TIMELIMIT - time.time()
     time_f = remain > 2 * it_time
 
+if pool is not None:
+    pool.close()
+
+mean = accumulator[0, :] / run
+# Binning analysis, as timesteps of a trajectory are correlated
+std = RunningStats.merged([stats] + trajectory_stats).error()
+result = np.stack((mean, std))
+ResultsStore().append('entropies_all', result, L, depth, shots * timesteps, p, D, runs = run, elapsed = time.time() - start_time)
+
 end_time = time.strftime('%H:%M:%S', time.gmtime(int(time.time() - start_time)))
 print("L = {}, D = {}, p = {} done in {}, completed {} runs.".format(L, D, p, end_time, run))
\ No newline at end of file
@@ -2,21 +2,23 @@ import sys
 sys.path.insert(0, 'clifford')
 
 import numpy as np
-import pyclifford as pc
-from MIPT import create_circuit, entropy
+from MIPT import create_circuit, entropy, zero_state
+from streams import root_entropy, spawn
 import time
+from results import ResultsStore
 
 # Parse command line arguments
 import argparse
 parser = argparse.ArgumentParser(
     description = 'Run the Clifford circuit simulation.',
-    epilog = 'Saves final entropies to the current directory.'
+    epilog = 'Saves final entropies to the results store in the data directory.'
 )
 parser.add_argument('-L', type = int, default = 512)
 parser.add_argument('-T', type = int, default = 256)
 parser.add_argument('-s', '--shots', type = int, default = 10)
 parser.add_argument('-p', type = float, default = 0.1)
 parser.add_argument('-D', type = int, default = 1)
+parser.add_argument('--seed', type = int, default = None)
 args = parser.parse_args()
 
 L = args.L
@@ -25,15 +27,14 @@ shots = args.shots
 p = args.p
 D = args.D
 N = L * D
-stub = "data/{}_{}_{}_{}_{}_".format(L, depth, shots, p, D)
 
 ctime = time.time()
 
 print("Sampling entropies for p = {}:".format(p))
 S_p = []
-for _ in range(shots):
-    circ = create_circuit(L, depth, p, D = D)
-    state = pc.zero_state(N)
+for seed in spawn(root_entropy(args.seed), (), shots):
+    circ = create_circuit(L, depth, p, D = D, rng = np.random.default_rng(seed))
+    state = zero_state(N)
     circ.forward(state)
     S_p.append(entropy(state, D))
 S_p = np.array(S_p)
@@ -41,5 +42,4 @@ S_p = np.array(S_p)
 wtime = time.strftime('%H:%M:%S', time.gmtime(int(time.time() - ctime)))
 print("p = {} done in {}".format(p, wtime))
 
-with open(stub + "hist.npy", 'wb') as f:
-    np.save(f, S_p)
\ No newline at end of file
+ResultsStore().append('hist', S_p, L, depth, shots, p, D, elapsed = time.time() - ctime)
\ No newline at end of file
@@ -4,18 +4,20 @@ sys.path.insert(0, 'clifford')
 import numpy as np
 from MIPT import evolve_entropies
 import time
+from results import ResultsStore
 
 # Parse command line arguments
 import argparse
 parser = argparse.ArgumentParser(
     description = 'Run the Clifford circuit simulation.',
-    epilog = 'Saves time-evolution of entropies to the current directory.'
+    epilog = 'Saves time-evolution of entropies to the results store in the data directory.'
 )
 parser.add_argument('-L', type = int, default = 512)
 parser.add_argument('-T', type = int, default = 256)
 parser.add_argument('-s', '--shots', type = int, default = 10)
 parser.add_argument('-p', type = float, default = 0.1)
 parser.add_argument('-D', type = int, default = 1)
+parser.add_argument('--seed', type = int, default = None)
 args = parser.parse_args()
 
 L = args.L
@@ -24,16 +26,19 @@ shots = args.shots
 p = args.p
 D = args.D
 N = L * D
-stub = "data/{}_{}_{}_{}_{}_".format(L, depth, shots, p, D)
 
 ctime = time.time()
 
 print("Evolving entropies for p = {}:".format(p))
 
-entropies_me = evolve_entropies(L, depth, p, False, shots, D = D, logging = False)
+entropies_me = evolve_entropies(L, depth, p, True, shots, D = D, logging = False, seed = args.seed)
 
 wtime = time.strftime('%H:%M:%S', time.gmtime(int(time.time() - ctime)))
 print("p = {} done in {}".format(p, wtime))
 
-with open(stub + "me.npy", 'wb') as f:
-    np.save(f, entropies_me)
\ No newline at end of file
+# Mean and standard error after every time step from t = 0, like the older results, and the entropy of every shot after every layer
+per_step = entropies_me[:, ::2]
+elapsed = time.time() - ctime
+store = ResultsStore()
+store.extend([('me', np.stack((per_step.mean(axis = 0), per_step.std(axis = 0) / np.sqrt(shots))), L, depth, shots, p, D, 0, elapsed, None, None, ''),
+              ('me_shots', entropies_me, L, depth, shots, p, D, 0, elapsed, None, None, '')])
\ No newline at end of file
@@ -0,0 +1,179 @@
+import os
+import time
+import numpy as np
+from multiprocess import Pool
+from numba import set_num_threads
+
+import tableau
+from results import append_log, lock, read_log
+
+# A state archive is a directory holding index.bin, one record per state back to back as a structured array, and
+# states.u64, the packed tableaux of the native backend (see tableau.py) back to back as uint64 words. Like a results
+# store, both are only ever appended to and are memory-mapped for reading, so observables can be evaluated on archived
+# states long after the run without copying them. A tableau of N qubits takes (2N + 1) ceil(N / 64) words, 64 KB for
+# N = 512.
+
+RECORD = np.dtype([
+    ('L', 'i8'),            # The number of qudits
+    ('D', 'i8'),            # The number of qubits per qudit
+    ('p', 'f8'),            # The measurement probability
+    ('depth', 'i8'),        # The depth of the initial circuit
+    ('timestep', 'i8'),     # The number of timesteps sampled on the trajectory before the state
+    ('entropy', 'U40'),     # The root entropy of the driver, see streams.py
+    ('run', 'i8'),          # The run whose stream (run, trajectory) the state was last evolved with
+    ('trajectory', 'i8'),   # The index of the trajectory
+    ('created', 'f8'),      # The time the state was written, in seconds since the epoch
+    ('offset', 'i8')        # The position of the first word in states.u64
+])
+
+def shape(record):
+    """Returns the shape (2N + 1, W) of the packed tableau of a record."""
+    N = int(record['L'] * record['D'])
+    return (2 * N + 1, (N + 63) // 64)
+
+def read(words, records):
+    """Returns the states of several records as views into the words of an archive.
+
+    Args:
+        words (numpy.ndarray): The memory-mapped words of states.u64.
+        records (numpy.ndarray): The records.
+
+    Returns:
+        list: The tableau.StabilizerTableau of each record, read-only.
+    """
+    states = []
+    for record in records:
+        rows, W = shape(record)
+        bits = words[record['offset'] : record['offset'] + rows * W].reshape(rows, W)
+        states.append(tableau.StabilizerTableau(bits.view(np.ndarray)))
+    return states
+
+class StateArchive:
+    """An append-only archive of stabilizer states, see the module comment. Appends are serialised between processes by a lock file.
+
+    Args:
+        path (str, optional): The archive directory, created if necessary. Defaults to 'data/states'.
+    """
+    def __init__(self, path = 'data/states'):
+        self.path = path
+        os.makedirs(path, exist_ok = True)
+        self.index_file = os.path.join(path, 'index.bin')
+        self.states_file = os.path.join(path, 'states.u64')
+
+    @property
+    def index(self):
+        """The records of all states."""
+        return read_log(self.index_file, RECORD)
+
+    def __len__(self):
+        return len(self.index)
+
+    def extend(self, states, L, D, p, depth, timestep, entropy = '', run = 0, trajectories = None):
+        """Appends the states of several trajectories of one simulation.
+
+        Args:
+            states (list): The tableau.StabilizerTableau of each trajectory, e.g. a tableau.StabilizerBatch.
+            L (int): The number of qudits.
+            D (int): The number of qubits per qudit.
+            p (float or list): The measurement probability, or one per state.
+            depth (int): The depth of the initial circuit.
+            timestep (int): The number of timesteps sampled on the trajectories before the states.
+            entropy (int or str, optional): The root entropy of the driver. Defaults to '' (unknown).
+            run (int, optional): The run the states were last evolved in. Defaults to 0.
+            trajectories (list, optional): The index of the trajectory of each state. Defaults to None (0, 1, ...).
+
+        Returns:
+            None
+        """
+        records = np.zeros(len(states), dtype = RECORD)
+        records['L'] = L
+        records['D'] = D
+        records['p'] = p
+        records['depth'] = depth
+        records['timestep'] = timestep
+        records['entropy'] = str(entropy)
+        records['run'] = run
+        records['trajectory'] = np.arange(len(states)) if trajectories is None else trajectories
+        records['created'] = time.time()
+        words = shape(records[0])[0] * shape(records[0])[1]
+        with lock(os.path.join(self.path, 'archive.lock')):
+            offset = os.path.getsize(self.states_file) // 8 if os.path.exists(self.states_file) else 0
+            records['offset'] = offset + words * np.arange(len(states))
+            with open(self.states_file, 'ab') as f:
+                for i in range(len(states)):
+                    bits = states[i].bits
+                    if bits.shape != shape(records[i]):
+                        raise ValueError("Expected tableaux of shape {}, got {}".format(shape(records[i]), bits.shape))
+                    f.write(np.ascontiguousarray(bits, dtype = np.uint64).tobytes())
+            append_log(self.index_file, records)
+
+    def query(self, L = None, D = None, p = None, depth = None, timestep = None, entropy = None):
+        """Selects records by their parameters. Each parameter may be a single value or a list of values.
+
+        Args:
+            L (int, optional): The number of qudits. Defaults to None (any).
+            D (int, optional): The number of qubits per qudit. Defaults to None (any).
+            p (float, optional): The measurement probability, matched to 1e-9. Defaults to None (any).
+            depth (int, optional): The depth of the initial circuit. Defaults to None (any).
+            timestep (int, optional): The timestep of the states. Defaults to None (any).
+            entropy (int or str, optional): The root entropy of the driver. Defaults to None (any).
+
+        Returns:
+            numpy.ndarray: The matching records, in the order they were written.
+        """
+        index = self.index
+        mask = np.ones(len(index), dtype = bool)
+        for field, value in (('L', L), ('D', D), ('depth', depth), ('timestep', timestep)):
+            if value is not None:
+                mask &= np.isin(index[field], np.atleast_1d(value))
+        if entropy is not None:
+            mask &= np.isin(index['entropy'], [str(value) for value in np.atleast_1d(entropy)])
+        if p is not None:
+            mask &= np.any(np.abs(index['p'][:, None] - np.atleast_1d(p)[None, :]) < 1e-9, axis = 1)
+        return np.array(index[mask])
+
+    def words(self):
+        """Returns the words of all states, memory-mapped read-only."""
+        return np.memmap(self.states_file, dtype = np.uint64, mode = 'r')
+
+    def load(self, record):
+        """Returns the state of a record as a writable tableau.StabilizerTableau, e.g. to evolve it further."""
+        return read(self.words(), [record])[0].copy()
+
+    def chunks(self, records, chunk = 64):
+        """Iterates over the states of several records in chunks, without copying them.
+
+        Args:
+            records (numpy.ndarray): The records, e.g. from query.
+            chunk (int, optional): The number of states per chunk. Defaults to 64.
+
+        Yields:
+            tuple: The records of the chunk, and their states as read-only views, see read.
+        """
+        words = self.words() if len(records) else None
+        for start in range(0, len(records), chunk):
+            yield records[start : start + chunk], read(words, records[start : start + chunk])
+
+    def evaluate(self, f, records, num_workers = 1, chunk = 64):
+        """Evaluates a function on the states of several records, in chunks spread over worker processes.
+
+        Every worker maps the archive itself, so only the records and the values of f are sent between processes.
+
+        Args:
+            f (function): The function of a state, e.g. lambda state: MIPT.bip_info(state, D, 16). It must not modify the state.
+            records (numpy.ndarray): The records, e.g. from query.
+            num_workers (int, optional): The number of worker processes, 1 to evaluate in this process. Defaults to 1.
+            chunk (int, optional): The number of states per task. Defaults to 64.
+
+        Returns:
+            numpy.ndarray: The value of f on the state of each record, stacked along a new first axis.
+        """
+        if num_workers == 1:
+            return np.array([f(state) for _, states in self.chunks(records, chunk) for state in states])
+        states_file = self.states_file
+        def work(chunk_records):
+            words = np.memmap(states_file, dtype = np.uint64, mode = 'r')
+            return [f(state) for state in read(words, chunk_records)]
+        with Pool(num_workers, initializer = set_num_threads, initargs = (1,)) as pool:
+            values = pool.map(work, [records[start : start + chunk] for start in range(0, len(records), chunk)])
+        return np.array([value for chunk_values in values for value in chunk_values])
@@ -0,0 +1,426 @@
+import sys
+sys.path.insert(0, 'clifford')
+
+import json
+import numpy as np
+import MIPT
+from MIPT import bip_info, create_circuit, entropy, entropy_profile, pair_info, qubit_pos, sample, trip_info, zero_state
+from numba import get_num_threads, njit
+from symplectic import decode_layer, random_layer
+import gf2
+import tableau
+from tasks import INFO_P
+import time
+
+# Parse command line arguments
+import argparse
+parser = argparse.ArgumentParser(
+    description = 'Benchmark the simulation backends and observables.',
+    epilog = 'Prints timings, and for backends the largest deviation between them in units of the combined standard error.'
+)
+parser.add_argument('mode', nargs = '?', default = 'backends', choices = ['backends', 'reference', 'observables', 'measurements', 'gates', 'suite'])
+parser.add_argument('-L', type = int, default = 16)
+parser.add_argument('-D', type = int, default = 1)
+parser.add_argument('-p', type = float, default = None, help = 'defaults to p_c of D')
+parser.add_argument('-T', '--timesteps', type = int, default = 64)
+parser.add_argument('-s', '--shots', type = int, default = 4)
+parser.add_argument('-b', '--backends', nargs = '+', default = ['native', 'pyclifford'], help = "backends to run, 'qiskit' for qiskit_clifford in the suite")
+parser.add_argument('--grid-L', type = int, nargs = '+', default = [16, 64, 256], help = 'values of L for the suite')
+parser.add_argument('--grid-D', type = int, nargs = '+', default = [1, 2, 3], help = 'values of D for the suite, each at p_c')
+parser.add_argument('--seed', type = int, default = None, help = 'seed of the circuits of the reference mode')
+parser.add_argument('-o', '--output', default = 'benchmark.json', help = 'file to write the suite results to')
+parser.add_argument('--baseline', default = None, help = 'suite results to compare against')
+parser.add_argument('--threshold', type = float, default = 0.25, help = 'relative slowdown counted as a regression, at least the spread of the repeats')
+parser.add_argument('-k', '--repeats', type = int, default = 5, help = 'repeats of every timing of the suite')
+args = parser.parse_args()
+
+L = args.L
+D = args.D
+p = args.p if args.p is not None else INFO_P[D]
+timesteps = args.timesteps
+shots = args.shots
+
+def calls_per_second(g, state, duration = 2):
+    """Calls g(state) repeatedly for about duration seconds and returns the call rate."""
+    g(state)
+    calls = 0
+    start_time = time.time()
+    while time.time() - start_time < duration:
+        g(state)
+        calls += 1
+    return calls / (time.time() - start_time)
+
+def benchmark_backends():
+    def f(state):
+        result = []
+        qudits = [0]
+        for i in range(1, L // 2 + 1):
+            qudits.append(i)
+            result.append(entropy(state, D, qudits))
+        return np.array(result)
+
+    # Compile the native kernels before timing
+    sample(f, 4, p, D, 2, backend = 'native')
+
+    print("Entropy profile for L = {}, D = {}, p = {}, {} shots of {} timesteps:".format(L, D, p, shots, timesteps))
+    stats = {}
+    for backend in args.backends:
+        start_time = time.time()
+        results = np.array([sample(f, L, p, D, timesteps, backend = backend) for _ in range(shots)])
+        elapsed = time.time() - start_time
+        mean = results[:, 0].mean(axis = 0)
+        # Shots are independent, timesteps are not, so use the spread of the shot means
+        err = results[:, 0].std(axis = 0) / np.sqrt(shots)
+        stats[backend] = (mean, err, elapsed)
+        print("{:>12}: {:8.3f} s, {:8.3f} ms per timestep, S(L/2) = {:.4f} +/- {:.4f}".format(
+            backend, elapsed, 1000 * elapsed / (shots * timesteps), mean[-1], err[-1]))
+
+    if len(stats) > 1:
+        (mean_1, err_1, time_1), (mean_2, err_2, time_2) = list(stats.values())[:2]
+        z = np.abs(mean_1 - mean_2) / np.sqrt(err_1**2 + err_2**2 + 1e-12)
+        print("Speedup: {:.1f}x, max deviation: {:.2f} sigma".format(time_2 / time_1, z.max()))
+
+def apply_pauli(psi, v):
+    """Applies the Hermitian Pauli string P(v) (see symplectic.phase_tables) to a dense state of shape (2,) * n."""
+    psi = psi.copy()
+    for q in range(len(v) // 2):
+        x, z = v[2 * q], v[2 * q + 1]
+        if z:
+            index = [slice(None)] * psi.ndim
+            index[q] = 1
+            psi[tuple(index)] *= -1
+        if x:
+            psi = np.flip(psi, axis = q)
+        if x and z:
+            psi = 1j * psi
+    return psi
+
+def gate_unitary(g, s):
+    """Builds the dense unitary of a Clifford gate from the images (-1)^s_j P(g_j) of its generators.
+
+    U|0> is the joint +1 eigenvector of the images of Z_1, ..., Z_n, and U|x> = prod_a P(X_a)^x_a U|0>, with qubit 0 the
+    most significant bit of x.
+    """
+    n = g.shape[0] // 2
+    shape = (2,) * n
+    image = lambda j, psi: (-1)**int(s[j]) * apply_pauli(psi, g[j])
+    u = np.random.default_rng(0).normal(size = shape) + 0j
+    for a in range(n):
+        u = (u + image(2 * a + 1, u)) / 2
+    u /= np.linalg.norm(u)
+    U = np.empty((2**n, 2**n), dtype = complex)
+    for x in range(2**n):
+        column = u
+        for a in range(n):
+            if x >> (n - 1 - a) & 1:
+                column = image(2 * a, column)
+        U[:, x] = column.ravel()
+    return U
+
+def apply_dense(psi, U, qubits):
+    """Applies a unitary to the given qubits of a dense state of shape (2,) * N."""
+    n = len(qubits)
+    moved = np.moveaxis(psi, qubits, range(n))
+    moved = (U @ moved.reshape(2**n, -1)).reshape(moved.shape)
+    return np.moveaxis(moved, range(n), qubits)
+
+def measure_dense(psi, q, outcome):
+    """Measures qubit q of a dense state in the Z basis, projecting onto outcome if it is random, like tableau.measure."""
+    probability = np.sum(np.abs(np.take(psi, outcome, axis = q))**2)
+    if np.isclose(probability, 1) or np.isclose(probability, 0):
+        return psi
+    assert np.isclose(probability, 0.5)
+    psi = psi.copy()
+    index = [slice(None)] * psi.ndim
+    index[q] = 1 - outcome
+    psi[tuple(index)] = 0
+    return psi / np.sqrt(probability)
+
+def entropy_dense(psi, A):
+    """Calculates the entanglement entropy of the qubits A of a dense state, in bits, from its Schmidt coefficients."""
+    moved = np.moveaxis(psi, A, range(len(A))).reshape(2**len(A), -1)
+    schmidt = np.linalg.svd(moved, compute_uv = False)**2
+    schmidt = schmidt[schmidt > 1e-12]
+    return -np.sum(schmidt * np.log2(schmidt))
+
+def check_dense(state, psi, D):
+    """Checks that a native state is the dense state psi, and its observables those of psi. Returns the largest deviation."""
+    N = state.N
+    L = N // D
+    columns = gf2.unpack(state.bits, N)
+    for k in range(N):
+        stabilizer = (-1)**int(columns[2 * N, k]) * apply_pauli(psi, columns[:2 * N, k])
+        assert np.allclose(stabilizer, psi), "stabilizer {} does not stabilize the dense state".format(k)
+    S = lambda qudits: entropy_dense(psi, [j for i in qudits for j in qubit_pos(i, D)])
+    profile = np.array([[S([(i + j) % L for j in range(x)]) if 0 < x < L else 0 for x in range(L + 1)] for i in range(L)])
+    pairs = np.array([[S([a, b]) if a != b else 0 for b in range(L)] for a in range(L)])
+    single = profile[:, 1]
+    info = single[:, None] + single[None, :] - pairs
+    info[np.arange(L), np.arange(L)] = 2 * single
+    deviations = [entropy_profile(state, D, periodic = True, log2 = True) - profile,
+                  entropy_profile(state, D, log2 = True) - profile[0],
+                  pair_info(state, D, log2 = True) - info]
+    if L >= 4:
+        s = L // 4
+        A, B, C = [list(range(k * s, (k + 1) * s)) for k in range(3)]
+        I3 = -(S(A) + S(B) + S(C)) + (S(A + B) + S(B + C) + S(C + A)) - S(A + B + C)
+        deviations.append(np.array([trip_info(state, D) / np.log(2) - I3]))
+    if L >= 8:
+        s = L // 8
+        A, B = list(range(s)), [L // 2 + i for i in range(s)]
+        deviations.append(np.array([bip_info(state, D) / np.log(2) - (S(A) + S(B) - S(A + B))]))
+    return max(np.abs(d).max() for d in deviations)
+
+def benchmark_reference():
+    """Replays random circuits on the native backend and on a dense state vector, checking the states after every layer."""
+    rng = np.random.default_rng(args.seed)
+    print("Native backend against a dense state vector, {} circuits per D:".format(shots))
+    for D, p in INFO_P.items():
+        L = 2 * (6 // D) # At most 12 qubits
+        N = L * D
+        deviation = 0
+        for _ in range(shots):
+            state = zero_state(N)
+            psi = np.zeros((2,) * N, dtype = complex)
+            psi[(0,) * N] = 1
+            circ = tableau.CompactCircuit.generate(L, 2 * L, p, D, rng)
+            for t in range(len(circ)):
+                circ.apply_gates(state, t)
+                g, s, _, _ = decode_layer(circ.choices[t], 2 * D)
+                for e, qubits in enumerate(tableau.brickwork_pairs(L, circ.even[t], D)):
+                    psi = apply_dense(psi, gate_unitary(g[e], s[e]), list(qubits))
+                circ.apply_measurements(state, t)
+                for q in np.nonzero(np.repeat(circ.measured[t], D))[0]:
+                    psi = measure_dense(psi, q, circ.outcomes[t][q])
+                deviation = max(deviation, check_dense(state, psi, D))
+            # A random stabilizer state, against the dense state it stabilizes
+            state = tableau.random_state(N, rng)
+            psi = rng.normal(size = (2,) * N) + 0j
+            columns = gf2.unpack(state.bits, N)
+            for k in range(N):
+                psi = (psi + (-1)**int(columns[2 * N, k]) * apply_pauli(psi, columns[:2 * N, k])) / 2
+            psi /= np.linalg.norm(psi)
+            deviation = max(deviation, check_dense(state, psi, D))
+        print("D = {}, L = {}, p = {}: all states agree, largest deviation of an entropy {:.1e} bits".format(D, L, p, deviation))
+
+def benchmark_observables():
+    # Reference implementations with one independent elimination per region
+    def trip_info_separate(state):
+        s = L // 4
+        A = [i for i in range(s)]
+        B = [i + s for i in range(s)]
+        C = [i + 2 * s for i in range(s)]
+        S = lambda X: entropy(state, D, X)
+        return -(S(A) + S(B) + S(C)) + (S(A + B) + S(B + C) + S(C + A)) - S(A + B + C)
+
+    def bip_info_separate(state):
+        s = L // 8
+        A = [i for i in range(s)]
+        B = [L // 2 + i for i in range(s)]
+        return entropy(state, D, A) + entropy(state, D, B) - entropy(state, D, A + B)
+
+    state = zero_state(L * D)
+    create_circuit(L, L // 2, p, D).forward(state)
+    print("Observables for a steady state with L = {}, D = {}, p = {}:".format(L, D, p))
+    for name, before, after in [('trip_info', trip_info_separate, lambda state: trip_info(state, D)),
+                                ('bip_info', bip_info_separate, lambda state: bip_info(state, D))]:
+        assert np.isclose(before(state), after(state))
+        rate_before = calls_per_second(before, state)
+        rate_after = calls_per_second(after, state)
+        print("{:>12}: {:10.1f} calls/s separate, {:10.1f} calls/s shared, {:.2f}x".format(
+            name, rate_before, rate_after, rate_after / rate_before))
+
+@njit
+def measure_each(bits, qubits, outcomes):
+    """Reference for tableau.measure_layer, measuring one qubit at a time."""
+    for i in range(qubits.shape[0]):
+        tableau.measure(bits, qubits[i], outcomes[i])
+
+def benchmark_measurements():
+    print("Measurement layers for L = {} at p_c of each D:".format(L))
+    for D, p in INFO_P.items():
+        # A state near the steady state, about to be measured after an even layer
+        rng = np.random.default_rng()
+        states = tableau.zero_batch(1, L * D)
+        for _ in range(16):
+            for even in (True, False):
+                tableau.brickwork_batch(states.bits, even, D, rng)
+                tableau.measurement_batch(states.bits, p, D, rng)
+        tableau.brickwork_batch(states.bits, True, D, rng)
+        bits = states.bits[0]
+        qubits = np.nonzero(np.repeat(rng.random(L) < p, D))[0]
+        outcomes = rng.integers(2, size = len(qubits))
+        rates = []
+        for g in (measure_each, tableau.measure_layer):
+            rates.append(calls_per_second(lambda bits: g(bits.copy(), qubits, outcomes), bits))
+        expected = bits.copy()
+        measure_each(expected, qubits, outcomes)
+        measured = bits.copy()
+        tableau.measure_layer(measured, qubits, outcomes)
+        assert np.array_equal(expected, measured)
+        print("D = {}, p = {}: {:5d} qubits, {:8.3f} ms one at a time, {:8.3f} ms per layer, {:.2f}x".format(
+            D, p, len(qubits), 1000 / rates[0], 1000 / rates[1], rates[1] / rates[0]))
+
+@njit
+def apply_each(bits, qubits, g, s, w, Q):
+    """Reference for tableau.apply_layer: the per-gate kernel it replaced, looping over the dense gate data of one gate at a time."""
+    sign_row = bits.shape[0] - 1
+    n = qubits.shape[1]
+    nn = 2 * n
+    cols = np.empty(nn, dtype = np.int64)
+    old = np.empty(nn, dtype = np.uint64)
+    new = np.empty(nn, dtype = np.uint64)
+    for e in range(qubits.shape[0]):
+        for a in range(n):
+            cols[2 * a] = 2 * qubits[e, a]
+            cols[2 * a + 1] = 2 * qubits[e, a] + 1
+        for k in range(bits.shape[1]):
+            for j in range(nn):
+                old[j] = bits[cols[j], k]
+            for j in range(nn):
+                acc = np.uint64(0)
+                for i in range(nn):
+                    if g[e, i, j]:
+                        acc ^= old[i]
+                new[j] = acc
+            f = np.uint64(0)
+            for i in range(nn):
+                if s[e, i]:
+                    f ^= old[i]
+                for j in range(i + 1, nn):
+                    if Q[e, i, j]:
+                        f ^= old[i] & old[j]
+            lo = np.uint64(0)
+            hi = np.uint64(0)
+            for a in range(n):
+                m = old[2 * a] & old[2 * a + 1]
+                hi ^= lo & m
+                lo ^= m
+            for i in range(nn):
+                if w[e, i] & 2:
+                    hi ^= old[i]
+                if w[e, i] & 1:
+                    hi ^= lo & old[i]
+                    lo ^= old[i]
+            for a in range(n):
+                m = new[2 * a] & new[2 * a + 1]
+                hi ^= ~lo & m
+                lo ^= m
+            for j in range(nn):
+                bits[cols[j], k] = new[j]
+            bits[sign_row, k] ^= f ^ hi
+
+def benchmark_gates():
+    print("Brickwork layers for L = {}, in gate applications per second ({} threads):".format(L, get_num_threads()))
+    for D in INFO_P:
+        states = tableau.zero_batch(1, L * D)
+        for even in (True, False):
+            tableau.brickwork_batch(states.bits, even, D)
+        bits = states.bits[0]
+        for even in (True, False):
+            qubits = tableau.brickwork_pairs(L, even, D)
+            layer = random_layer(qubits.shape[0], 2 * D)
+            rates = [qubits.shape[0] * calls_per_second(lambda bits: g(bits, qubits, *layer), bits.copy())
+                     for g in (apply_each, tableau.apply_layer, tableau.apply_layer_parallel)]
+            expected = bits.copy()
+            apply_each(expected, qubits, *layer)
+            for g in (tableau.apply_layer, tableau.apply_layer_parallel):
+                applied = bits.copy()
+                g(applied, qubits, *layer)
+                assert np.array_equal(expected, applied)
+            print("D = {}, {:>4} layer: {:10.0f} per gate, {:10.0f} compiled ({:.2f}x), {:10.0f} compiled in parallel ({:.2f}x)".format(
+                D, 'even' if even else 'odd', rates[0], rates[1], rates[1] / rates[0], rates[2], rates[2] / rates[0]))
+
+def benchmark_suite():
+    """Times every phase of the simulation and every observable over a grid of L and D, see the README."""
+    from results import code_version
+    MIPT.PROFILE = True
+    records = []
+
+    def record(backend, L, D, p, phase, times):
+        """Records the fastest of the per-call times of the repeats, and their spread relative to it."""
+        seconds = min(times)
+        spread = max(times) / seconds - 1
+        records.append({'backend': backend, 'L': L, 'D': D, 'p': p, 'phase': phase, 'seconds': seconds, 'spread': spread,
+                        'repeats': len(times)})
+        print("{:>10} L = {:4d}, D = {}: {:>16} {:12.6f} s +{:.0%}".format(backend, L, D, phase, seconds, spread))
+
+    def per_call(g, state):
+        return [1 / calls_per_second(g, state, duration = 0.2) for _ in range(args.repeats)]
+
+    for backend in args.backends:
+        for D in args.grid_D:
+            p = INFO_P[D]
+            if backend == 'qiskit':
+                if D > 1:
+                    continue # Qubits only
+                sys.path.insert(0, 'clifford/qiskit_clifford')
+                import qiskit_clifford
+                for L in args.grid_L:
+                    times = {'construction': [], 'simulation': []}
+                    for _ in range(args.repeats):
+                        start_time = time.perf_counter()
+                        circ = qiskit_clifford.make(L, timesteps, p, decompose = True)
+                        times['construction'].append((time.perf_counter() - start_time) / timesteps)
+                        start_time = time.perf_counter()
+                        cliff = qiskit_clifford.run_batch([circ]).data(0)['t' + str(2 * timesteps - 1)][0].stab.astype(int)
+                        times['simulation'].append((time.perf_counter() - start_time) / timesteps)
+                    for phase in times:
+                        record(backend, L, D, p, phase, times[phase])
+                    record(backend, L, D, p, 'entropy', per_call(lambda cliff: qiskit_clifford.entropy(cliff, L // 2), cliff))
+                continue
+            sample(lambda state: np.zeros(1), 8, p, D, 2, backend = backend) # Compile before timing
+            for L in args.grid_L:
+                times = {}
+                for _ in range(args.repeats):
+                    # Like calls_per_second, sample for at least 0.2 seconds per repeat, so short phases average over many calls
+                    MIPT.phase_times.clear()
+                    start_time = time.time()
+                    while time.time() - start_time < 0.2:
+                        _, state = sample(lambda state: np.zeros(1), L, p, D, timesteps, backend = backend, return_state = True)
+                    for phase, (seconds, calls) in MIPT.phase_times.items():
+                        times.setdefault(phase, []).append(seconds / calls)
+                for phase in ('construction', 'initial', 'gates', 'measurement'):
+                    if phase in times:
+                        record(backend, L, D, p, phase, times[phase])
+                record(backend, L, D, p, 'entropy', per_call(lambda state: entropy(state, D), state))
+                record(backend, L, D, p, 'bip_info', per_call(lambda state: bip_info(state, D), state))
+                record(backend, L, D, p, 'trip_info', per_call(lambda state: trip_info(state, D), state))
+                record(backend, L, D, p, 'entropy_profile', per_call(lambda state: entropy_profile(state, D), state))
+
+    with open(args.output, 'w') as f:
+        json.dump({'created': time.time(), 'version': code_version(), 'threads': get_num_threads(), 'timesteps': timesteps,
+                   'repeats': args.repeats, 'records': records}, f, indent = 1)
+    print("Wrote {} timings to {}.".format(len(records), args.output))
+
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = {(r['backend'], r['L'], r['D'], r['phase']): r for r in json.load(f)['records']}
+        regressions = []
+        for r in records:
+            key = (r['backend'], r['L'], r['D'], r['phase'])
+            if key in baseline:
+                # Fastest against fastest, allowing for the spread of the repeats of either run
+                old = baseline[key]
+                tolerance = max(args.threshold, old.get('spread', 0), r['spread'])
+                if r['seconds'] > (1 + tolerance) * old['seconds']:
+                    regressions.append((key, r['seconds'] / old['seconds'], tolerance))
+        for (backend, L, D, phase), ratio, tolerance in regressions:
+            print("Regression: {} L = {}, D = {}, {} is {:.2f}x slower than {} (tolerance {:.0%})".format(
+                backend, L, D, phase, ratio, args.baseline, tolerance))
+        if regressions:
+            sys.exit(1)
+        print("No regressions beyond {:.0%} or the spread of the repeats against {}.".format(args.threshold, args.baseline))
+
+if args.mode == 'backends':
+    benchmark_backends()
+elif args.mode == 'reference':
+    benchmark_reference()
+elif args.mode == 'observables':
+    benchmark_observables()
+elif args.mode == 'measurements':
+    benchmark_measurements()
+elif args.mode == 'gates':
+    benchmark_gates()
+else:
+    benchmark_suite()
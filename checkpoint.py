@@ -0,0 +1,62 @@
+import json
+import os
+import numpy as np
+
+import tableau
+from stats import RunningStats
+
+def save(path, rng = None, states = None, stats = None, trajectory_stats = None, **arrays):
+    """Writes a checkpoint to a compressed .npz file, atomically replacing any previous one.
+
+    Args:
+        path (str): The checkpoint file.
+        rng (numpy.random.Generator, optional): A random number generator whose state to save. Defaults to None.
+        states (list, optional): The tableau.StabilizerTableau of each trajectory. Defaults to None.
+        stats (stats.RunningStats, optional): Streaming statistics to save. Defaults to None.
+        trajectory_stats (list, optional): The stats.RunningStats of each trajectory, continued on resume. Defaults to None.
+        **arrays: Further arrays or scalars to save, e.g. accumulators and run counts.
+
+    Returns:
+        None
+    """
+    if rng is not None:
+        arrays['rng_state'] = np.array(json.dumps(rng.bit_generator.state))
+    if states is not None:
+        arrays['states'] = np.stack([state.bits for state in states])
+    if stats is not None:
+        for key, value in stats.to_arrays().items():
+            arrays['stats_' + key] = value
+    if trajectory_stats is not None:
+        for key, value in RunningStats.stack(trajectory_stats).to_arrays().items():
+            arrays['trajectory_stats_' + key] = value
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        np.savez_compressed(f, **arrays)
+    os.replace(tmp, path)
+
+def load(path):
+    """Reads a checkpoint written by save.
+
+    Args:
+        path (str): The checkpoint file.
+
+    Returns:
+        dict: The saved fields, with 'rng' restored as a numpy.random.Generator, 'states' as a list of tableau.StabilizerTableau
+            'stats' as a stats.RunningStats and 'trajectory_stats' as a list of them.
+    """
+    with np.load(path) as data:
+        fields = {key: data[key] for key in data.files}
+    if 'rng_state' in fields:
+        state = json.loads(str(fields.pop('rng_state')))
+        rng = np.random.Generator(getattr(np.random, state['bit_generator'])())
+        rng.bit_generator.state = state
+        fields['rng'] = rng
+    if 'states' in fields:
+        fields['states'] = [tableau.StabilizerTableau(bits) for bits in fields.pop('states')]
+    for name in ('stats', 'trajectory_stats'):
+        if name + '_n' in fields:
+            fields[name] = RunningStats.from_arrays(*[fields.pop(name + '_' + key) for key in ('n', 'mean', 'm2', 'pending', 'full')])
+    if 'trajectory_stats' in fields:
+        stacked = fields['trajectory_stats']
+        fields['trajectory_stats'] = [stacked[i] for i in range(len(fields['states']))]
+    return fields
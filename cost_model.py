@@ -0,0 +1,224 @@
+import json
+import numpy as np
+from numba import set_num_threads
+from scipy.optimize import nnls
+
+import MIPT
+from MIPT import entropy_profile, sample, trip_info
+from stats import RunningStats
+
+# The time of one timestep is modelled as a linear combination of the features below, fitted with non-negative
+# coefficients to profiled sample runs. With N = L D qubits packed into W = 1 + (N - 1) // 64 words per row, Gaussian
+# elimination for the observable and each measurement cost O(N^2 W), and a layer of gates O(N W).
+
+FEATURES = ['N^2 W', 'p N^2 W', 'N W', '1']
+
+def features(L, D, p):
+    """Returns the features of the cost model.
+
+    Args:
+        L (int): The number of qudits.
+        D (int): The number of qubits per qudit.
+        p (float): The measurement probability.
+
+    Returns:
+        numpy.ndarray: The features, see FEATURES.
+    """
+    N = L * D
+    W = 1 + (N - 1) // 64
+    return np.array([N**2 * W, p * N**2 * W, N * W, 1.0])
+
+def observable(kind, L, D):
+    """Returns the function sampled by the driver of a kind of result.
+
+    Args:
+        kind (str): 'info' (info.py) or 'entropies_all' (S_all.py).
+        L (int): The number of qudits.
+        D (int): The number of qubits per qudit.
+
+    Returns:
+        function: The function of a state.
+    """
+    if kind == 'info':
+        return lambda state: trip_info(state, D)
+    elif kind == 'entropies_all':
+        return lambda state: entropy_profile(state, D)[2 : L // 2 + 2]
+    raise ValueError("Unknown kind {}".format(kind))
+
+class CostModel:
+    """Predicts the run time and statistical error of sampling a kind of result, to size SLURM tasks.
+
+    Args:
+        kind (str): What is sampled, 'info' or 'entropies_all'.
+        step (list): The coefficients of the seconds per timestep per trajectory, see FEATURES.
+        evolve (list): The coefficients of the seconds per layer of the circuit alone, which the initial circuit pays depth times.
+        variance (dict): Maps D to a list of (L, variance) pairs, where variance is the squared standard error times the
+            number of samples, i.e. the variance of one sample inflated by the autocorrelation time.
+        points (list, optional): The calibration points (L, D, p, seconds per timestep). Defaults to None.
+    """
+    def __init__(self, kind, step, evolve, variance, points = None):
+        self.kind = kind
+        self.step = np.asarray(step, dtype = float)
+        self.evolve = np.asarray(evolve, dtype = float)
+        self.variance = {int(D): sorted(map(tuple, pairs)) for D, pairs in variance.items()}
+        self.points = points if points is not None else []
+
+    def step_time(self, L, D, p):
+        """Returns the predicted seconds per timestep of one trajectory on one core."""
+        return float(features(L, D, p) @ self.step)
+
+    def initial_time(self, L, D, p, depth = None):
+        """Returns the predicted seconds of the initial circuit of one trajectory on one core."""
+        if depth is None:
+            depth = L // 2
+        return depth * float(features(L, D, p) @ self.evolve)
+
+    def sample_variance(self, L, D):
+        """Returns the effective variance of one sample, from a power law in L fitted to the calibrated sizes.
+
+        Args:
+            L (int): The number of qudits.
+            D (int): The number of qubits per qudit, the nearest calibrated one if it was not calibrated.
+
+        Returns:
+            float: The variance.
+        """
+        D = min(self.variance, key = lambda d: abs(d - D))
+        # Short runs of a trajectory that has not yet fluctuated give no variance, so skip them
+        Ls, variances = np.log(np.array([pair for pair in self.variance[D] if pair[1] > 1e-12])).T
+        if len(Ls) == 1:
+            return float(np.exp(variances[0]))
+        slope, intercept = np.polyfit(Ls, variances, 1)
+        if slope < 0: # Noise in short runs, fluctuations do not shrink with L
+            return float(np.exp(np.mean(variances)))
+        return float(np.exp(slope * np.log(L) + intercept))
+
+    def recommend(self, L, D, p, target_error, time_limit, cores = (4, 8, 16, 32), min_shots = 16, max_timesteps = 256,
+                  efficiency = 0.9, margin = 1.2):
+        """Sizes one task: the fewest cores on which shots x timesteps x runs samples reach the target error in time.
+
+        Every core runs one worker, which keeps its trajectories alive between runs (see workers.TrajectoryPool), so
+        the initial circuit is paid once per trajectory and the fewest shots that keep every core busy are cheapest.
+
+        Args:
+            L (int): The number of qudits.
+            D (int): The number of qubits per qudit.
+            p (float): The measurement probability.
+            target_error (float): The standard error to reach.
+            time_limit (float): The wall-clock limit in seconds.
+            cores (tuple, optional): The core counts to choose from, in increasing order. Defaults to (4, 8, 16, 32).
+            min_shots (int, optional): The fewest independent trajectories. Defaults to 16.
+            max_timesteps (int, optional): The most timesteps per run, i.e. between checkpoints. Defaults to 256.
+            efficiency (float, optional): The parallel efficiency of the workers. Defaults to 0.9.
+            margin (float, optional): The factor by which the predicted time must undercut the limit. Defaults to 1.2.
+
+        Returns:
+            dict: The cores, shots, timesteps, runs, predicted seconds and error, the seconds of one run, and whether
+                the target error fits in the time limit (if not, runs is as many as fit).
+        """
+        step = self.step_time(L, D, p)
+        initial = self.initial_time(L, D, p)
+        variance = self.sample_variance(L, D)
+        samples = variance / target_error**2
+        for c in cores:
+            shots = c * -(-min_shots // c)
+            wall = shots // c * (initial + samples / shots * step) / efficiency
+            if wall * margin <= time_limit:
+                break
+        per_trajectory = max(1, int(np.ceil(samples / shots)))
+        # Keep runs short enough to checkpoint a few times and to stop in time
+        timesteps = min(max_timesteps, 1 << (per_trajectory - 1).bit_length())
+        while timesteps > 1 and shots // c * timesteps * step / efficiency > time_limit / 8:
+            timesteps //= 2
+        run_time = shots // c * timesteps * step / efficiency
+        runs = -(-per_trajectory // timesteps)
+        fits = (shots // c * initial / efficiency + runs * run_time) * margin <= time_limit
+        if not fits:
+            runs = max(1, int((time_limit / margin - shots // c * initial / efficiency) // run_time))
+        return {
+            'cores': c,
+            'shots': shots,
+            'timesteps': timesteps,
+            'runs': runs,
+            'seconds': shots // c * initial / efficiency + runs * run_time,
+            'run_seconds': run_time,
+            'error': float(np.sqrt(variance / (shots * timesteps * runs))),
+            'fits': fits
+        }
+
+    def to_dict(self):
+        """Returns the model as a JSON-serialisable dict, see from_dict."""
+        return {
+            'kind': self.kind,
+            'features': FEATURES,
+            'step': self.step.tolist(),
+            'evolve': self.evolve.tolist(),
+            'variance': {str(D): pairs for D, pairs in self.variance.items()},
+            'points': self.points
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """Restores a model saved by to_dict."""
+        return cls(data['kind'], data['step'], data['evolve'], data['variance'], data['points'])
+
+    def save(self, path):
+        """Writes the model to a JSON file."""
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent = 1)
+
+    @classmethod
+    def load(cls, path):
+        """Reads a model written by save."""
+        with open(path) as f:
+            return cls.from_dict(json.load(f))
+
+def calibrate(kind, points, timesteps = 32, shots = 4, log = print):
+    """Fits a cost model to short profiled runs of sample on one core.
+
+    Args:
+        kind (str): What is sampled, 'info' or 'entropies_all'.
+        points (list): The (L, D, p) to run, spanning the features of the model.
+        timesteps (int, optional): The timesteps per trajectory. Defaults to 32.
+        shots (int, optional): The trajectories per point. Defaults to 4.
+        log (function, optional): Called with a progress message per point. Defaults to print.
+
+    Returns:
+        CostModel: The fitted model.
+    """
+    set_num_threads(1) # As in a worker of workers.TrajectoryPool
+    profile = MIPT.PROFILE
+    MIPT.PROFILE = True
+    sample(observable(kind, 4, 1), 4, 0.5, 1, 2) # Compile the kernels before timing
+    rows = []
+    steps = []
+    evolves = []
+    variance = {}
+    calibrated = []
+    try:
+        for L, D, p in points:
+            MIPT.phase_times.clear()
+            stats = RunningStats()
+            for _ in range(shots):
+                sample(observable(kind, L, D), L, p, D, timesteps, stats = stats)
+            seconds = {name: total for name, (total, _) in MIPT.phase_times.items()}
+            calls = MIPT.phase_times['gates'][1] # One per timestep
+            evolve = (seconds['gates'] + seconds.get('measurement', 0)) / calls
+            step = evolve + seconds['observable'] / calls
+            sample_variance = float(np.max(stats.error()**2 * stats.n))
+            rows.append(features(L, D, p))
+            steps.append(step)
+            evolves.append(evolve)
+            variance.setdefault(D, []).append((L, sample_variance))
+            calibrated.append((L, D, p, step))
+            log("L = {}, D = {}, p = {}: {:.3g} s per timestep, {:.3g} s per layer, variance {:.3g}".format(
+                L, D, p, step, evolve, sample_variance))
+    finally:
+        MIPT.PROFILE = profile
+    # Fit relative rather than absolute errors, as the times span orders of magnitude
+    A = np.array(rows)
+    steps = np.array(steps)
+    evolves = np.array(evolves)
+    step = nnls(A / steps[:, None], np.ones(len(steps)))[0]
+    evolve = nnls(A / evolves[:, None], np.ones(len(evolves)))[0]
+    return CostModel(kind, step, evolve, variance, calibrated)
@@ -0,0 +1,333 @@
+import numpy as np
+from numba import njit
+
+# Bit vectors over GF(2) are stored packed into rows of uint64 words, 64 entries per word, least significant bit first.
+
+@njit
+def lowest_bit(word):
+    """Finds the position of the lowest set bit of a nonzero word.
+
+    Args:
+        word (numpy.uint64): The word.
+
+    Returns:
+        int: The bit position, 0 to 63.
+    """
+    b = 0
+    while (word >> np.uint64(b)) & np.uint64(1) == 0:
+        b += 1
+    return b
+
+# Matrices with at least this many rows are reduced with the method of four Russians, see m4ri_rank
+M4RI_ROWS = 160
+# Columns eliminated at once by the method of four Russians, a divisor of 64
+M4RI_K = 8
+
+def pack(matrix):
+    """Packs the rows of a 0/1 matrix into uint64 words.
+
+    Args:
+        matrix (numpy.ndarray): Array of shape (n, m) of zeros and ones.
+
+    Returns:
+        numpy.ndarray: Array of shape (n, ceil(m / 64)) of uint64 words, one vector per row.
+    """
+    matrix = np.asarray(matrix) % 2
+    n, m = matrix.shape
+    W = (m + 63) // 64
+    padded = np.zeros((n, 64 * W), dtype = np.uint8)
+    padded[:, :m] = matrix
+    return np.packbits(padded, axis = 1, bitorder = 'little').view('<u8').astype(np.uint64)
+
+def unpack(vecs, m):
+    """Unpacks packed bit vectors into the rows of a 0/1 matrix, the inverse of pack.
+
+    Args:
+        vecs (numpy.ndarray): Array of shape (n, W) of uint64 words.
+        m (int): The number of columns.
+
+    Returns:
+        numpy.ndarray: Array of shape (n, m) of zeros and ones, as uint8.
+    """
+    return np.unpackbits(np.ascontiguousarray(vecs).astype('<u8').view(np.uint8), axis = 1, bitorder = 'little')[:, :m]
+
+@njit
+def rank(vecs):
+    """Calculates the rank of a set of packed bit vectors. The input is overwritten.
+
+    Large matrices go through m4ri_rank, small ones through gauss_rank.
+
+    Args:
+        vecs (numpy.ndarray): Array of shape (n, W) of uint64 words, one vector per row.
+
+    Returns:
+        int: The rank over GF(2).
+    """
+    if vecs.shape[0] >= M4RI_ROWS:
+        return m4ri_rank(vecs)
+    return gauss_rank(vecs)
+
+@njit
+def gauss_rank(vecs):
+    """Calculates the rank of a set of packed bit vectors by plain Gaussian elimination. The input is overwritten.
+
+    Args:
+        vecs (numpy.ndarray): Array of shape (n, W) of uint64 words, one vector per row.
+
+    Returns:
+        int: The rank over GF(2).
+    """
+    n, W = vecs.shape
+    r = 0
+    for w in range(W):
+        for b in range(64):
+            if r == n:
+                return r
+            bit = np.uint64(1) << np.uint64(b)
+            pivot = -1
+            for i in range(r, n):
+                if vecs[i, w] & bit:
+                    pivot = i
+                    break
+            if pivot < 0:
+                continue
+            if pivot != r:
+                for k in range(w, W):
+                    tmp = vecs[r, k]
+                    vecs[r, k] = vecs[pivot, k]
+                    vecs[pivot, k] = tmp
+            for i in range(r + 1, n):
+                if vecs[i, w] & bit:
+                    for k in range(w, W):
+                        vecs[i, k] ^= vecs[r, k]
+            r += 1
+    return r
+
+@njit
+def m4ri_rank(vecs):
+    """Calculates the rank of a set of packed bit vectors with the method of four Russians. The input is overwritten.
+
+    Columns are eliminated M4RI_K at a time: up to M4RI_K pivot rows are found and reduced among themselves, all 2^k sums
+    of them are tabulated, and every other row is then cleared on those columns by a single table lookup instead of k
+    row additions.
+
+    Args:
+        vecs (numpy.ndarray): Array of shape (n, W) of uint64 words, one vector per row.
+
+    Returns:
+        int: The rank over GF(2).
+    """
+    n, W = vecs.shape
+    k = M4RI_K
+    table = np.zeros((1 << k, W), dtype = np.uint64)
+    bits = np.empty(k, dtype = np.uint64)
+    r = 0
+    for w in range(W):
+        for shift in range(0, 64, k):
+            if r == n:
+                return r
+            # Find pivot rows for the k columns, reducing candidates on this word only until one is chosen
+            kk = 0
+            for b in range(shift, shift + k):
+                bit = np.uint64(1) << np.uint64(b)
+                for i in range(r + kk, n):
+                    word = vecs[i, w]
+                    for t in range(kk):
+                        if word & bits[t]:
+                            word ^= vecs[r + t, w]
+                    if word & bit:
+                        if i != r + kk:
+                            for j in range(w, W):
+                                tmp = vecs[r + kk, j]
+                                vecs[r + kk, j] = vecs[i, j]
+                                vecs[i, j] = tmp
+                        for t in range(kk):
+                            if vecs[r + kk, w] & bits[t]:
+                                for j in range(w, W):
+                                    vecs[r + kk, j] ^= vecs[r + t, j]
+                        bits[kk] = bit
+                        kk += 1
+                        break
+            if kk == 0:
+                continue
+            # Reduce the pivot rows among themselves, so that each has a single pivot bit
+            for t in range(kk):
+                for u in range(kk):
+                    if u != t and vecs[r + u, w] & bits[t]:
+                        for j in range(w, W):
+                            vecs[r + u, j] ^= vecs[r + t, j]
+            for idx in range(1, 1 << kk):
+                t = lowest_bit(np.uint64(idx))
+                for j in range(w, W):
+                    table[idx, j] = table[idx & (idx - 1), j] ^ vecs[r + t, j]
+            for i in range(r + kk, n):
+                idx = 0
+                for t in range(kk):
+                    if vecs[i, w] & bits[t]:
+                        idx |= 1 << t
+                if idx:
+                    for j in range(w, W):
+                        vecs[i, j] ^= table[idx, j]
+            r += kk
+    return r
+
+@njit
+def echelon(vecs):
+    """Brings a set of packed bit vectors to reduced row echelon form in place, pivoting on the lowest set bit.
+
+    Args:
+        vecs (numpy.ndarray): Array of shape (n, W) of uint64 words, one vector per row.
+
+    Returns:
+        tuple: The rank r, and the bit positions of the pivots of the first r rows, in increasing order. Rows from r on are zero.
+    """
+    n, W = vecs.shape
+    pivots = np.empty(min(n, 64 * W), dtype = np.int64)
+    r = 0
+    for w in range(W):
+        for b in range(64):
+            if r == n:
+                return r, pivots[:r]
+            bit = np.uint64(1) << np.uint64(b)
+            pivot = -1
+            for i in range(r, n):
+                if vecs[i, w] & bit:
+                    pivot = i
+                    break
+            if pivot < 0:
+                continue
+            if pivot != r:
+                for k in range(w, W):
+                    tmp = vecs[r, k]
+                    vecs[r, k] = vecs[pivot, k]
+                    vecs[pivot, k] = tmp
+            for i in range(n):
+                if i != r and vecs[i, w] & bit:
+                    for k in range(w, W):
+                        vecs[i, k] ^= vecs[r, k]
+            pivots[r] = 64 * w + b
+            r += 1
+    return r, pivots[:r]
+
+@njit
+def endpoints(vecs):
+    """Finds the lowest and highest set bit of each of a set of packed bit vectors.
+
+    Args:
+        vecs (numpy.ndarray): Array of shape (n, W) of uint64 words, one vector per row.
+
+    Returns:
+        numpy.ndarray: Array of shape (n, 2) containing the lowest and highest set bit of each vector, or -1 for zero vectors.
+    """
+    n, W = vecs.shape
+    ends = -np.ones((n, 2), dtype = np.int64)
+    for i in range(n):
+        for k in range(W):
+            if vecs[i, k] != 0:
+                ends[i, 0] = 64 * k + lowest_bit(vecs[i, k])
+                break
+        for k in range(W - 1, -1, -1):
+            if vecs[i, k] != 0:
+                b = 63
+                while (vecs[i, k] >> np.uint64(b)) & np.uint64(1) == 0:
+                    b -= 1
+                ends[i, 1] = 64 * k + b
+                break
+    return ends
+
+@njit
+def clipped_gauge(vecs):
+    """Brings the packed rows of a stabilizer tableau in interleaved order xz...xz to the clipped gauge, in place.
+
+    The rows are first brought to echelon form from the left, so that at most two rows start on each qubit and they differ
+    there. Then, from the right, each column is cleared from all other unfinished rows by the one starting furthest right,
+    which never moves a left endpoint, so that at most two rows end on each qubit as well.
+
+    Args:
+        vecs (numpy.ndarray): Array of shape (n, W) of uint64 words, one stabilizer per row over 2n columns.
+
+    Returns:
+        None
+    """
+    n, W = vecs.shape
+    echelon(vecs)
+    left = endpoints(vecs)[:, 0] // 2
+    done = np.zeros(n, dtype = np.bool_)
+    for c in range(64 * W - 1, -1, -1):
+        w = c // 64
+        bit = np.uint64(1) << np.uint64(c % 64)
+        pivot = -1
+        for i in range(n):
+            if not done[i] and vecs[i, w] & bit and (pivot < 0 or left[i] > left[pivot]):
+                pivot = i
+        if pivot < 0:
+            continue
+        for i in range(n):
+            if i != pivot and not done[i] and vecs[i, w] & bit:
+                for k in range(W):
+                    vecs[i, k] ^= vecs[pivot, k]
+        done[pivot] = True
+
+@njit
+def insert(basis, owner, r, v):
+    """Reduces a packed bit vector against an echelon basis and appends it if it is independent.
+
+    Every basis vector is stored with its lowest set bit as pivot, so reduction only ever moves the lowest set bit of v upwards.
+
+    Args:
+        basis (numpy.ndarray): Array of shape (n, W) whose first r rows are the basis vectors.
+        owner (numpy.ndarray): Array of length 64 W mapping each bit position to the basis vector pivoting on it, or -1.
+        r (int): The current rank.
+        v (numpy.ndarray): The vector to insert, of length W. Overwritten by its reduction.
+
+    Returns:
+        int: The new rank.
+    """
+    W = v.shape[0]
+    k = 0
+    while k < W:
+        if v[k] == 0:
+            k += 1
+            continue
+        b = 64 * k + lowest_bit(v[k])
+        i = owner[b]
+        if i < 0:
+            basis[r] = v
+            owner[b] = r
+            return r + 1
+        for j in range(k, W):
+            v[j] ^= basis[i, j]
+    return r
+
+@njit
+def insert_listed(basis, pivots, r, v):
+    """Like insert, for a basis of a few vectors whose pivots are listed rather than tabulated over all bit positions.
+
+    Args:
+        basis (numpy.ndarray): Array of shape (n, W) whose first r rows are the basis vectors.
+        pivots (numpy.ndarray): Array of length n whose first r entries are the pivots of the basis vectors.
+        r (int): The current rank.
+        v (numpy.ndarray): The vector to insert, of length W. Overwritten by its reduction.
+
+    Returns:
+        int: The new rank.
+    """
+    W = v.shape[0]
+    k = 0
+    while k < W:
+        if v[k] == 0:
+            k += 1
+            continue
+        b = 64 * k + lowest_bit(v[k])
+        i = -1
+        for a in range(r):
+            if pivots[a] == b:
+                i = a
+                break
+        if i < 0:
+            basis[r] = v
+            pivots[r] = b
+            return r + 1
+        for j in range(k, W):
+            v[j] ^= basis[i, j]
+    return r
@@ -0,0 +1,20 @@
+import sys
+sys.path.insert(0, 'clifford')
+
+from results import ResultsStore, import_tree
+import time
+
+# Parse command line arguments
+import argparse
+parser = argparse.ArgumentParser(
+    description = 'Import result files L_depth_samples_p_D_kind.npy into the results store.',
+    epilog = 'Files that were already imported are skipped, so this can be rerun as new files arrive.'
+)
+parser.add_argument('-d', '--directory', default = 'data')
+parser.add_argument('-o', '--store', default = 'data/results')
+args = parser.parse_args()
+
+start_time = time.time()
+store = ResultsStore(args.store)
+count = import_tree(store, args.directory)
+print("Imported {} files into {} in {:.1f} s, {} results in total.".format(count, args.store, time.time() - start_time, len(store)))
@@ -2,10 +2,17 @@ import sys
 sys.path.insert(0, 'clifford')
 
 import numpy as np
-from MIPT import sample, trip_info
+from archive import StateArchive
+from MIPT import sample_batch, trip_info
+import checkpoint
+from results import ResultsStore
+from stats import RunningStats
+from streams import PARENTS, root_entropy, spawn, stream
+from tasks import info_task
+import tableau
 import time
 import os
-from multiprocess import Pool
+from workers import TrajectoryPool, fork
 
 num_cpus = len(os.sched_getaffinity(0))
 print("Using {} CPUs.".format(num_cpus))
@@ -14,44 +21,31 @@ print("Using {} CPUs.".format(num_cpus))
 import argparse
 parser = argparse.ArgumentParser(
     description = 'Run the Clifford circuit simulation.',
-    epilog = 'Saves mean, std of tripartite information to the data directory.'
+    epilog = 'Saves mean, std of tripartite information to the results store in the data directory.'
 )
 parser.add_argument('-t', type = int, default = 1)
+parser.add_argument('-b', '--batched', action = 'store_true', help = 'evolve all shots as one batch in this process')
+parser.add_argument('-r', '--resume', action = 'store_true', help = 'continue statistics and trajectories from the checkpoint')
+parser.add_argument('--seed', type = int, default = None)
+parser.add_argument('--burn-in', action = 'store_true', help = 'restart every trajectory from the zero state each run')
+parser.add_argument('-e', '--target-error', type = float, default = 0, help = 'stop once every standard error is below this')
+parser.add_argument('-s', '--shots', type = int, default = 32, help = 'number of trajectories')
+parser.add_argument('-T', '--timesteps', type = int, default = 256, help = 'timesteps per trajectory per run')
+parser.add_argument('-m', '--max-runs', type = int, default = 32)
+parser.add_argument('--time-limit', type = float, default = 11, help = 'hours after which no further run is started')
+parser.add_argument('--parents', type = int, default = 0, help = 'burn in this many states and fork the trajectories from them, 0 to burn in every trajectory')
+parser.add_argument('--decorrelation', type = int, default = None, help = 'timesteps a forked trajectory evolves before it is sampled, defaults to depth // 4')
+parser.add_argument('--archive', action = 'store_true', help = 'append the state of every trajectory after each run to the state archive data/states')
 args = parser.parse_args()
-t = args.t
-
-# Parameter space [330]
-# D: {1-5} [5]
-# L: 2**{4-9} [6]
-# p: pc +/- 0.005 [11]
-# depth: L // 2
-
-t -= 1
-# t is 0 to 329
-
-D = 1 + t // 66
-t %= 66
-
-# t is 0 to 65
-L = 2**(4 + t // 11)
-t %= 11
-
-p_dict = {
-    1: 0.16,
-    2: 0.33,
-    3: 0.418,
-    4: 0.458,
-    5: 0.478
-}
-
-# t is 0 to 10
-p = p_dict[D] + 0.001 * (t - 5)
+if args.burn_in and args.parents > 0:
+    parser.error('--burn-in restarts every trajectory from the zero state, which discards the states forked by --parents')
+L, D, p = info_task(args.t)
 
 depth = L // 2
-shots = 32
-timesteps = 256
-TIMELIMIT = 60 * 60 * 11 # 11 hours
-MAXRUNS = 32
+shots = args.shots
+timesteps = args.timesteps
+TIMELIMIT = 60 * 60 * args.time_limit
+MAXRUNS = args.max_runs
 
 N = L * D
 
@@ -63,24 +57,77 @@ f = lambda state: trip_info(state, D)
 
 run = 0
 accumulator = np.zeros(2)
-
-while time.time() - start_time < TIMELIMIT and run < MAXRUNS:
-    with Pool(num_cpus) as pool:
-        results = pool.starmap(lambda: sample(f, L, p, D, timesteps, depth), [[]] * shots)
-    results = np.mean(np.array(results), axis = 0)
+entropy = root_entropy(args.seed) # Trajectory i of run r samples the stream (r, i) below it
+states = [None] * shots
+stats = RunningStats() # Of trajectories that have ended, restarted from the zero state by --burn-in
+trajectory_stats = [RunningStats() for _ in range(shots)] # Of the current trajectories, continued across runs
+
+checkpoint_file = "data/{}_{}_{}_{}_info_checkpoint.npz".format(L, depth, p, D)
+if args.resume and os.path.exists(checkpoint_file):
+    saved = checkpoint.load(checkpoint_file)
+    run = int(saved['run'])
+    accumulator = saved['accumulator']
+    entropy = int(str(saved['entropy']))
+    states = saved['states']
+    stats = saved['stats']
+    trajectory_stats = saved['trajectory_stats']
+    print("Resuming after {} runs.".format(run))
+
+decorrelation = 0
+if args.parents > 0 and states[0] is None:
+    decorrelation = args.decorrelation if args.decorrelation is not None else depth // 4
+    states = fork(L, p, D, depth, spawn(entropy, (PARENTS,), args.parents), shots, num_cpus)
+    print("Forked {} trajectories from {} parents.".format(shots, args.parents))
+
+initial_states = states
+initial_stats = trajectory_stats
+converged = False
+pool = None if args.batched else TrajectoryPool(f, L, p, D, timesteps, depth, num_cpus)
+
+while time.time() - start_time < TIMELIMIT and run < MAXRUNS and not converged:
+    seeds = spawn(entropy, (run,), shots)
+    if args.burn_in:
+        stats.merge(RunningStats.merged(trajectory_stats))
+        trajectory_stats = [RunningStats() for _ in range(shots)]
+    if args.batched:
+        # Like the workers, start from the zero state each run with --burn-in, and else from the last (or forked) states
+        batch = None if args.burn_in or states[0] is None else tableau.StabilizerBatch(np.stack([state.bits for state in states]))
+        run_stats = RunningStats.stack(trajectory_stats)
+        results, batch = sample_batch(f, L, p, D, timesteps, depth, shots, batch, stream(entropy, run), return_states = True, stats = run_stats,
+                                      decorrelation = decorrelation)
+        results = np.mean(results, axis = 0)
+        states = [batch[i] for i in range(shots)]
+        trajectory_stats = [run_stats[i] for i in range(shots)]
+    else:
+        results = 0
+        busy = 0
+        for i, result, state, elapsed, series in pool.run(seeds, initial_states, args.burn_in, decorrelation, initial_stats):
+            results = results + result / shots
+            states[i] = state
+            busy += elapsed
+            trajectory_stats[i] = series
+        initial_states = None
+        initial_stats = None
+        print("Run {}: {:.1f} timesteps/s per worker".format(run + 1, shots * timesteps / busy))
+    decorrelation = 0
     accumulator += results
     run += 1
+    if args.archive:
+        StateArchive().extend(states, L, D, p, depth, timesteps if args.burn_in else run * timesteps, entropy, run - 1)
+    checkpoint.save(checkpoint_file, states = states, stats = stats, trajectory_stats = trajectory_stats, run = run, accumulator = accumulator,
+                    entropy = str(entropy))
+    converged = np.max(RunningStats.merged([stats] + trajectory_stats).error()) < args.target_error
+if pool is not None:
+    pool.close()
 accumulator /= run
 
 mean = accumulator[0]
-std = np.sqrt(accumulator[1] - mean**2) / np.sqrt(run * shots * timesteps)
+# Binning analysis, as timesteps of a trajectory are correlated
+std = RunningStats.merged([stats] + trajectory_stats).error()
 
 result = np.array((mean, std))
 
-stub = "data/{}_{}_{}_{}_{}_".format(L, depth, run * shots * timesteps, p, D)
-
-with open(stub + "info.npy", 'wb') as f:
-    np.save(f, result)
+ResultsStore().append('info', result, L, depth, run * shots * timesteps, p, D, runs = run, elapsed = time.time() - start_time)
 
 end_time = time.strftime('%H:%M:%S', time.gmtime(int(time.time() - start_time)))
 print("L = {}, D = {}, p = {} done in {}, completed {} runs.".format(L, D, p, end_time, run))
\ No newline at end of file
@@ -0,0 +1,78 @@
+import sys
+sys.path.insert(0, 'clifford')
+
+import numpy as np
+from results import ResultsStore
+import scheduler
+from tasks import INFO_P
+import os
+from multiprocess import Process
+from numba import set_num_threads
+num_cpus = len(os.sched_getaffinity(0))
+
+# Parse command line arguments
+import argparse
+parser = argparse.ArgumentParser(
+    description = 'Locate the critical point from the crossing of the tripartite information, sampling adaptively.',
+    epilog = 'init creates a work queue with a coarse grid of p, work pulls tasks from it (and plans further tasks '
+             'near the crossing whenever it runs dry), status prints the current estimate of p_c, and record also appends it '
+             'to the results store.'
+)
+parser.add_argument('command', choices = ['init', 'work', 'status', 'record', 'requeue'])
+parser.add_argument('-q', '--queue', default = None, help = 'queue directory, defaults to data/queue_D')
+parser.add_argument('-D', type = int, default = 1)
+parser.add_argument('-L', type = int, nargs = '+', default = [16, 32, 64, 128])
+parser.add_argument('-p', type = float, nargs = 2, default = None, help = 'range of the coarse grid, defaults to INFO_P[D] +/- 0.008')
+parser.add_argument('-T', '--timesteps', type = int, default = 256)
+parser.add_argument('-e', '--target-error', type = float, default = 0.0002)
+parser.add_argument('-m', '--max-tasks', type = int, default = 4096)
+parser.add_argument('-w', '--workers', type = int, default = num_cpus)
+parser.add_argument('--lease', type = float, default = scheduler.LEASE / 3600, help = 'hours after which a running task is requeued')
+parser.add_argument('--seed', type = int, default = None)
+args = parser.parse_args()
+
+D = args.D
+queue = args.queue if args.queue is not None else "data/queue_{}".format(D)
+
+if args.command == 'init':
+    p_min, p_max = args.p if args.p is not None else (INFO_P[D] - 0.008, INFO_P[D] + 0.008)
+    scheduler.create_queue(queue, D, args.L, p_min, p_max, timesteps = args.timesteps, batch = 4 * args.workers,
+                           target_error = args.target_error, max_tasks = args.max_tasks, lease = 3600 * args.lease, seed = args.seed)
+    print("Created {} with {} tasks.".format(queue, len(scheduler.task_files(queue, 'pending'))))
+
+elif args.command == 'work':
+    print("Working on {} with {} processes.".format(queue, args.workers))
+    def work():
+        set_num_threads(max(1, num_cpus // args.workers)) # Share the CPUs between the workers
+        scheduler.work(queue)
+    processes = [Process(target = work) for _ in range(args.workers)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+elif args.command == 'requeue':
+    print("Requeued {} tasks.".format(scheduler.requeue(queue)))
+
+config = scheduler.load_config(queue)
+points = scheduler.load_points(queue)
+cpu_hours = sum(entry['elapsed'] for entry in points.values()) / 3600
+print("{} trajectories done, {} queued, {:.2f} CPU hours.".format(
+    sum(entry['done'] for entry in points.values()), sum(entry['queued'] for entry in points.values()), cpu_hours))
+for L, p in sorted(points):
+    entry = points[(L, p)]
+    if entry['done'] >= 2:
+        print("L = {:4d}, p = {:.4f}: {:3d} trajectories, -I3 = {:.4f} +/- {:.4f}".format(
+            L, p, entry['done'], float(entry['stats'].mean), float(entry['stats'].error())))
+fit = scheduler.estimate(points, config)
+if fit is not None:
+    (theta, cov, Ls), fitted = fit
+    print("p_c = {:.5f} +/- {:.5f}, -I3(p_c) = {:.4f}, from {} points.".format(theta[0], np.sqrt(cov[0, 0]), theta[1], len(fitted)))
+if args.command == 'record':
+    if fit is None:
+        sys.exit("No estimate of p_c to record yet.")
+    # Recorded at the largest L of the fit, with the trajectories of all fitted points as samples
+    L = int(max(Ls))
+    samples = sum(points[key]['done'] for key in fitted) * config['timesteps']
+    ResultsStore().append('pc', np.array((theta[0], np.sqrt(cov[0, 0]))), L, L // 2, samples, theta[0], D, elapsed = 3600 * cpu_hours)
+    print("Recorded p_c in the results store.")
@@ -0,0 +1,11 @@
+#!/usr/bin/bash
+#SBATCH --job-name=info_adaptive
+#SBATCH --time=12:00:00
+#SBATCH -p hns
+#SBATCH --array=1-16
+#SBATCH -c 8
+#SBATCH --mem-per-cpu=4G
+#SBATCH --mail-type=ALL
+
+# Create the queue once beforehand, e.g. python3 info_adaptive.py init -D 1
+python3 -u info_adaptive.py work -D 1 -w $SLURM_CPUS_PER_TASK
@@ -0,0 +1,114 @@
+import sys
+sys.path.insert(0, 'clifford')
+
+import numpy as np
+from archive import StateArchive
+from MIPT import bip_info, trip_info
+import checkpoint
+from results import ResultsStore
+from stats import RunningStats
+from streams import root_entropy, spawn
+from tasks import info_sweep_task
+import tableau
+import time
+import os
+from workers import TrajectoryPool
+
+num_cpus = len(os.sched_getaffinity(0))
+print("Using {} CPUs.".format(num_cpus))
+
+# Parse command line arguments
+import argparse
+parser = argparse.ArgumentParser(
+    description = 'Run the Clifford circuit simulation for all values of p of an info.py task at once, on coupled trajectories.',
+    epilog = 'Saves mean, std of the information at each p, and of its differences between neighbouring p, to the results store in the data directory.'
+)
+parser.add_argument('-t', type = int, default = 1)
+parser.add_argument('-o', '--observable', default = 'trip', choices = ['trip', 'bip'], help = 'tripartite or bipartite information')
+parser.add_argument('-r', '--resume', action = 'store_true', help = 'continue statistics and trajectories from the checkpoint')
+parser.add_argument('--seed', type = int, default = None)
+parser.add_argument('-e', '--target-error', type = float, default = 0, help = 'stop once every standard error of a difference is below this')
+parser.add_argument('-s', '--shots', type = int, default = 16, help = 'number of coupled sweeps')
+parser.add_argument('-T', '--timesteps', type = int, default = 256, help = 'timesteps per trajectory per run')
+parser.add_argument('-m', '--max-runs', type = int, default = 32)
+parser.add_argument('--time-limit', type = float, default = 11, help = 'hours after which no further run is started')
+parser.add_argument('--archive', action = 'store_true', help = 'append the states of every sweep after each run to the state archive data/states')
+args = parser.parse_args()
+L, D, ps = info_sweep_task(args.t)
+
+depth = L // 2
+shots = args.shots
+timesteps = args.timesteps
+TIMELIMIT = 60 * 60 * args.time_limit
+MAXRUNS = args.max_runs
+P = len(ps)
+
+kind = 'info' if args.observable == 'trip' else 'bip_info'
+observable = trip_info if args.observable == 'trip' else bip_info
+
+start_time = time.time()
+
+print("Sweeping {} for L = {}, D = {}, p = {} to {}:".format(kind, L, D, ps[0], ps[-1]))
+
+def f(states):
+    # The information at each p, then the differences between neighbouring p
+    y = np.array([observable(states[b], D) for b in range(P)])
+    return np.concatenate((y, np.diff(y)))
+
+run = 0
+accumulator = np.zeros(2 * P - 1)
+entropy = root_entropy(args.seed) # Sweep i of run r samples the stream (r, i) below it
+states = [None] * shots
+stats = [RunningStats() for _ in range(shots)] # Of each trajectory, continued across runs
+
+checkpoint_file = "data/{}_{}_{}_{}_{}_sweep_checkpoint.npz".format(L, depth, ps[P // 2], D, kind)
+if args.resume and os.path.exists(checkpoint_file):
+    saved = checkpoint.load(checkpoint_file)
+    run = int(saved['run'])
+    accumulator = saved['accumulator']
+    entropy = int(str(saved['entropy']))
+    states = [tableau.StabilizerBatch(state.bits) for state in saved['states']]
+    stats = saved['trajectory_stats']
+    print("Resuming after {} runs.".format(run))
+
+initial_states = states
+initial_stats = stats
+converged = False
+
+with TrajectoryPool(f, L, ps, D, timesteps, depth, num_cpus) as pool:
+    while time.time() - start_time < TIMELIMIT and run < MAXRUNS and not converged:
+        results = 0
+        busy = 0
+        for i, result, state, elapsed, series in pool.run(spawn(entropy, (run,), shots), initial_states, stats = initial_stats):
+            results = results + result[0] / shots
+            states[i] = state
+            busy += elapsed
+            stats[i] = series
+        initial_states = None
+        initial_stats = None
+        print("Run {}: {:.1f} timesteps/s per worker, each at {} values of p".format(run + 1, shots * timesteps / busy, P))
+        accumulator += results
+        run += 1
+        if args.archive:
+            archive = StateArchive()
+            for i in range(shots):
+                archive.extend(states[i], L, D, ps, depth, run * timesteps, entropy, run - 1, [i] * P)
+        checkpoint.save(checkpoint_file, states = states, trajectory_stats = stats, run = run, accumulator = accumulator, entropy = str(entropy))
+        converged = np.max(RunningStats.merged(stats).error()[P:]) < args.target_error
+accumulator /= run
+
+# Binning analysis, as timesteps of a trajectory are correlated
+std = RunningStats.merged(stats).error()
+samples = run * shots * timesteps
+elapsed = time.time() - start_time
+
+store = ResultsStore()
+store.extend([(kind, np.array((accumulator[k], std[k])), L, depth, samples, ps[k], D, run, elapsed, None, None, '') for k in range(P)]
+             + [(kind + '_diff', np.stack((accumulator[P:], std[P:])), L, depth, samples, ps[P // 2], D, run, elapsed, None, None, '')])
+
+for k in range(P - 1):
+    print("p = {:.4f} to {:.4f}: difference {:.5f} +/- {:.5f}, independent shots would give +/- {:.5f}".format(
+        ps[k], ps[k + 1], accumulator[P + k], std[P + k], np.hypot(std[k], std[k + 1])))
+
+end_time = time.strftime('%H:%M:%S', time.gmtime(int(elapsed)))
+print("L = {}, D = {} done in {}, completed {} runs.".format(L, D, end_time, run))
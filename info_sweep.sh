@@ -0,0 +1,10 @@
+#!/usr/bin/bash
+#SBATCH --job-name=info_sweep
+#SBATCH --time=12:00:00
+#SBATCH -p hns
+#SBATCH --array=1-30
+#SBATCH -c 8
+#SBATCH --mem-per-cpu=4G
+#SBATCH --mail-type=ALL
+
+python3 info_sweep.py -t $SLURM_ARRAY_TASK_ID
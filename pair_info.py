@@ -0,0 +1,95 @@
+import sys
+sys.path.insert(0, 'clifford')
+
+import numpy as np
+from MIPT import binned_pair_info, xi_bins
+import checkpoint
+from results import ResultsStore
+from stats import RunningStats
+from streams import root_entropy, spawn
+from tasks import entropies_task
+import time
+import os
+from workers import TrajectoryPool
+
+num_cpus = len(os.sched_getaffinity(0))
+print("Using {} CPUs.".format(num_cpus))
+
+# Parse command line arguments
+import argparse
+parser = argparse.ArgumentParser(
+    description = 'Run the Clifford circuit simulation for the mutual information of all pairs of blocks against xi, for an S_all.py task.',
+    epilog = 'Saves the mean xi, mean and std of the mutual information in each bin of xi to the results store in the data directory.'
+)
+parser.add_argument('-t', type = int, default = 1)
+parser.add_argument('-r', '--resume', action = 'store_true', help = 'continue statistics and trajectories from the checkpoint')
+parser.add_argument('--seed', type = int, default = None)
+parser.add_argument('--size', type = int, default = 1, help = 'qudits per block')
+parser.add_argument('--bins', type = int, default = 16, help = 'number of logarithmic bins of xi')
+parser.add_argument('-e', '--target-error', type = float, default = 0, help = 'stop once every standard error is below this')
+parser.add_argument('-s', '--shots', type = int, default = 16, help = 'number of trajectories')
+parser.add_argument('-T', '--timesteps', type = int, default = 256, help = 'timesteps per trajectory per run')
+parser.add_argument('-m', '--max-runs', type = int, default = 64)
+parser.add_argument('--time-limit', type = float, default = 18, help = 'hours after which no further run is started')
+args = parser.parse_args()
+L, D, p = entropies_task(args.t)
+
+depth = L // 2
+shots = args.shots
+timesteps = args.timesteps
+TIMELIMIT = 60 * 60 * args.time_limit
+MAXRUNS = args.max_runs
+
+start_time = time.time()
+
+print("Sampling the mutual information of pairs of {} qudits for L = {}, D = {}, p = {}:".format(args.size, L, D, p))
+
+centres, _ = xi_bins(L, args.size, args.bins)
+f = lambda state: binned_pair_info(state, D, args.size, args.bins)
+
+run = 0
+accumulator = np.zeros((2, len(centres)))
+entropy = root_entropy(args.seed) # Trajectory i of run r samples the stream (r, i) below it
+states = [None] * shots
+stats = [RunningStats() for _ in range(shots)] # Of each trajectory, continued across runs
+
+checkpoint_file = "data/{}_{}_{}_{}_{}_pair_info_checkpoint.npz".format(L, depth, p, D, args.size)
+if args.resume and os.path.exists(checkpoint_file):
+    saved = checkpoint.load(checkpoint_file)
+    run = int(saved['run'])
+    accumulator = saved['accumulator']
+    entropy = int(str(saved['entropy']))
+    states = saved['states']
+    stats = saved['trajectory_stats']
+    print("Resuming after {} runs.".format(run))
+
+initial_states = states
+initial_stats = stats
+converged = False
+
+with TrajectoryPool(f, L, p, D, timesteps, depth, num_cpus) as pool:
+    while time.time() - start_time < TIMELIMIT and run < MAXRUNS and not converged:
+        results = 0
+        busy = 0
+        for i, result, state, elapsed, series in pool.run(spawn(entropy, (run,), shots), initial_states, stats = initial_stats):
+            results = results + result / shots
+            states[i] = state
+            busy += elapsed
+            stats[i] = series
+        initial_states = None
+        initial_stats = None
+        print("Run {}: {:.1f} timesteps/s per worker".format(run + 1, shots * timesteps / busy))
+        accumulator += results
+        run += 1
+        checkpoint.save(checkpoint_file, states = states, trajectory_stats = stats, run = run, accumulator = accumulator, entropy = str(entropy))
+        converged = np.max(RunningStats.merged(stats).error()) < args.target_error
+accumulator /= run
+
+mean = accumulator[0]
+# Binning analysis, as timesteps of a trajectory are correlated
+std = RunningStats.merged(stats).error()
+result = np.stack((centres, mean, std))
+ResultsStore().append('pair_info', result, L, depth, run * shots * timesteps, p, D, runs = run, elapsed = time.time() - start_time)
+
+end_time = time.strftime('%H:%M:%S', time.gmtime(int(time.time() - start_time)))
+print("L = {}, D = {}, p = {} done in {}, completed {} runs.".format(L, D, p, end_time, run))
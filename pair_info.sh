@@ -0,0 +1,10 @@
+#!/usr/bin/bash
+#SBATCH --job-name=pair_info
+#SBATCH --time=18:00:00
+#SBATCH -p hns
+#SBATCH --array=12,18,24,30
+#SBATCH -c 16
+#SBATCH --mem-per-cpu=4G
+#SBATCH --mail-type=ALL
+
+python3 -u pair_info.py -t $SLURM_ARRAY_TASK_ID
@@ -0,0 +1,94 @@
+import sys
+sys.path.insert(0, 'clifford')
+
+import os
+import numpy as np
+from cost_model import FEATURES, CostModel, calibrate
+from tasks import DRIVERS
+
+# Parse command line arguments
+import argparse
+parser = argparse.ArgumentParser(
+    description = 'Size the SLURM array tasks of info.py or S_all.py from a calibrated cost model.',
+    epilog = 'calibrate times short runs of sample on one core and writes the cost model, plan predicts the cores, shots, '
+             'timesteps and runs each task needs to reach the target error within the time limit and writes one SLURM '
+             'array script per group of tasks that share them.'
+)
+parser.add_argument('command', choices = ['calibrate', 'plan'])
+parser.add_argument('-k', '--kind', default = 'info', choices = sorted(DRIVERS))
+parser.add_argument('-c', '--cost-model', default = None, help = 'cost model file, defaults to data/cost_<kind>.json')
+parser.add_argument('-L', type = int, nargs = '+', default = [16, 32, 64, 128], help = 'system sizes to calibrate')
+parser.add_argument('-D', type = int, nargs = '+', default = [1, 2, 3, 4, 5], help = 'qubits per qudit to calibrate')
+parser.add_argument('-T', '--timesteps', type = int, default = 32, help = 'timesteps per calibration trajectory')
+parser.add_argument('-s', '--shots', type = int, default = 4, help = 'trajectories per calibration point')
+parser.add_argument('-e', '--target-error', type = float, default = 0.001)
+parser.add_argument('-t', '--tasks', type = int, nargs = '+', default = None, help = 'array indices to plan, defaults to all')
+parser.add_argument('--time', type = float, default = 12, help = 'wall-clock limit of a task in hours')
+parser.add_argument('--cores', type = int, nargs = '+', default = [4, 8, 16, 32])
+parser.add_argument('--partition', default = 'hns')
+parser.add_argument('-o', '--output', default = 'jobs', help = 'directory to write the SLURM scripts to')
+args = parser.parse_args()
+
+task, num_tasks, script, p_dict = DRIVERS[args.kind]
+model_file = args.cost_model if args.cost_model is not None else "data/cost_{}.json".format(args.kind)
+
+def array_range(tasks):
+    """Formats sorted array indices compactly for --array, e.g. 1-11,23."""
+    ranges = []
+    for t in tasks:
+        if ranges and t == ranges[-1][1] + 1:
+            ranges[-1][1] = t
+        else:
+            ranges.append([t, t])
+    return ','.join(str(a) if a == b else "{}-{}".format(a, b) for a, b in ranges)
+
+if args.command == 'calibrate':
+    points = [(L, D, p_dict[D]) for D in args.D for L in args.L]
+    model = calibrate(args.kind, points, args.timesteps, args.shots)
+    os.makedirs(os.path.dirname(model_file) or '.', exist_ok = True)
+    model.save(model_file)
+    print("Saved the cost model to {}, seconds per timestep = {}.".format(
+        model_file, ' + '.join("{:.3g} {}".format(c, name) for c, name in zip(model.step, FEATURES))))
+    for L, D, p, step in model.points:
+        print("L = {:4d}, D = {}: measured {:.3g} s, predicted {:.3g} s per timestep".format(L, D, step, model.step_time(L, D, p)))
+
+elif args.command == 'plan':
+    model = CostModel.load(model_file)
+    if model.kind != args.kind:
+        parser.error("{} was calibrated for {}, not {}".format(model_file, model.kind, args.kind))
+    time_limit = 3600 * args.time
+    groups = {}
+    for t in (args.tasks if args.tasks is not None else range(1, num_tasks + 1)):
+        L, D, p = task(t)
+        plan = model.recommend(L, D, p, args.target_error, time_limit, cores = args.cores)
+        # Request whole hours, with room for the last run and the final save
+        hours = min(args.time, np.ceil((1.2 * plan['seconds'] + plan['run_seconds']) / 3600))
+        print("t = {:3d}, L = {:4d}, D = {}, p = {:.4f}: {:2d} cores, {:3d} shots x {:3d} timesteps x {:4d} runs, "
+              "{:6.2f} h, error {:.2g}{}".format(t, L, D, p, plan['cores'], plan['shots'], plan['timesteps'], plan['runs'],
+                                                 plan['seconds'] / 3600, plan['error'], '' if plan['fits'] else ' (exceeds the time limit)'))
+        key = (plan['cores'], plan['shots'], plan['timesteps'], hours)
+        entry = groups.setdefault(key, {'tasks': [], 'runs': 0, 'run_seconds': 0})
+        entry['tasks'].append(t)
+        entry['runs'] = max(entry['runs'], plan['runs'])
+        entry['run_seconds'] = max(entry['run_seconds'], plan['run_seconds'])
+
+    os.makedirs(args.output, exist_ok = True)
+    print("{} tasks in {} jobs:".format(sum(len(entry['tasks']) for entry in groups.values()), len(groups)))
+    for i, ((cores, shots, timesteps, hours), entry) in enumerate(sorted(groups.items())):
+        name = "{}_{}".format(args.kind, i + 1)
+        # No run is started after the driver's time limit, so leave a run and a half before the SLURM limit
+        driver_limit = max(0, hours - 1.5 * entry['run_seconds'] / 3600)
+        path = os.path.join(args.output, name + '.sh')
+        with open(path, 'w') as f:
+            f.write("#!/usr/bin/bash\n")
+            f.write("#SBATCH --job-name={}\n".format(name))
+            f.write("#SBATCH --time={:d}:00:00\n".format(int(hours)))
+            f.write("#SBATCH -p {}\n".format(args.partition))
+            f.write("#SBATCH --array={}\n".format(array_range(sorted(entry['tasks']))))
+            f.write("#SBATCH -c {}\n".format(cores))
+            f.write("#SBATCH --mem-per-cpu=4G\n")
+            f.write("#SBATCH --mail-type=ALL\n\n")
+            f.write("python3 -u {} -t $SLURM_ARRAY_TASK_ID -s {} -T {} -m {} -e {} --time-limit {:.2f}\n".format(
+                script, shots, timesteps, entry['runs'], args.target_error, driver_limit))
+        print("{}: {:3d} tasks, {:2d} cores, {:3d} shots x {:3d} timesteps, up to {} runs, {:.0f} h".format(
+            path, len(entry['tasks']), cores, shots, timesteps, entry['runs'], hours))
@@ -0,0 +1,43 @@
+import sys
+sys.path.insert(0, '..')
+
+from qiskit_clifford import make, run, simulate, entropy
+import numpy as np
+import time
+
+import argparse
+parser = argparse.ArgumentParser(
+    description = 'Benchmark batched against one-at-a-time simulation of random Clifford circuits.',
+    epilog = 'Prints shots per second of both paths, and checks that they give the same entropies for the same seeds.'
+)
+parser.add_argument('-n', '--n_qubits', type = int, default = 64)
+parser.add_argument('-T', type = int, default = 32)
+parser.add_argument('-p', type = float, default = 0.06)
+parser.add_argument('-s', '--shots', type = int, default = 64)
+parser.add_argument('-b', '--batch', type = int, default = 64)
+parser.add_argument('--seed', type = int, default = 0)
+args = parser.parse_args()
+
+n_qubits = args.n_qubits
+T = args.T
+p = args.p
+shots = args.shots
+
+# The same seeds as simulate draws, so both paths simulate the same circuits
+seeds = np.random.SeedSequence(args.seed).generate_state(shots, dtype = np.uint64).tolist()
+
+start_time = time.time()
+S_serial = []
+for seed in seeds:
+    result = run(make(n_qubits, T, p, seed = seed), shots = 1)
+    S_serial.append(entropy(result.data()['t'+str(2*T-1)][0].stab.astype(int), n_qubits // 2))
+time_serial = time.time() - start_time
+
+start_time = time.time()
+S_batch = [entropy(cliff, n_qubits // 2) for cliff in simulate(n_qubits, T, p, shots, batch = args.batch, seed = args.seed)]
+time_batch = time.time() - start_time
+
+# Measurement outcomes only change signs, so the entropies agree exactly
+assert S_serial == S_batch
+print("n = {}, T = {}, p = {}, {} shots: {:.2f} shots/s one at a time, {:.2f} shots/s batched, {:.1f}x".format(
+    n_qubits, T, p, shots, shots / time_serial, shots / time_batch, time_serial / time_batch))
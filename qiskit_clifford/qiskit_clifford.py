@@ -1,13 +1,15 @@
 from qiskit import QuantumRegister, ClassicalRegister, QuantumCircuit, transpile
-from qiskit.providers.aer import Aer
+from qiskit_aer import Aer
 from qiskit.quantum_info import random_clifford
+from multiprocess import Pool
+import os
+import pickle
 import random
 
 import numpy as np
-import galois
-GF = galois.GF(2)
+import gf2
 
-def make(n_qubits, T, p, save_intermediate = False):
+def make(n_qubits, T, p, save_intermediate = False, seed = None, decompose = False, initial = None, t0 = 0):
     """Generate a random Clifford QuantumCircuit.
 
     Args:
@@ -15,6 +17,10 @@ def make(n_qubits, T, p, save_intermediate = False):
         T (int): 2 * number of time steps
         p (float): probability of measurement
         save_intermediate (bool): whether to save the state after each time step
+        seed (int): seed for the gates and measurement positions, or None to use the global random state
+        decompose (bool): whether to add the gates as H, S and CX, which the stabilizer simulator runs without transpiling
+        initial (qiskit.quantum_info.Clifford): state to start from instead of the zero state
+        t0 (int): number of time steps before this circuit, added to the labels of the saved states
     
     Returns:
         A QuantumCircuit object.
@@ -22,39 +28,79 @@ def make(n_qubits, T, p, save_intermediate = False):
     qr = QuantumRegister(n_qubits, 'q')
     cr = ClassicalRegister(n_qubits, 'c')
     circ = QuantumCircuit(qr, cr)
+    if initial is not None:
+        circ.set_stabilizer(initial)
+    rng = random if seed is None else random.Random(seed)
+    np_rng = None if seed is None else np.random.default_rng(seed)
+
+    def gate(q1, q2):
+        cliff = random_clifford(2, seed = np_rng)
+        if decompose:
+            circ.compose(cliff.to_circuit(), [q1, q2], inplace = True)
+        else:
+            circ.append(cliff, [q1, q2])
 
     for t in range(T):
         # Layer 1
         for i in range(n_qubits // 2):
-            circ.append(random_clifford(2), [qr[2*i], qr[2*i+1]])
+            gate(qr[2*i], qr[2*i+1])
         
         for i in range(n_qubits):
-            if random.random() < p:
+            if rng.random() < p:
                 circ.measure(qr[i], cr[i])
         
         if save_intermediate:
-            circ.save_clifford(pershot = True, label = "t"+str(2*t))
+            circ.save_clifford(pershot = True, label = "t"+str(2*(t0+t)))
 
         # Layer 2
         for j in range((n_qubits - 1) // 2):
-            circ.append(random_clifford(2), [qr[2*j+1], qr[2*j+2]])
+            gate(qr[2*j+1], qr[2*j+2])
         
         # Periodic boundary conditions
         if n_qubits % 2 == 0:
-            circ.append(random_clifford(2), [qr[-1], qr[0]])
+            gate(qr[-1], qr[0])
         
         for j in range(n_qubits):
-            if random.random() < p:
+            if rng.random() < p:
                 circ.measure(qr[j], cr[j])
 
         if save_intermediate:
-            circ.save_clifford(pershot = True, label = "t"+str(2*t+1))
+            circ.save_clifford(pershot = True, label = "t"+str(2*(t0+t)+1))
 
     # Save final state
     if not save_intermediate:
-        circ.save_clifford(pershot = True, label = "t"+str(2*T-1))
+        circ.save_clifford(pershot = True, label = "t"+str(2*(t0+T)-1))
     return circ
 
+def make_batch(n_qubits, T, p, seeds, save_intermediate = False, processes = None, initial = None, t0 = 0):
+    """Generate random Clifford QuantumCircuits in parallel, ready to run without transpiling.
+
+    Args:
+        n_qubits (int): number of qubits
+        T (int): 2 * number of time steps
+        p (float): probability of measurement
+        seeds (list): seed of each circuit, see make
+        save_intermediate (bool): whether to save the state after each time step
+        processes (int): number of processes, or None for one per CPU; with 1 the circuits are generated in this process
+        initial (list): state to start each circuit from, see make, or None to start all from the zero state
+        t0 (int): number of time steps before these circuits, see make
+
+    Returns:
+        A list of QuantumCircuit objects.
+    """
+    if initial is None:
+        initial = [None] * len(seeds)
+    def build(seed, state):
+        return make(n_qubits, T, p, save_intermediate, seed = seed, decompose = True, initial = state, t0 = t0)
+    if processes is None:
+        processes = len(os.sched_getaffinity(0))
+    if processes == 1:
+        return [build(seed, state) for seed, state in zip(seeds, initial)]
+    # Circuits are sent back pickled, which is an order of magnitude faster than the dill of multiprocess
+    with Pool(processes) as pool:
+        circs = pool.starmap(lambda seed, state: pickle.dumps(build(seed, state)), zip(seeds, initial))
+    return [pickle.loads(circ) for circ in circs]
+
 def draw(circ):
     """Draw a Clifford QuantumCircuit.
     
@@ -79,31 +125,97 @@ def run(circ, shots = 1):
         A Result object containing a list of stabilizer states.
     """
     simulator = Aer.get_backend('aer_simulator_stabilizer')
-    circ = transpile(circ, simulator)
+    # Higher optimization levels merge phase gates into rz rotations, which the stabilizer method rejects
+    circ = transpile(circ, simulator, optimization_level = 0)
     result = simulator.run(circ, shots = shots).result()
     return result
 
+def run_batch(circs, max_parallel_experiments = 0):
+    """Run decomposed Clifford QuantumCircuits (see make_batch) on the stabilizer simulator in a single job.
+
+    Args:
+        circs (list): QuantumCircuit objects containing only gates native to the stabilizer simulator
+        max_parallel_experiments (int): number of circuits Aer simulates at once, 0 for as many as there are CPUs
+
+    Returns:
+        A Result object containing one experiment, with a list of stabilizer states, per circuit.
+    """
+    simulator = Aer.get_backend('aer_simulator_stabilizer')
+    return simulator.run(circs, shots = 1, max_parallel_experiments = max_parallel_experiments).result()
+
+def simulate(n_qubits, T, p, shots, batch = 64, seed = None, processes = None):
+    """Generate and simulate random Clifford circuits in batches, one job per batch.
+
+    Args:
+        n_qubits (int): number of qubits
+        T (int): 2 * number of time steps
+        p (float): probability of measurement
+        shots (int): number of circuits
+        batch (int): number of circuits per job
+        seed (int): seed from which the seeds of the circuits are drawn, or None for fresh entropy
+        processes (int): number of processes generating circuits, or None for one per CPU
+
+    Yields:
+        The Clifford matrix X|Z of the final state of each circuit, as a numpy.ndarray of shape (n_qubits, 2 * n_qubits + 1).
+    """
+    seeds = np.random.SeedSequence(seed).generate_state(shots, dtype = np.uint64).tolist()
+    for start in range(0, shots, batch):
+        circs = make_batch(n_qubits, T, p, seeds[start:start+batch], processes = processes)
+        result = run_batch(circs)
+        for i in range(len(circs)):
+            yield result.data(i)['t'+str(2*T-1)][0].stab.astype(int)
+
+def observe(n_qubits, T, p, f, shots = 1, segment = 8, batch = 64, seed = None, processes = None):
+    """Evaluate an observable after every layer of random Clifford circuits, keeping only a few snapshots in memory.
+
+    The circuits are simulated in segments of a few time steps, each starting from the last state of the previous one,
+    with the segments of a batch of shots generated by make_batch and run as one job by run_batch. The snapshots of a
+    segment are passed to f and discarded, so memory grows with batch * segment but not with T.
+
+    Args:
+        n_qubits (int): number of qubits
+        T (int): 2 * number of time steps
+        p (float): probability of measurement
+        f (function): the observable, taking a Clifford matrix X|Z of shape (n_qubits, 2 * n_qubits + 1), e.g.
+            lambda cliff: entropy(cliff, n_qubits // 2) or lambda cliff: counts_B(B(clipped_gauge(cliff)))
+        shots (int): number of circuits
+        segment (int): number of time steps per segment
+        batch (int): number of circuits per job
+        seed (int): seed from which the seeds of the segments are drawn, or None for fresh entropy
+        processes (int): number of processes generating circuits, or None for one per CPU
+
+    Returns:
+        A numpy.ndarray of shape (shots, 2 * T, ...) containing f after every layer of each circuit.
+    """
+    n_segments = (T + segment - 1) // segment
+    seeds = np.random.SeedSequence(seed).generate_state(shots * n_segments, dtype = np.uint64).reshape(shots, n_segments)
+    values = [[] for _ in range(shots)]
+    for start in range(0, shots, batch):
+        stop = min(start + batch, shots)
+        states = [None] * (stop - start)
+        for i, t0 in enumerate(range(0, T, segment)):
+            steps = min(segment, T - t0)
+            circs = make_batch(n_qubits, steps, p, seeds[start:stop, i].tolist(), save_intermediate = True,
+                               processes = processes, initial = states, t0 = t0)
+            result = run_batch(circs)
+            for j in range(len(circs)):
+                data = result.data(j)
+                for t in range(2*t0, 2*(t0+steps)):
+                    states[j] = data.pop('t'+str(t))[0]
+                    values[start + j].append(f(states[j].stab.astype(int)))
+            del result
+    return np.array(values)
+
 def B(G):
     """Compute bigrams of a stabilizer tableau.
 
     Args:
-        G (galois.FieldArray): a stabilizer tableau xz...xz of shape (n_qubits, 2 * n_qubits)
-        n_qubits (int): number of qubits
+        G (numpy.ndarray): a stabilizer tableau xz...xz of shape (n_qubits, 2 * n_qubits)
     
     Returns:
         A numpy.ndarray of shape (n_qubits, 2) containing the bigrams.
     """
-    n_qubits = G.shape[0]
-    rv = []
-    for i in range(n_qubits): # loop through rows
-        l = np.inf
-        r = -np.inf
-        for j in range(n_qubits): # loop through columns
-            if G[i, 2*j] == 1 or G[i, 2*j+1] == 1:
-                l = min(l, j)
-                r = max(r, j)
-        rv.append((l, r))
-    return np.array(rv)
+    return gf2.endpoints(gf2.pack(G)) // 2
 
 def counts_B(bigrams):
     """Dev tool to count the number of occurrences of each endpoint.
@@ -115,11 +227,8 @@ def counts_B(bigrams):
         A numpy.ndarray of shape (n_qubits, 2) containing rho_l, rho_r, and rho.
     """
     n_qubits = bigrams.shape[0]
-    rho_l = np.zeros(n_qubits, dtype = int)
-    rho_r = np.zeros(n_qubits, dtype = int)
-    for i in range(n_qubits):
-        rho_l[i] = np.count_nonzero(bigrams[:, 0] == i)
-        rho_r[i] = np.count_nonzero(bigrams[:, 1] == i)
+    rho_l = np.bincount(bigrams[:, 0], minlength = n_qubits)
+    rho_r = np.bincount(bigrams[:, 1], minlength = n_qubits)
     rho = rho_l + rho_r
     return np.stack((rho_l, rho_r, rho), axis = 1)
 
@@ -135,57 +244,44 @@ def entropy_B(bigrams, A):
     """
     return np.count_nonzero(np.logical_and(bigrams[:, 0] < A, bigrams[:, 1] >= A)) / 2
 
-def entropy(cliff, A):
-    """Compute the entanglement entropy of a subsystem of a stabilizer state.
+def interleave(cliff):
+    """Convert a Clifford matrix to a stabilizer tableau in the standard order of qubits.
 
     Args:
         cliff (numpy.ndarray): a Clifford matrix X|Z of shape (n_qubits, 2 * n_qubits + 1)
-        A (int): number of qubits in the subsystem of interest
 
     Returns:
-        The entanglement entropy of the subsystem.
+        A numpy.ndarray of shape (n_qubits, 2 * n_qubits) containing the stabilizer tableau xz...xz.
     """
-    tableau = GF(cliff)[:, :-1] # Discard parity bit
+    tableau = np.asarray(cliff)[:, :-1] # Discard parity bit
     n_qubits = tableau.shape[0]
-    # Convert from X|Z to xz...xz, and standard order of qubits
     stab = np.empty_like(tableau)
     stab[:, 0::2] = tableau[:, n_qubits-1::-1]
     stab[:, 1::2] = tableau[:, :n_qubits-1:-1]
+    return stab
+
+def entropy(cliff, A):
+    """Compute the entanglement entropy of a subsystem of a stabilizer state.
 
-    return np.linalg.matrix_rank(stab[:,:2*A]) - A
+    Args:
+        cliff (numpy.ndarray): a Clifford matrix X|Z of shape (n_qubits, 2 * n_qubits + 1)
+        A (int): number of qubits in the subsystem of interest
+
+    Returns:
+        The entanglement entropy of the subsystem.
+    """
+    return gf2.rank(gf2.pack(interleave(cliff)[:, :2*A])) - A
 
 def clipped_gauge(cliff):
-    """(TODO) Compute the clipped gauge of a stabilizer state.
+    """Compute the clipped gauge of a stabilizer state, see gf2.clipped_gauge.
 
     Args:
         cliff (numpy.ndarray): a Clifford matrix X|Z of shape (n_qubits, 2 * n_qubits + 1)
     
     Returns:
-        A galois.FieldArray of shape (n_qubits, 2 * n_qubits) containing the stabilizer tableau in the clipped gauge.
+        A numpy.ndarray of shape (n_qubits, 2 * n_qubits) containing the stabilizer tableau in the clipped gauge.
     """
-    tableau = GF(cliff)[:, :-1] # Discard parity bit
-    n_qubits = tableau.shape[0]
-    # Convert from X|Z to xz...xz, and standard order of qubits
-    stab = np.empty_like(tableau)
-    stab[:, 0::2] = tableau[:, n_qubits-1::-1]
-    stab[:, 1::2] = tableau[:, :n_qubits-1:-1]
-
-    # Pregauge transformation
-    stab = stab.row_reduce()
-    # Gauge transformation (TODO)
-    rev = stab[::-1, ::-1]
-    rowset = set()
-    for j in range(2 * n_qubits):
-        col = rev[:, j]
-        rows = np.nonzero(col)[0]
-        if len(rows) == 0:
-            continue
-        if len(rows) == 1:
-            rowset.add(rows[0])
-            continue
-        for i, row in enumerate(rows):
-            if row not in rowset:
-                rowset.add(row)
-                if i != len(rows) - 1:
-                    rev[rows[i+1:],:] += rev[row,:]
-    return rev[::-1, ::-1]
\ No newline at end of file
+    stab = interleave(cliff)
+    packed = gf2.pack(stab)
+    gf2.clipped_gauge(packed)
+    return gf2.unpack(packed, stab.shape[1])
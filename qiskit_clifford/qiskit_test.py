@@ -1,4 +1,7 @@
-from qiskit_clifford import make, draw, run
+import sys
+sys.path.insert(0, '..')
+
+from qiskit_clifford import make, draw, run, simulate, observe
 from qiskit_clifford import B, clipped_gauge, entropy
 import numpy as np
 from matplotlib import pyplot as plt
@@ -13,24 +16,30 @@ parser.add_argument('-n', '--n_qubits', type = int, default = 512)
 parser.add_argument('-T', type = int, default = 150)
 parser.add_argument('-p', type = float, default = 0.06)
 parser.add_argument('-s', '--shots', type = int, default = 1)
+parser.add_argument('-b', '--batch', type = int, default = 64, help = 'circuits per simulator job')
+parser.add_argument('--serial', action = 'store_true', help = 'generate, transpile and run one circuit at a time')
+parser.add_argument('--intermediate', action = 'store_true', help = 'record the entropy after every layer, see observe')
 args = parser.parse_args()
 
 n_qubits = args.n_qubits
 T = args.T
 p = args.p
 shots = args.shots
+batch = args.batch
 
-cliffords = []
 print("Generating and simulating circuits:")
-for _ in tqdm(range(shots)):
-    circ = make(n_qubits, T, p, save_intermediate = False)
-    # draw(circ)
-    result = run(circ, shots = 1)
-    cliffords.append(result.data()['t'+str(2*T-1)][0].stab.astype(int)) # Append the final state stabilizer matrix
-
-print("Calculating entropies:")
-S = [entropy(cliff, n_qubits // 2) for cliff in tqdm(cliffords)]
-np.savetxt("S_{}_{}_{}_{}.out".format(n_qubits, T, p, shots), S)
+if args.serial:
+    S = []
+    for _ in tqdm(range(shots)):
+        circ = make(n_qubits, T, p, save_intermediate = False)
+        # draw(circ)
+        result = run(circ, shots = 1)
+        S.append(entropy(result.data()['t'+str(2*T-1)][0].stab.astype(int), n_qubits // 2)) # Entropy of the final state
+elif args.intermediate:
+    S = observe(n_qubits, T, p, lambda cliff: entropy(cliff, n_qubits // 2), shots = shots, batch = batch) # S[shot, t]
+else:
+    S = [entropy(cliff, n_qubits // 2) for cliff in tqdm(simulate(n_qubits, T, p, shots, batch = batch), total = shots)]
+np.savetxt("S_{}_{}_{}_{}{}.out".format(n_qubits, T, p, shots, "_t" if args.intermediate else ""), S)
 
-plt.hist(S)
+plt.hist(np.reshape(S, (shots, -1))[:, -1]) # Final states
 plt.show()
\ No newline at end of file
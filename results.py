@@ -0,0 +1,339 @@
+import os
+import re
+import socket
+import subprocess
+import time
+from contextlib import contextmanager
+import numpy as np
+
+# A results store is a directory holding index.bin, the records of all results back to back as a structured array, and
+# values.f8, the flattened values of all results back to back as float64. Both are only ever appended to, so an append
+# costs time proportional to its size, and are memory-mapped for reading, so a query touches two files however many
+# results there are.
+
+MAX_DIMS = 3
+
+RECORD = np.dtype([
+    ('kind', 'U16'),        # What was sampled, e.g. 'info' or 'entropies_all'
+    ('L', 'i8'),            # The number of qudits
+    ('depth', 'i8'),        # The depth of the circuit
+    ('samples', 'i8'),      # The number of samples: shots, or shots x timesteps (x runs)
+    ('p', 'f8'),            # The measurement probability
+    ('D', 'i8'),            # The number of qubits per qudit
+    ('runs', 'i8'),         # The number of runs, 0 if unknown
+    ('elapsed', 'f8'),      # The wall time in seconds, NaN if unknown
+    ('created', 'f8'),      # The time the result was written, in seconds since the epoch
+    ('version', 'U40'),     # The git commit of the code, empty if unknown
+    ('source', 'U64'),      # The file the result was imported from, empty if none
+    ('offset', 'i8'),       # The position of the first value in values.f8
+    ('ndim', 'i8'),
+    ('shape', 'i8', (MAX_DIMS,))
+])
+
+FILENAME = re.compile(r'^(\d+)_(\d+)_(\d+)_([0-9.e-]+)_(\d+)_(\w+)\.npy$')
+
+def code_version():
+    """Returns the git commit of this code, or an empty string if it is not in a git repository."""
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd = os.path.dirname(os.path.abspath(__file__)),
+                              capture_output = True, text = True, check = True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+def lock_holder(path):
+    """Returns the host and PID of the holder of a lock file (see lock), its age in seconds and its inode, or None if it is gone."""
+    try:
+        with open(path) as f:
+            fields = f.read().split()
+            stat = os.fstat(f.fileno())
+    except FileNotFoundError:
+        return None
+    host, pid = (fields[0], int(fields[1])) if len(fields) == 2 else (None, None) # Still being written
+    return host, pid, time.time() - stat.st_mtime, stat.st_ino
+
+def is_stale(holder, stale):
+    """Returns whether a lock file was left behind by a killed process, given its lock_holder."""
+    host, pid, age, _ = holder
+    if age > stale:
+        return True
+    if host == socket.gethostname():
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return True
+        except PermissionError:
+            pass
+    return False
+
+def break_lock(path, inode):
+    """Removes a stale lock file, unless another process replaced it since it was found stale.
+
+    Args:
+        path (str): The lock file.
+        inode (int): The inode of the stale lock file.
+
+    Returns:
+        None
+    """
+    moved = "{}.{}.{}".format(path, socket.gethostname(), os.getpid())
+    try:
+        os.rename(path, moved)
+    except FileNotFoundError:
+        return
+    if os.stat(moved).st_ino != inode:
+        # A fresh lock was moved instead, hand it back unless yet another one exists by now
+        try:
+            os.link(moved, path)
+        except FileExistsError:
+            pass
+    os.remove(moved)
+
+@contextmanager
+def lock(path, timeout = 1800, stale = 600):
+    """Holds a lock file for the duration of a with block, waiting while another process holds it.
+
+    The lock file holds the host and PID of its holder. A lock older than stale seconds, or held by a process of this
+    host that no longer exists, was left behind by a killed job and is broken.
+
+    Args:
+        path (str): The lock file.
+        timeout (float, optional): The seconds to wait for the lock. Defaults to 1800.
+        stale (float, optional): The age in seconds beyond which a lock is broken. Defaults to 600.
+
+    Raises:
+        TimeoutError: If the lock was not obtained within timeout seconds.
+    """
+    start_time = time.time()
+    while True:
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            holder = lock_holder(path)
+            if holder is None:
+                continue
+            if is_stale(holder, stale):
+                break_lock(path, holder[3])
+                continue
+            if time.time() - start_time > timeout:
+                raise TimeoutError("Could not obtain {} within {} s, held by {} on {}".format(path, timeout, holder[1], holder[0]))
+            time.sleep(0.1) # Another process holds it
+    try:
+        inode = os.fstat(fd).st_ino
+        os.write(fd, "{} {}\n".format(socket.gethostname(), os.getpid()).encode())
+    finally:
+        os.close(fd)
+    try:
+        yield
+    finally:
+        # Unless the lock was broken as stale meanwhile, and taken by another process
+        try:
+            if os.stat(path).st_ino == inode:
+                os.remove(path)
+        except FileNotFoundError:
+            pass
+
+def read_log(path, dtype):
+    """Returns the records of an append-only log file written by append_log, memory-mapped read-only.
+
+    Args:
+        path (str): The log file.
+        dtype (numpy.dtype): The structured type of the records.
+
+    Returns:
+        numpy.ndarray: The complete records; a partial one left by a killed writer is ignored.
+    """
+    count = os.path.getsize(path) // dtype.itemsize if os.path.exists(path) else 0
+    if count == 0:
+        return np.zeros(0, dtype = dtype)
+    return np.memmap(path, dtype = dtype, mode = 'r', shape = (count,))
+
+def append_log(path, records):
+    """Appends records to an append-only log file, in time proportional to their number. Call it while holding a lock.
+
+    Args:
+        path (str): The log file.
+        records (numpy.ndarray): The structured records.
+
+    Returns:
+        None
+    """
+    size = os.path.getsize(path) if os.path.exists(path) else 0
+    with open(path, 'ab') as f:
+        f.truncate(size - size % records.dtype.itemsize) # Drop a partial record left by a killed writer
+        f.write(np.ascontiguousarray(records).tobytes())
+
+def parse_filename(filename):
+    """Parses the parameters encoded in a result file name L_depth_samples_p_D_kind.npy.
+
+    Args:
+        filename (str): The file name.
+
+    Returns:
+        dict: The parameters, or None if the name does not match.
+    """
+    match = FILENAME.match(os.path.basename(filename))
+    if match is None:
+        return None
+    L, depth, samples, p, D, kind = match.groups()
+    return {'kind': kind, 'L': int(L), 'depth': int(depth), 'samples': int(samples), 'p': float(p), 'D': int(D)}
+
+class ResultsStore:
+    """An append-only store of results, see the module comment. Appends are serialised between processes by a lock file.
+
+    Args:
+        path (str, optional): The store directory, created if necessary. Defaults to 'data/results'.
+    """
+    def __init__(self, path = 'data/results'):
+        self.path = path
+        os.makedirs(path, exist_ok = True)
+        self.index_file = os.path.join(path, 'index.bin')
+        self.values_file = os.path.join(path, 'values.f8')
+
+    @property
+    def index(self):
+        """The records of all results."""
+        return read_log(self.index_file, RECORD)
+
+    def __len__(self):
+        return len(self.index)
+
+    def append(self, kind, value, L, depth, samples, p, D, runs = 0, elapsed = np.nan, created = None, version = None, source = ''):
+        """Appends a result.
+
+        Args:
+            kind (str): What was sampled, e.g. 'info' or 'entropies_all'.
+            value (numpy.ndarray): The result, e.g. rows of mean and standard error, with at most 3 dimensions.
+            L (int): The number of qudits.
+            depth (int): The depth of the circuit.
+            samples (int): The number of samples.
+            p (float): The measurement probability.
+            D (int): The number of qubits per qudit.
+            runs (int, optional): The number of runs. Defaults to 0 (unknown).
+            elapsed (float, optional): The wall time in seconds. Defaults to NaN (unknown).
+            created (float, optional): The time the result was written. Defaults to None (now).
+            version (str, optional): The git commit of the code. Defaults to None (the current one).
+            source (str, optional): The file the result was imported from. Defaults to ''.
+
+        Returns:
+            None
+        """
+        self.extend([(kind, value, L, depth, samples, p, D, runs, elapsed, created, version, source)])
+
+    def extend(self, results):
+        """Appends several results at once, each a tuple of the arguments of append.
+
+        Args:
+            results (list): The results.
+
+        Returns:
+            None
+        """
+        with lock(os.path.join(self.path, 'store.lock')):
+            offset = os.path.getsize(self.values_file) // 8 if os.path.exists(self.values_file) else 0
+            records = np.zeros(len(results), dtype = RECORD)
+            default_version = None
+            with open(self.values_file, 'ab') as f:
+                for record, (kind, value, L, depth, samples, p, D, runs, elapsed, created, version, source) in zip(records, results):
+                    value = np.asarray(value, dtype = np.float64)
+                    if value.ndim > MAX_DIMS:
+                        raise ValueError("Results have at most {} dimensions, got {}".format(MAX_DIMS, value.ndim))
+                    if version is None:
+                        if default_version is None:
+                            default_version = code_version()
+                        version = default_version
+                    record['kind'] = kind
+                    record['L'] = L
+                    record['depth'] = depth
+                    record['samples'] = samples
+                    record['p'] = p
+                    record['D'] = D
+                    record['runs'] = runs
+                    record['elapsed'] = elapsed
+                    record['created'] = time.time() if created is None else created
+                    record['version'] = version
+                    record['source'] = source
+                    record['offset'] = offset
+                    record['ndim'] = value.ndim
+                    record['shape'][:value.ndim] = value.shape
+                    f.write(np.ascontiguousarray(value).tobytes())
+                    offset += value.size
+            append_log(self.index_file, records)
+
+    def query(self, kind = None, L = None, depth = None, samples = None, p = None, D = None, latest = False):
+        """Selects records by their parameters. Each parameter may be a single value or a list of values.
+
+        Args:
+            kind (str, optional): What was sampled. Defaults to None (any).
+            L (int, optional): The number of qudits. Defaults to None (any).
+            depth (int, optional): The depth of the circuit. Defaults to None (any).
+            samples (int, optional): The number of samples. Defaults to None (any).
+            p (float, optional): The measurement probability, matched to 1e-9. Defaults to None (any).
+            D (int, optional): The number of qubits per qudit. Defaults to None (any).
+            latest (bool, optional): Whether to keep only the most recent record of each (kind, L, depth, p, D). Defaults to False.
+
+        Returns:
+            numpy.ndarray: The matching records, ordered by creation time.
+        """
+        index = self.index
+        mask = np.ones(len(index), dtype = bool)
+        for field, value in (('kind', kind), ('L', L), ('depth', depth), ('samples', samples), ('D', D)):
+            if value is not None:
+                mask &= np.isin(index[field], np.atleast_1d(value))
+        if p is not None:
+            mask &= np.any(np.abs(index['p'][:, None] - np.atleast_1d(p)[None, :]) < 1e-9, axis = 1)
+        records = np.array(index[mask])
+        records = records[np.argsort(records['created'], kind = 'stable')]
+        if latest:
+            _, last = np.unique(records[['kind', 'L', 'depth', 'p', 'D']][::-1], return_index = True)
+            records = records[np.sort(len(records) - 1 - last)]
+        return records
+
+    def load(self, record):
+        """Returns the value of a record."""
+        values = np.memmap(self.values_file, dtype = np.float64, mode = 'r')
+        shape = tuple(record['shape'][:record['ndim']])
+        return np.array(values[record['offset'] : record['offset'] + int(np.prod(shape))]).reshape(shape)
+
+    def load_all(self, records):
+        """Returns the values of several records, stacked along a new first axis if they share their shape.
+
+        Args:
+            records (numpy.ndarray): The records, e.g. from query.
+
+        Returns:
+            numpy.ndarray or list: The stacked values, or a list of them if their shapes differ.
+        """
+        values = np.memmap(self.values_file, dtype = np.float64, mode = 'r') if len(records) else None
+        result = []
+        for record in records:
+            shape = tuple(record['shape'][:record['ndim']])
+            result.append(values[record['offset'] : record['offset'] + int(np.prod(shape))].reshape(shape))
+        if len({value.shape for value in result}) == 1:
+            return np.array(result)
+        return [np.array(value) for value in result]
+
+def import_tree(store, directory = 'data'):
+    """Imports the result files L_depth_samples_p_D_kind.npy of a directory, skipping those already imported.
+
+    Args:
+        store (ResultsStore): The store.
+        directory (str, optional): The directory, searched recursively. Defaults to 'data'.
+
+    Returns:
+        int: The number of imported files.
+    """
+    imported = set(store.index['source'])
+    results = []
+    for root, _, filenames in os.walk(directory):
+        for filename in sorted(filenames):
+            params = parse_filename(filename)
+            path = os.path.join(root, filename)
+            source = os.path.relpath(path, directory)
+            if params is None or source in imported:
+                continue
+            results.append((params['kind'], np.load(path), params['L'], params['depth'], params['samples'], params['p'],
+                            params['D'], 0, np.nan, os.path.getmtime(path), '', source))
+    if results:
+        store.extend(results)
+    return len(results)
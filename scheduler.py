@@ -0,0 +1,415 @@
+import glob
+import json
+import os
+import time
+import numpy as np
+
+import checkpoint
+from MIPT import sample, trip_info
+from results import lock
+from stats import RunningStats
+from streams import stream
+
+# A work queue is a directory holding config.json and one JSON file per task in pending/, running/ or done/.
+# Each task is one trajectory of the tripartite information at a single (L, p). Workers claim a task by atomically
+# renaming it from pending/ to running/, which stamps its modification time, and on completion write its statistics to
+# done/ next to the task file. Tasks running for longer than the lease, e.g. of killed workers, go back to pending/.
+# A task samples the random stream of its id, so running it twice gives the same statistics.
+
+# The default lease of a claimed task in seconds
+LEASE = 2 * 60 * 60
+
+def cost(L, D = 1):
+    """Estimates the relative cost of one timestep, dominated by Gaussian elimination of L D packed qubits.
+
+    Args:
+        L (int): The number of qudits.
+        D (int, optional): The number of qubits per qudit. Defaults to 1.
+
+    Returns:
+        int: The relative cost.
+    """
+    N = L * D
+    return N**2 * (1 + (N - 1) // 64)
+
+def create_queue(path, D, Ls, p_min, p_max, coarse = 0.004, resolution = 0.001, window = 0.008, initial = 4,
+                 timesteps = 256, batch = 64, target_error = 0.0, max_tasks = 4096, lease = LEASE, seed = None):
+    """Creates a work queue and submits the coarse grid.
+
+    Args:
+        path (str): The queue directory.
+        D (int): The number of qubits per qudit.
+        Ls (list): The system sizes whose tripartite information curves should cross.
+        p_min (float): The lowest measurement probability of the coarse grid.
+        p_max (float): The highest measurement probability of the coarse grid.
+        coarse (float, optional): The spacing of the coarse grid. Defaults to 0.004.
+        resolution (float, optional): The spacing of the grid further points are chosen from. Defaults to 0.001.
+        window (float, optional): Only points within this distance of p_c are fitted, and only points within half of it
+            are refined, so that refined points stay fitted as the estimate of p_c moves. Defaults to 0.008.
+        initial (int, optional): The number of trajectories per coarse point. Defaults to 4.
+        timesteps (int, optional): The number of timesteps sampled per trajectory. Defaults to 256.
+        batch (int, optional): The number of tasks submitted whenever the queue runs dry. Defaults to 64.
+        target_error (float, optional): Stop once the standard error of p_c is below this. Defaults to 0.
+        max_tasks (int, optional): Stop after this many tasks. Defaults to 4096.
+        lease (float, optional): The seconds after which a running task is requeued. Defaults to LEASE (2 hours).
+        seed (int, optional): The root seed of all trajectories. Defaults to None (fresh entropy).
+
+    Returns:
+        dict: The queue configuration.
+    """
+    for state in ('pending', 'running', 'done'):
+        os.makedirs(os.path.join(path, state), exist_ok = True)
+    config = {
+        'D': D, 'Ls': sorted(Ls), 'p_min': p_min, 'p_max': p_max, 'coarse': coarse, 'resolution': resolution,
+        'window': window, 'timesteps': timesteps, 'batch': batch, 'target_error': target_error, 'max_tasks': max_tasks,
+        'lease': lease, 'entropy': np.random.SeedSequence(seed).entropy
+    }
+    with open(os.path.join(path, 'config.json'), 'w') as f:
+        json.dump(config, f, indent = 4)
+    submit(path, [(L, p) for L in config['Ls'] for p in coarse_grid(config) for _ in range(initial)])
+    return config
+
+def coarse_grid(config):
+    """Returns the measurement probabilities of the coarse grid of a work queue."""
+    ps = np.arange(config['p_min'], config['p_max'] + config['coarse'] / 2, config['coarse'])
+    return [round(float(p), 6) for p in np.round(ps / config['resolution']) * config['resolution']]
+
+def load_config(path):
+    """Reads the configuration of a work queue."""
+    with open(os.path.join(path, 'config.json')) as f:
+        return json.load(f)
+
+def task_files(path, state):
+    """Lists the task files of a work queue in state 'pending', 'running' or 'done'."""
+    return sorted(glob.glob(os.path.join(path, state, '*.json')))
+
+def task_ids(path):
+    """Returns the ids of all submitted tasks, counting a task requeued while it was completed once."""
+    return {int(os.path.basename(filename)[:-len('.json')]) for state in ('pending', 'running', 'done') for filename in task_files(path, state)}
+
+def submit(path, points):
+    """Submits one task per (L, p) point. Each task samples its own random stream, keyed by its id below the root entropy.
+
+    Args:
+        path (str): The queue directory.
+        points (list): The (L, p) of each task.
+
+    Returns:
+        None
+    """
+    first = max(task_ids(path), default = -1) + 1
+    for task_id, (L, p) in enumerate(points, first):
+        task = {'id': task_id, 'L': int(L), 'p': round(float(p), 6)}
+        tmp = os.path.join(path, '{:06d}.json.tmp'.format(task_id))
+        with open(tmp, 'w') as f:
+            json.dump(task, f)
+        os.replace(tmp, os.path.join(path, 'pending', '{:06d}.json'.format(task_id)))
+
+def claim(path):
+    """Claims a pending task, returning it or None if there is none."""
+    for filename in task_files(path, 'pending'):
+        name = os.path.basename(filename)
+        if os.path.exists(os.path.join(path, 'done', name)):
+            # Requeued, but completed by its first worker after all
+            try:
+                os.remove(filename)
+            except FileNotFoundError:
+                pass
+            continue
+        running = os.path.join(path, 'running', name)
+        try:
+            os.utime(filename) # The claim time, kept by the rename
+            os.rename(filename, running)
+        except FileNotFoundError:
+            continue # Claimed by another worker
+        with open(running) as f:
+            return json.load(f)
+    return None
+
+def complete(path, task, stats, elapsed):
+    """Stores the statistics of a finished task and marks it done, also if it was requeued meanwhile."""
+    name = '{:06d}'.format(task['id'])
+    checkpoint.save(os.path.join(path, 'done', name + '.npz'), stats = stats, elapsed = elapsed)
+    tmp = os.path.join(path, name + '.json.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(task, f)
+    os.replace(tmp, os.path.join(path, 'done', name + '.json'))
+    try:
+        os.remove(os.path.join(path, 'running', name + '.json'))
+    except FileNotFoundError:
+        pass # Requeued
+
+def requeue(path, lease = 0):
+    """Moves tasks claimed more than lease seconds ago, e.g. by killed workers, back to pending.
+
+    A worker still running a requeued task completes it anyway, with the same statistics as its second run.
+
+    Args:
+        path (str): The queue directory.
+        lease (float, optional): The seconds a task may run before it is requeued. Defaults to 0 (all running tasks).
+
+    Returns:
+        int: The number of requeued tasks.
+    """
+    count = 0
+    for filename in task_files(path, 'running'):
+        try:
+            if time.time() - os.path.getmtime(filename) < lease:
+                continue
+            os.replace(filename, os.path.join(path, 'pending', os.path.basename(filename)))
+            count += 1
+        except FileNotFoundError:
+            pass # Completed or requeued by another worker
+    return count
+
+def run_task(task, config):
+    """Samples one trajectory of the tripartite information.
+
+    Args:
+        task (dict): The task.
+        config (dict): The queue configuration.
+
+    Returns:
+        stats.RunningStats: The statistics of the trajectory.
+    """
+    D = config['D']
+    stats = RunningStats()
+    sample(lambda state: trip_info(state, D), task['L'], task['p'], D, config['timesteps'],
+           seed = stream(config['entropy'], task['id']), stats = stats)
+    return stats
+
+def load_points(path):
+    """Aggregates finished and outstanding tasks per point.
+
+    Args:
+        path (str): The queue directory.
+
+    Returns:
+        dict: For each (L, p), a dict with the merged 'stats' of finished trajectories, their number 'done',
+            the number 'queued' of pending or running ones, and the CPU seconds 'elapsed'.
+    """
+    points = {}
+    def point(task):
+        return points.setdefault((task['L'], task['p']), {'stats': RunningStats(), 'done': 0, 'queued': 0, 'elapsed': 0.0})
+    for state in ('pending', 'running'):
+        for filename in task_files(path, state):
+            if os.path.exists(os.path.join(path, 'done', os.path.basename(filename))):
+                continue # Requeued, but completed by its first worker after all
+            try:
+                with open(filename) as f:
+                    point(json.load(f))['queued'] += 1
+            except FileNotFoundError:
+                pass # Claimed or requeued meanwhile
+    for filename in task_files(path, 'done'):
+        with open(filename) as f:
+            entry = point(json.load(f))
+        saved = checkpoint.load(filename[:-len('.json')] + '.npz')
+        entry['stats'].merge(saved['stats'])
+        entry['done'] += 1
+        entry['elapsed'] += float(saved['elapsed'])
+    return points
+
+def model_rows(theta, Ls, L, p):
+    """Jacobian of the crossing model y = a + b_L (p - p_c) with respect to theta = (p_c, a, b_L for L in Ls).
+
+    Args:
+        theta (numpy.ndarray): The parameters.
+        Ls (list): The system sizes, in the order of their slopes in theta.
+        L (numpy.ndarray): The system size of each point.
+        p (numpy.ndarray): The measurement probability of each point.
+
+    Returns:
+        numpy.ndarray: Array of shape (len(p), 2 + len(Ls)).
+    """
+    index = np.searchsorted(Ls, L)
+    rows = np.zeros((len(p), 2 + len(Ls)))
+    rows[:, 0] = -theta[2 + index]
+    rows[:, 1] = 1
+    rows[np.arange(len(p)), 2 + index] = p - theta[0]
+    return rows
+
+def fit_crossing(L, p, y, err, iterations = 20):
+    """Fits the curves of all system sizes with straight lines through a common crossing, by weighted least squares.
+
+    Args:
+        L (numpy.ndarray): The system size of each point.
+        p (numpy.ndarray): The measurement probability of each point.
+        y (numpy.ndarray): The mean tripartite information of each point.
+        err (numpy.ndarray): The standard error of each point.
+        iterations (int, optional): The number of Gauss-Newton iterations. Defaults to 20.
+
+    Returns:
+        tuple: The parameters theta = (p_c, y_c, slopes of the sorted system sizes), their covariance, scaled up by the
+            reduced chi-squared if that exceeds one, and the sorted system sizes.
+    """
+    Ls = np.unique(L)
+    w = 1 / err**2
+    def linear_fit(p_c):
+        # For fixed p_c, the model is linear in the crossing height and slopes
+        rows = model_rows(np.concatenate(([p_c, 0], np.zeros(len(Ls)))), Ls, L, p)[:, 1:]
+        sw = np.sqrt(w)
+        coef = np.linalg.lstsq(rows * sw[:, None], y * sw, rcond = None)[0]
+        return np.sum(w * (y - rows @ coef)**2), coef
+    grid = np.linspace(p.min() - np.ptp(p), p.max() + np.ptp(p), 201)
+    p_c = grid[np.argmin([linear_fit(p_c)[0] for p_c in grid])]
+    theta = np.concatenate(([p_c], linear_fit(p_c)[1]))
+    for _ in range(iterations):
+        rows = model_rows(theta, Ls, L, p)
+        residual = y - (theta[1] + theta[2 + np.searchsorted(Ls, L)] * (p - theta[0]))
+        theta = theta + np.linalg.lstsq(rows * np.sqrt(w)[:, None], residual * np.sqrt(w), rcond = None)[0]
+    rows = model_rows(theta, Ls, L, p)
+    residual = y - (theta[1] + theta[2 + np.searchsorted(Ls, L)] * (p - theta[0]))
+    cov = np.linalg.pinv(rows.T @ (w[:, None] * rows))
+    dof = len(p) - len(theta)
+    if dof > 0:
+        cov *= max(1, np.sum(w * residual**2) / dof)
+    return theta, cov, Ls
+
+def estimate(points, config):
+    """Estimates p_c from the finished trajectories, fitting only points within the window around the crossing.
+
+    Args:
+        points (dict): The points, see load_points.
+        config (dict): The queue configuration.
+
+    Returns:
+        tuple: The fit, see fit_crossing, and the (L, p) of the fitted points. None if there are too few points to fit.
+    """
+    keys = [key for key, entry in points.items() if entry['done'] >= 2]
+    if len({L for L, _ in keys}) < 2:
+        return None
+    L = np.array([L for L, _ in keys])
+    p = np.array([p for _, p in keys])
+    y = np.array([float(points[key]['stats'].mean) for key in keys])
+    err = np.array([float(points[key]['stats'].error()) for key in keys])
+    def enough(inside):
+        return len(np.unique(L[inside])) >= 2 and inside.sum() >= 3 + len(np.unique(L[inside]))
+    inside = np.ones(len(keys), dtype = bool)
+    if not enough(inside):
+        return None
+    for _ in range(3):
+        theta, cov, Ls = fit_crossing(L[inside], p[inside], y[inside], err[inside])
+        fitted = inside
+        window = np.abs(p - theta[0]) <= config['window'] + 1e-9
+        # If the crossing lies outside the sampled range, keep fitting all points until the samples catch up
+        if np.array_equal(window, inside) or not enough(window):
+            break
+        inside = window
+    return (theta, cov, Ls), [keys[i] for i in np.flatnonzero(fitted)]
+
+def plan(points, config, num_tasks):
+    """Chooses the points whose next trajectories most reduce the variance of p_c per unit cost.
+
+    The Fisher information of the crossing fit is accumulated over fitted points, counting queued trajectories as if
+    finished, and trajectories are added greedily to the candidate point on the resolution grid within half the window
+    around p_c with the largest reduction of var(p_c) per cost (Sherman-Morrison). Until the crossing is
+    resolved to a quarter of the window, the coarse grid is sampled uniformly.
+
+    Args:
+        points (dict): The points, see load_points.
+        config (dict): The queue configuration.
+        num_tasks (int): The number of tasks to plan.
+
+    Returns:
+        list: The (L, p) of each planned task.
+    """
+    D = config['D']
+    fit = estimate(points, config)
+    if fit is None or np.sqrt(fit[0][1][0, 0]) > config['window'] / 4:
+        # The crossing is not resolved yet: sample the coarse grid uniformly, least sampled first
+        counts = {(L, p): 0 for L in config['Ls'] for p in coarse_grid(config)}
+        for key in counts:
+            if key in points:
+                counts[key] = points[key]['done'] + points[key]['queued']
+        planned = []
+        for _ in range(num_tasks):
+            key = min(counts, key = counts.get)
+            counts[key] += 1
+            planned.append(key)
+        return planned
+    (theta, cov, Ls), fitted = fit
+    # Variance of a single trajectory mean, pooled per system size
+    variance = {}
+    for L, p in fitted:
+        entry = points[(L, p)]
+        variance.setdefault(L, []).append(float(entry['stats'].error())**2 * entry['done'])
+    variance = {L: np.median(v) for L, v in variance.items()}
+    resolution = config['resolution']
+    # Let the refined points walk out of the coarse grid only gradually
+    center = np.round(np.clip(theta[0], config['p_min'] - config['window'] / 2, config['p_max'] + config['window'] / 2) / resolution)
+    half = np.floor(config['window'] / 2 / resolution)
+    offsets = np.arange(-half, half + 1)
+    candidates = [(L, round(float((center + k) * resolution), 6)) for L in Ls for k in offsets]
+    candidates = [(L, p) for L, p in candidates if L in variance]
+    rows = model_rows(theta, Ls, np.array([L for L, _ in candidates]), np.array([p for _, p in candidates]))
+    weight = np.array([1 / variance[L] for L, _ in candidates])
+    cost_of = np.array([cost(L, D) for L, _ in candidates])
+
+    fisher = np.zeros((len(theta), len(theta)))
+    for L, p in fitted:
+        entry = points[(L, p)]
+        trajectories = entry['done'] + entry['queued']
+        row = model_rows(theta, Ls, np.array([L]), np.array([p]))[0]
+        fisher += trajectories / variance[L] * np.outer(row, row)
+    inverse = np.linalg.pinv(fisher + 1e-12 * np.trace(fisher) * np.eye(len(theta)))
+
+    planned = []
+    for _ in range(num_tasks):
+        u = rows @ inverse # u[i] = F^-1 j_i
+        gain = weight * u[:, 0]**2 / (1 + weight * np.sum(u * rows, axis = 1))
+        best = np.argmax(gain / cost_of)
+        planned.append(candidates[best])
+        v = inverse @ rows[best]
+        inverse -= weight[best] * np.outer(v, v) / (1 + weight[best] * rows[best] @ v)
+    return planned
+
+def work(path, max_tasks = None, log = print):
+    """Runs tasks until the queue is finished, planning the next batch whenever it runs dry.
+
+    Planning is serialised between workers by a lock file, see results.lock, and requeues tasks that outlived their
+    lease first. The queue is finished once the standard error of p_c reaches the target, or the maximum number of
+    tasks has been submitted and none is running.
+
+    Args:
+        path (str): The queue directory.
+        max_tasks (int, optional): Stop after running this many tasks. Defaults to None (no limit).
+        log (function, optional): Called with progress messages. Defaults to print.
+
+    Returns:
+        int: The number of tasks run.
+    """
+    config = load_config(path)
+    lease = config.get('lease', LEASE)
+    count = 0
+    while max_tasks is None or count < max_tasks:
+        task = claim(path)
+        if task is None:
+            with lock(os.path.join(path, 'plan.lock')):
+                requeued = requeue(path, lease)
+                if requeued:
+                    log("Requeued {} tasks running for more than {} s".format(requeued, lease))
+                task = claim(path)
+                if task is None:
+                    submitted = len(task_ids(path))
+                    points = load_points(path)
+                    fit = estimate(points, config)
+                    if fit is not None:
+                        (theta, cov, _), _ = fit
+                        log("p_c = {:.5f} +/- {:.5f} after {} tasks".format(theta[0], np.sqrt(cov[0, 0]), submitted))
+                    if fit is not None and np.sqrt(fit[0][1][0, 0]) < config['target_error']:
+                        return count
+                    if submitted >= config['max_tasks']:
+                        if not task_files(path, 'running'):
+                            return count
+                    else:
+                        submit(path, plan(points, config, min(config['batch'], config['max_tasks'] - submitted)))
+            if task is None:
+                task = claim(path)
+            if task is None:
+                time.sleep(1) # Waiting for running tasks to finish or expire before planning
+                continue
+        start_time = time.time()
+        stats = run_task(task, config)
+        complete(path, task, stats, time.time() - start_time)
+        count += 1
+    return count
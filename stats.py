@@ -0,0 +1,188 @@
+import numpy as np
+
+class Moments:
+    """Streaming count, mean and sum of squared deviations (Welford), mergeable with the pairwise update of Chan et al.
+
+    Args:
+        n (int, optional): The number of samples. Defaults to 0.
+        mean (numpy.ndarray, optional): The mean. Defaults to 0.
+        m2 (numpy.ndarray, optional): The sum of squared deviations from the mean. Defaults to 0.
+    """
+    def __init__(self, n = 0, mean = 0.0, m2 = 0.0):
+        self.n = n
+        self.mean = mean
+        self.m2 = m2
+
+    def push(self, x):
+        """Adds a sample."""
+        self.n += 1
+        delta = x - self.mean
+        self.mean = self.mean + delta / self.n
+        self.m2 = self.m2 + delta * (x - self.mean)
+
+    def merge(self, other):
+        """Adds all samples of another Moments."""
+        if other.n == 0:
+            return
+        n = self.n + other.n
+        delta = other.mean - self.mean
+        self.mean = self.mean + delta * other.n / n
+        self.m2 = self.m2 + other.m2 + delta**2 * self.n * other.n / n
+        self.n = n
+
+    @property
+    def var(self):
+        """The unbiased sample variance."""
+        return self.m2 / (self.n - 1)
+
+class RunningStats:
+    """Streaming statistics of a correlated time series, with error bars from an on-the-fly binning analysis.
+
+    Level k of the binning analysis holds the means of consecutive blocks of 2^k samples. Once blocks are longer than the
+    autocorrelation time their means are independent, and the standard error they imply plateaus at the true one.
+    Statistics of independent trajectories are combined with merge. A trajectory continued over several runs keeps pushing
+    into the same RunningStats instead, so that blocks spanning the runs are formed and its autocorrelation is kept.
+    """
+    def __init__(self):
+        self.levels = []
+        self.pending = []
+
+    def push(self, x):
+        """Adds the next sample of the time series.
+
+        Args:
+            x (numpy.ndarray): The sample.
+
+        Returns:
+            None
+        """
+        x = np.asarray(x, dtype = float)
+        level = 0
+        while True:
+            if level == len(self.levels):
+                self.levels.append(Moments())
+                self.pending.append(None)
+            self.levels[level].push(x)
+            if self.pending[level] is None:
+                self.pending[level] = x
+                return
+            x = (self.pending[level] + x) / 2
+            self.pending[level] = None
+            level += 1
+
+    def merge(self, other):
+        """Adds the statistics of an independent time series. Incomplete blocks of the other series are dropped.
+
+        Merging a later stretch of the same series would treat the two stretches as independent and underestimate the
+        error, so only merge separate trajectories.
+
+        Args:
+            other (RunningStats): The statistics to add.
+
+        Returns:
+            RunningStats: self.
+        """
+        for level, moments in enumerate(other.levels):
+            if level == len(self.levels):
+                self.levels.append(Moments())
+                self.pending.append(None)
+            self.levels[level].merge(moments)
+        return self
+
+    @classmethod
+    def merged(cls, series):
+        """Merges the statistics of independent series into new statistics, see merge.
+
+        Args:
+            series (list): The RunningStats of each series.
+
+        Returns:
+            RunningStats: The statistics of all series together. Incomplete blocks are dropped.
+        """
+        stats = cls()
+        for other in series:
+            stats.merge(other)
+        return stats
+
+    @classmethod
+    def stack(cls, series):
+        """Stacks the statistics of several series of the same length into one, with the series along the first axis.
+
+        This is the layout of statistics pushed with a batch of trajectories, see MIPT.sample_batch; indexing undoes it.
+
+        Args:
+            series (list): The RunningStats of each series, all with the same number of samples.
+
+        Returns:
+            RunningStats: The stacked statistics, including incomplete blocks.
+        """
+        stats = cls()
+        for level in range(len(series[0].levels)):
+            assert all(s.levels[level].n == series[0].levels[level].n for s in series)
+            stats.levels.append(Moments(series[0].levels[level].n, np.stack([s.levels[level].mean for s in series]),
+                                        np.stack([s.levels[level].m2 for s in series])))
+            stats.pending.append(None if series[0].pending[level] is None else np.stack([s.pending[level] for s in series]))
+        return stats
+
+    def __getitem__(self, i):
+        """Returns the statistics of series i of statistics with the series along the first axis, see stack."""
+        stats = RunningStats()
+        stats.levels = [Moments(moments.n, moments.mean[i], moments.m2[i]) for moments in self.levels]
+        stats.pending = [None if x is None else x[i] for x in self.pending]
+        return stats
+
+    @property
+    def n(self):
+        """The number of samples."""
+        return self.levels[0].n if self.levels else 0
+
+    @property
+    def mean(self):
+        """The mean of the samples."""
+        return self.levels[0].mean
+
+    @property
+    def std(self):
+        """The standard deviation of the samples."""
+        return np.sqrt(self.levels[0].var)
+
+    def naive_error(self):
+        """Returns the standard error of the mean assuming uncorrelated samples."""
+        return np.sqrt(self.levels[0].var / self.levels[0].n)
+
+    def error(self, min_blocks = 32):
+        """Returns the standard error of the mean from the binning analysis.
+
+        Args:
+            min_blocks (int, optional): The fewest blocks a level needs for its error estimate to be trusted. Defaults to 32.
+
+        Returns:
+            numpy.ndarray: The largest error over trusted levels, or the naive error if there are fewer than min_blocks samples.
+        """
+        errors = [np.sqrt(moments.var / moments.n) for moments in self.levels if moments.n >= min_blocks]
+        if not errors:
+            return self.naive_error()
+        return np.max(errors, axis = 0)
+
+    def tau(self, min_blocks = 32):
+        """Returns the integrated autocorrelation time, in samples, implied by the binning analysis."""
+        return 0.5 * (self.error(min_blocks) / self.naive_error())**2
+
+    def to_arrays(self):
+        """Returns the statistics as arrays, see from_arrays, including incomplete blocks so that the series can be continued."""
+        return {
+            'n': np.array([moments.n for moments in self.levels]),
+            'mean': np.array([moments.mean for moments in self.levels]),
+            'm2': np.array([moments.m2 for moments in self.levels]),
+            'pending': np.array([np.zeros_like(moments.mean) if x is None else x for moments, x in zip(self.levels, self.pending)]),
+            'full': np.array([x is not None for x in self.pending], dtype = bool)
+        }
+
+    @classmethod
+    def from_arrays(cls, n, mean, m2, pending, full):
+        """Restores statistics saved by to_arrays."""
+        stats = cls()
+        for level in range(len(n)):
+            stats.levels.append(Moments(int(n[level]), mean[level], m2[level]))
+            stats.pending.append(pending[level] if full[level] else None)
+        return stats
@@ -0,0 +1,59 @@
+import numpy as np
+
+# Every random draw of a simulation comes from an explicit numpy.random.Generator, also inside numba-compiled functions,
+# which share the state of a Generator passed to them. Independent streams are derived from the entropy of one root
+# numpy.random.SeedSequence and a key such as (run, trajectory), so that a whole run can be replayed from the root entropy
+# alone and no two trajectories share a stream, whichever process they run in.
+
+# The first key of the streams of parent states, see workers.fork; runs are numbered below it
+PARENTS = 2**32
+
+def generator(seed = None):
+    """Returns a random number generator.
+
+    Args:
+        seed (optional): A numpy.random.Generator, returned as is, or a numpy.random.SeedSequence or int to seed a new one.
+            Defaults to None (fresh entropy from the operating system, so forked processes never share a stream).
+
+    Returns:
+        numpy.random.Generator: The generator.
+    """
+    if isinstance(seed, np.random.Generator):
+        return seed
+    return np.random.default_rng(seed)
+
+def root_entropy(seed = None):
+    """Returns the entropy of a root seed sequence, which together with a key identifies every stream below it.
+
+    Args:
+        seed (int, optional): The seed. Defaults to None (fresh entropy).
+
+    Returns:
+        int: The entropy.
+    """
+    return np.random.SeedSequence(seed).entropy
+
+def stream(entropy, *key):
+    """Returns the seed of the stream with a key below a root entropy.
+
+    Args:
+        entropy (int): The root entropy, see root_entropy.
+        *key (int): The key, e.g. the run and trajectory.
+
+    Returns:
+        numpy.random.SeedSequence: The seed, to be passed to generator.
+    """
+    return np.random.SeedSequence(entropy, spawn_key = key)
+
+def spawn(entropy, key, n):
+    """Returns the seeds of n independent streams below a key, stream i having the key (*key, i).
+
+    Args:
+        entropy (int): The root entropy, see root_entropy.
+        key (tuple): The key, e.g. (run,) for the trajectories of a run.
+        n (int): The number of streams.
+
+    Returns:
+        list: The numpy.random.SeedSequence of each stream.
+    """
+    return [stream(entropy, *key, i) for i in range(n)]
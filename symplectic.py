@@ -0,0 +1,436 @@
+import os
+import numpy as np
+from numba import njit
+
+from streams import generator
+
+# Symplectic vectors use the interleaved ordering (x_1, z_1, x_2, z_2, ...), matching the column order of tableau.StabilizerTableau.
+
+@njit
+def inner(v, w):
+    """Calculates the symplectic inner product of two vectors.
+
+    Args:
+        v (numpy.ndarray): The first vector, of length 2n.
+        w (numpy.ndarray): The second vector, of length 2n.
+
+    Returns:
+        int: The symplectic inner product, 0 or 1.
+    """
+    t = 0
+    for i in range(v.shape[0] // 2):
+        t += v[2 * i] * w[2 * i + 1] + w[2 * i] * v[2 * i + 1]
+    return t % 2
+
+@njit
+def transvection(k, v):
+    """Applies the symplectic transvection Z_k to v.
+
+    Args:
+        k (numpy.ndarray): The transvection vector.
+        v (numpy.ndarray): The vector to transform.
+
+    Returns:
+        numpy.ndarray: Z_k v = v + <k, v> k.
+    """
+    if inner(k, v):
+        return v ^ k
+    return v.copy()
+
+@njit
+def find_transvection(x, y):
+    """Finds h1, h2 such that y = Z_h1 Z_h2 x (Lemma 2 of Koenig and Smolin, https://arxiv.org/abs/1406.2170).
+
+    Args:
+        x (numpy.ndarray): The nonzero source vector.
+        y (numpy.ndarray): The nonzero target vector.
+
+    Returns:
+        numpy.ndarray: An array of shape (2, 2n) containing h1 and h2. Zero rows are trivial transvections.
+    """
+    nn = x.shape[0]
+    output = np.zeros((2, nn), dtype = np.uint8)
+    if np.all(x == y):
+        return output
+    if inner(x, y) == 1:
+        output[0] = x ^ y
+        return output
+    z = np.zeros(nn, dtype = np.uint8)
+    for i in range(nn // 2):
+        ii = 2 * i
+        if (x[ii] | x[ii + 1]) and (y[ii] | y[ii + 1]):
+            z[ii] = x[ii] ^ y[ii]
+            z[ii + 1] = x[ii + 1] ^ y[ii + 1]
+            if z[ii] == 0 and z[ii + 1] == 0:
+                z[ii + 1] = 1
+                if x[ii] != x[ii + 1]:
+                    z[ii] = 1
+            output[0] = x ^ z
+            output[1] = y ^ z
+            return output
+    for i in range(nn // 2):
+        ii = 2 * i
+        if (x[ii] | x[ii + 1]) and not (y[ii] | y[ii + 1]):
+            if x[ii] == x[ii + 1]:
+                z[ii + 1] = 1
+            else:
+                z[ii + 1] = x[ii]
+                z[ii] = x[ii + 1]
+            break
+    for i in range(nn // 2):
+        ii = 2 * i
+        if not (x[ii] | x[ii + 1]) and (y[ii] | y[ii + 1]):
+            if y[ii] == y[ii + 1]:
+                z[ii + 1] = 1
+            else:
+                z[ii + 1] = y[ii]
+                z[ii] = y[ii + 1]
+            break
+    output[0] = x ^ z
+    output[1] = y ^ z
+    return output
+
+@njit
+def build_symplectic(f1s, bs):
+    """Builds a symplectic matrix from the choices made at each level of the Koenig-Smolin recursion.
+
+    Args:
+        f1s (numpy.ndarray): Array of shape (n, 2n); row m - 1 holds the nonzero image of e_1 at level m in its first 2m entries.
+        bs (numpy.ndarray): Array of shape (n, 2n); row m - 1 holds the 2m - 1 free bits at level m.
+
+    Returns:
+        numpy.ndarray: A symplectic matrix of shape (2n, 2n), whose row j is the image of the basis vector e_j.
+    """
+    n = f1s.shape[0]
+    g = np.zeros((0, 0), dtype = np.uint8)
+    for m in range(1, n + 1):
+        nn = 2 * m
+        f1 = f1s[m - 1, :nn].copy()
+        bits = bs[m - 1, :nn - 1]
+        e1 = np.zeros(nn, dtype = np.uint8)
+        e1[0] = 1
+        T = find_transvection(e1, f1)
+        eprime = e1.copy()
+        for j in range(2, nn):
+            eprime[j] = bits[j - 1]
+        h0 = transvection(T[0], eprime)
+        h0 = transvection(T[1], h0)
+        if bits[0] == 1:
+            f1[:] = 0
+        h = np.zeros((nn, nn), dtype = np.uint8)
+        h[0, 0] = 1
+        h[1, 1] = 1
+        h[2:, 2:] = g
+        for j in range(nn):
+            row = transvection(T[0], h[j])
+            row = transvection(T[1], row)
+            row = transvection(h0, row)
+            h[j] = transvection(f1, row)
+        g = h
+    return g
+
+@njit
+def random_symplectic(n, rng):
+    """Samples a uniformly random symplectic matrix in Sp(2n, GF(2)).
+
+    Args:
+        n (int): The number of qubits.
+        rng (numpy.random.Generator): The random number generator.
+
+    Returns:
+        numpy.ndarray: A symplectic matrix of shape (2n, 2n), whose row j is the image of the basis vector e_j.
+    """
+    f1s = np.zeros((n, 2 * n), dtype = np.uint8)
+    bs = np.zeros((n, 2 * n), dtype = np.uint8)
+    for m in range(1, n + 1):
+        nonzero = False
+        while not nonzero:
+            for j in range(2 * m):
+                f1s[m - 1, j] = rng.integers(0, 2)
+                nonzero = nonzero or f1s[m - 1, j] == 1
+        for j in range(2 * m - 1):
+            bs[m - 1, j] = rng.integers(0, 2)
+    return build_symplectic(f1s, bs)
+
+@njit
+def phase_tables(g):
+    """Calculates the tables needed to track signs through a Clifford gate.
+
+    Writing P(v) for the Hermitian Pauli string with symplectic vector v, a Clifford C mapping each generator e_j to
+    (-1)^s_j P(g_j) maps P(v) to (-1)^f(v) P(v g), where
+    f(v) = s.v + sum_{j < k} Q_jk v_j v_k + (y(v) + sum_j w_j v_j - y(v g)) / 2 (mod 2)
+    and y counts the Y factors of a Pauli string. The last term is evaluated in arithmetic mod 4.
+
+    Args:
+        g (numpy.ndarray): The symplectic matrix of the gate, of shape (2n, 2n).
+
+    Returns:
+        tuple: w (numpy.ndarray of shape (2n,)), the number of Y factors of each P(g_j) mod 4, and
+            Q (numpy.ndarray of shape (2n, 2n)), the strictly upper triangular sign form.
+    """
+    nn = g.shape[0]
+    w = np.zeros(nn, dtype = np.uint8)
+    for j in range(nn):
+        for q in range(nn // 2):
+            w[j] += g[j, 2 * q] & g[j, 2 * q + 1]
+        w[j] %= 4
+    # Generators are multiplied in the order X_1, ..., X_n, Z_1, ..., Z_n
+    order = np.concatenate((np.arange(0, nn, 2), np.arange(1, nn, 2)))
+    Q = np.zeros((nn, nn), dtype = np.uint8)
+    for a in range(nn):
+        for b in range(a + 1, nn):
+            j = order[a]
+            k = order[b]
+            t = 0
+            for q in range(nn // 2):
+                t ^= g[j, 2 * q + 1] & g[k, 2 * q]
+            Q[min(j, k), max(j, k)] ^= t
+    return w, Q
+
+@njit
+def unpack_choices(ks, bs_int, n):
+    """Unpacks the integer choices of the Koenig-Smolin recursion into bit arrays for build_symplectic.
+
+    Args:
+        ks (numpy.ndarray): Array of length n; entry m - 1 is the nonzero image of e_1 at level m, in [1, 4^m).
+        bs_int (numpy.ndarray): Array of length n; entry m - 1 holds the free bits at level m, in [0, 2^(2m - 1)).
+        n (int): The number of qubits.
+
+    Returns:
+        tuple: The arrays f1s and bs of shape (n, 2n).
+    """
+    f1s = np.zeros((n, 2 * n), dtype = np.uint8)
+    bs = np.zeros((n, 2 * n), dtype = np.uint8)
+    for m in range(1, n + 1):
+        for j in range(2 * m):
+            f1s[m - 1, j] = (ks[m - 1] >> j) & 1
+        for j in range(2 * m - 1):
+            bs[m - 1, j] = (bs_int[m - 1] >> j) & 1
+    return f1s, bs
+
+def group_order(n):
+    """Calculates the order of Sp(2n, GF(2)).
+
+    Args:
+        n (int): The number of qubits.
+
+    Returns:
+        int: The number of symplectic matrices.
+    """
+    order = 1
+    for m in range(1, n + 1):
+        order *= (4**m - 1) * 2**(2 * m - 1)
+    return order
+
+def symplectic(i, n):
+    """Calculates the i-th symplectic matrix in the Koenig-Smolin enumeration of Sp(2n, GF(2)).
+
+    Args:
+        i (int): The index, in [0, group_order(n)).
+        n (int): The number of qubits.
+
+    Returns:
+        numpy.ndarray: A symplectic matrix of shape (2n, 2n), whose row j is the image of the basis vector e_j.
+    """
+    ks = np.zeros(n, dtype = np.int64)
+    bs_int = np.zeros(n, dtype = np.int64)
+    for m in range(n, 0, -1):
+        s = 4**m - 1
+        ks[m - 1] = i % s + 1
+        i //= s
+        bs_int[m - 1] = i % 2**(2 * m - 1)
+        i >>= 2 * m - 1
+    return build_symplectic(*unpack_choices(ks, bs_int, n))
+
+# Largest number of qubits for which the whole symplectic group is enumerated (720 matrices for 2 qubits)
+ENUMERATE_MAX_QUBITS = 2
+
+# Optional path prefix of .npy files caching the enumerated gate tables across processes, one file per number of qubits
+GATE_CACHE = os.environ.get('MIPT_GATE_CACHE')
+
+_tables = {}
+
+def gate_table(n, cache = None):
+    """Returns the table of all symplectic matrices on n qubits with their phase tables, computed once per process.
+
+    Args:
+        n (int): The number of qubits, at most ENUMERATE_MAX_QUBITS.
+        cache (str, optional): Path prefix of a .npy file ('{cache}_{n}.npy') to load the matrices from, or save them to if
+            it does not exist or holds a table of the wrong shape. Defaults to None.
+
+    Returns:
+        tuple: Arrays g of shape (|Sp|, 2n, 2n), w of shape (|Sp|, 2n) and Q of shape (|Sp|, 2n, 2n), see phase_tables.
+    """
+    assert n <= ENUMERATE_MAX_QUBITS
+    if n not in _tables:
+        shape = (group_order(n), 2 * n, 2 * n)
+        path = None if cache is None else '{}_{}.npy'.format(cache, n)
+        g = None
+        if path is not None:
+            try:
+                g = np.load(path)
+            except (FileNotFoundError, ValueError, EOFError):
+                pass
+        if g is None or g.shape != shape:
+            g = np.array([symplectic(i, n) for i in range(group_order(n))])
+            if path is not None:
+                # Write atomically, as many workers may start at once
+                tmp = '{}.{}.tmp'.format(path, os.getpid())
+                with open(tmp, 'wb') as f:
+                    np.save(f, g)
+                os.replace(tmp, path)
+        w, Q = zip(*[phase_tables(gi) for gi in g])
+        _tables[n] = (g, np.array(w), np.array(Q))
+    return _tables[n]
+
+@njit
+def compute_transvections(n):
+    """Finds the transvections mapping e_1 to each nonzero vector at each level of the Koenig-Smolin recursion.
+
+    Args:
+        n (int): The number of qubits.
+
+    Returns:
+        numpy.ndarray: Array of shape (n, 4^n - 1, 2, 2n); entry [m - 1, k - 1] holds h1 and h2 of find_transvection(e_1, f)
+            in their first 2m entries, where f is the vector with bits k at level m. Entries for k >= 4^m are unused.
+    """
+    table = np.zeros((n, 4**n - 1, 2, 2 * n), dtype = np.uint8)
+    for m in range(1, n + 1):
+        nn = 2 * m
+        e1 = np.zeros(nn, dtype = np.uint8)
+        e1[0] = 1
+        f1 = np.empty(nn, dtype = np.uint8)
+        for k in range(1, 4**m):
+            for j in range(nn):
+                f1[j] = (k >> j) & 1
+            table[m - 1, k - 1, :, :nn] = find_transvection(e1, f1)
+    return table
+
+_transvections = {}
+
+def transvection_table(n):
+    """Returns compute_transvections(n), computed once per process."""
+    if n not in _transvections:
+        _transvections[n] = compute_transvections(n)
+    return _transvections[n]
+
+@njit
+def transvect(k, v, nn):
+    """Applies the symplectic transvection Z_k to the first nn entries of v in place, see transvection."""
+    t = 0
+    for i in range(nn // 2):
+        t += v[2 * i] * k[2 * i + 1] + k[2 * i] * v[2 * i + 1]
+    if t % 2:
+        for i in range(nn):
+            v[i] ^= k[i]
+
+@njit
+def build_layer(ks, bs_int, transvections):
+    """Builds a layer of Clifford gates from the integer choices of the Koenig-Smolin recursion.
+
+    Like build_symplectic on the unpacked choices, but the transvections of each level are looked up in a table, and
+    each gate is built level by level in place, so that nothing that is the same for every gate is recomputed per gate.
+
+    Args:
+        ks (numpy.ndarray): Array of shape (G, n), see unpack_choices.
+        bs_int (numpy.ndarray): Array of shape (G, n), see unpack_choices.
+        transvections (numpy.ndarray): The table of compute_transvections(n).
+
+    Returns:
+        tuple: Arrays g of shape (G, 2n, 2n), w of shape (G, 2n) and Q of shape (G, 2n, 2n).
+    """
+    G, n = ks.shape
+    g = np.zeros((G, 2 * n, 2 * n), dtype = np.uint8)
+    w = np.empty((G, 2 * n), dtype = np.uint8)
+    Q = np.empty((G, 2 * n, 2 * n), dtype = np.uint8)
+    h0 = np.empty(2 * n, dtype = np.uint8)
+    f1 = np.empty(2 * n, dtype = np.uint8)
+    for i in range(G):
+        h = g[i]
+        for m in range(1, n + 1):
+            nn = 2 * m
+            T = transvections[m - 1, ks[i, m - 1] - 1]
+            bits = bs_int[i, m - 1]
+            # Embed the matrix of the previous level in the lower right block, from the bottom right so nothing is overwritten
+            for j in range(nn - 1, 1, -1):
+                for l in range(nn - 1, 1, -1):
+                    h[j, l] = h[j - 2, l - 2]
+                h[j, 0] = 0
+                h[j, 1] = 0
+            h[0, :nn] = 0
+            h[1, :nn] = 0
+            h[0, 0] = 1
+            h[1, 1] = 1
+            h0[0] = 1
+            h0[1] = 0
+            for j in range(2, nn):
+                h0[j] = (bits >> (j - 1)) & 1
+            transvect(T[0], h0, nn)
+            transvect(T[1], h0, nn)
+            for j in range(nn):
+                f1[j] = 0 if bits & 1 else (ks[i, m - 1] >> j) & 1
+            for j in range(nn):
+                transvect(T[0], h[j], nn)
+                transvect(T[1], h[j], nn)
+                transvect(h0, h[j], nn)
+                transvect(f1, h[j], nn)
+        w[i], Q[i] = phase_tables(h)
+    return g, w, Q
+
+def random_choices(G, n, rng = None):
+    """Draws the integer choices that determine G independent uniformly random Clifford gates on n qubits, see decode_layer.
+
+    A gate on at most ENUMERATE_MAX_QUBITS qubits is its index in gate_table followed by its sign bits packed into an
+    integer; a larger gate is its Koenig-Smolin choices k_1, ..., k_n and b_1, ..., b_n followed by its packed sign bits.
+
+    Args:
+        G (int): The number of gates.
+        n (int): The number of qubits per gate.
+        rng (numpy.random.Generator, optional): The random number generator. Defaults to None (fresh entropy, see streams.generator).
+
+    Returns:
+        numpy.ndarray: Array of shape (G, 2) if n <= ENUMERATE_MAX_QUBITS, else (G, 2n + 1), of the choices.
+    """
+    rng = generator(rng)
+    signs = np.left_shift(1, np.arange(2 * n, dtype = np.int64))
+    if n <= ENUMERATE_MAX_QUBITS:
+        r = rng.integers(0, 2**62, size = (G, 2 * n + 1))
+        return np.stack((r[:, 0] % group_order(n), (r[:, 1:] & 1) @ signs), axis = 1)
+    # Draw the sign bits and both choices at every level in one call; the modulo bias is below 2^-40
+    r = rng.integers(0, 2**62, size = (G, 2 * n + 2 * n))
+    m = np.arange(1, n + 1)
+    return np.concatenate((r[:, :n] % (4**m - 1) + 1, r[:, n:2 * n] % 2**(2 * m - 1), ((r[:, 2 * n:] & 1) @ signs)[:, np.newaxis]), axis = 1)
+
+def decode_layer(choices, n):
+    """Builds the gates of a layer from their integer choices, see random_choices.
+
+    Args:
+        choices (numpy.ndarray): The choices of each gate.
+        n (int): The number of qubits per gate.
+
+    Returns:
+        tuple: Arrays g of shape (G, 2n, 2n), s of shape (G, 2n), w of shape (G, 2n) and Q of shape (G, 2n, 2n).
+    """
+    s = ((choices[:, -1:] >> np.arange(2 * n)) & 1).astype(np.uint8)
+    if n <= ENUMERATE_MAX_QUBITS:
+        g, w, Q = gate_table(n, GATE_CACHE)
+        idx = choices[:, 0]
+        return g[idx], s, w[idx], Q[idx]
+    g, w, Q = build_layer(np.ascontiguousarray(choices[:, :n]), np.ascontiguousarray(choices[:, n:2 * n]), transvection_table(n))
+    return g, s, w, Q
+
+def random_layer(G, n, rng = None):
+    """Samples G independent uniformly random Clifford gates on n qubits.
+
+    Gates on at most ENUMERATE_MAX_QUBITS qubits are drawn from the cached gate_table; larger gates are built from
+    Koenig-Smolin choices drawn for the whole layer at once.
+
+    Args:
+        G (int): The number of gates.
+        n (int): The number of qubits per gate.
+        rng (numpy.random.Generator, optional): The random number generator. Defaults to None (fresh entropy, see streams.generator).
+
+    Returns:
+        tuple: Arrays g of shape (G, 2n, 2n), s of shape (G, 2n), w of shape (G, 2n) and Q of shape (G, 2n, 2n).
+    """
+    return decode_layer(random_choices(G, n, rng), n)
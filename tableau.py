@@ -0,0 +1,1250 @@
+import numpy as np
+from numba import get_num_threads, njit, prange
+
+import gf2
+from gf2 import insert, insert_listed, lowest_bit, rank
+from streams import generator
+from symplectic import decode_layer, random_choices, random_layer
+
+# A stabilizer state on N qubits is stored column-major as a uint64 array `bits` of shape (2N + 1, W), W = ceil(N / 64).
+# Row 2q (2q + 1) holds the X (Z) component of qubit q for all N stabilizers, packed 64 stabilizers per word;
+# row 2N holds the sign bits. Padding bits beyond N are always zero.
+
+@njit
+def compile_layer(qubits, g, s, Q):
+    """Turns the dense gate data of a layer of Clifford gates into index lists, so that applying it skips all zeros.
+
+    Args:
+        qubits (numpy.ndarray): Array of shape (G, n) containing the qubits each gate acts on.
+        g (numpy.ndarray): Array of shape (G, 2n, 2n) containing the symplectic matrices.
+        s (numpy.ndarray): Array of shape (G, 2n) containing the sign bits.
+        Q (numpy.ndarray): Array of shape (G, 2n, 2n) containing the sign forms.
+
+    Returns:
+        tuple: The tableau rows of each gate, of shape (G, 2n); for each image j the inputs i with g[i, j] = 1 and their
+            number, of shapes (G, 2n, 2n) and (G, 2n); and the pairs i <= j whose product enters the sign (Q[i, j] = 1,
+            or s[i] = 1 for i = j) and their number, of shapes (G, n (2n + 1), 2) and (G,).
+    """
+    G, n = qubits.shape
+    nn = 2 * n
+    cols = np.empty((G, nn), dtype = np.int64)
+    inputs = np.empty((G, nn, nn), dtype = np.int64)
+    num_inputs = np.zeros((G, nn), dtype = np.int64)
+    terms = np.empty((G, n * (nn + 1), 2), dtype = np.int64)
+    num_terms = np.zeros(G, dtype = np.int64)
+    for e in range(G):
+        for a in range(n):
+            cols[e, 2 * a] = 2 * qubits[e, a]
+            cols[e, 2 * a + 1] = 2 * qubits[e, a] + 1
+        for j in range(nn):
+            for i in range(nn):
+                if g[e, i, j]:
+                    inputs[e, j, num_inputs[e, j]] = i
+                    num_inputs[e, j] += 1
+        for i in range(nn):
+            if s[e, i]:
+                terms[e, num_terms[e], 0] = i
+                terms[e, num_terms[e], 1] = i
+                num_terms[e] += 1
+            for j in range(i + 1, nn):
+                if Q[e, i, j]:
+                    terms[e, num_terms[e], 0] = i
+                    terms[e, num_terms[e], 1] = j
+                    num_terms[e] += 1
+    return cols, inputs, num_inputs, terms, num_terms
+
+@njit
+def apply_compiled(bits, cols, inputs, num_inputs, terms, num_terms, w, start, stop):
+    """Applies a compiled layer of Clifford gates (see compile_layer) to the words start, ..., stop - 1 of a packed tableau.
+
+    Words hold disjoint sets of stabilizers, so a layer can be applied to each range of words separately.
+
+    Args:
+        bits (numpy.ndarray): The packed tableau.
+        cols, inputs, num_inputs, terms, num_terms (numpy.ndarray): The compiled layer, see compile_layer.
+        w (numpy.ndarray): Array of shape (G, 2n) containing the number of Y factors in each image mod 4, see symplectic.phase_tables.
+        start (int): The first word.
+        stop (int): The word after the last.
+
+    Returns:
+        None
+    """
+    G, nn = cols.shape
+    n = nn // 2
+    sign_row = bits.shape[0] - 1
+    old = np.empty(nn, dtype = np.uint64)
+    new = np.empty(nn, dtype = np.uint64)
+    for e in range(G):
+        for k in range(start, stop):
+            for j in range(nn):
+                old[j] = bits[cols[e, j], k]
+            for j in range(nn):
+                acc = np.uint64(0)
+                for t in range(num_inputs[e, j]):
+                    acc ^= old[inputs[e, j, t]]
+                new[j] = acc
+            # Linear and bilinear parts of the sign function
+            f = np.uint64(0)
+            for t in range(num_terms[e]):
+                f ^= old[terms[e, t, 0]] & old[terms[e, t, 1]]
+            # Bit-sliced counter mod 4 for the Y-count term
+            lo = np.uint64(0)
+            hi = np.uint64(0)
+            for a in range(n):
+                m = old[2 * a] & old[2 * a + 1]
+                hi ^= lo & m
+                lo ^= m
+            for i in range(nn):
+                if w[e, i] & 2:
+                    hi ^= old[i]
+                if w[e, i] & 1:
+                    hi ^= lo & old[i]
+                    lo ^= old[i]
+            for a in range(n):
+                m = new[2 * a] & new[2 * a + 1]
+                hi ^= ~lo & m
+                lo ^= m
+            for j in range(nn):
+                bits[cols[e, j], k] = new[j]
+            bits[sign_row, k] ^= f ^ hi
+
+@njit
+def apply_clifford(bits, qubits, g, s, w, Q):
+    """Applies a Clifford gate to a packed stabilizer tableau in place.
+
+    Args:
+        bits (numpy.ndarray): The packed tableau.
+        qubits (numpy.ndarray): The n qubits the gate acts on.
+        g (numpy.ndarray): The symplectic matrix of the gate, of shape (2n, 2n).
+        s (numpy.ndarray): The sign bits of the images of the generators, of shape (2n,).
+        w (numpy.ndarray): The number of Y factors in each image mod 4, see symplectic.phase_tables.
+        Q (numpy.ndarray): The sign form of the gate, see symplectic.phase_tables.
+
+    Returns:
+        None
+    """
+    nn = g.shape[0]
+    apply_layer(bits, qubits.reshape((1, nn // 2)), g.reshape((1, nn, nn)), s.reshape((1, nn)), w.reshape((1, nn)), Q.reshape((1, nn, nn)))
+
+@njit
+def apply_layer(bits, qubits, g, s, w, Q):
+    """Applies a layer of Clifford gates on disjoint qubits to a packed stabilizer tableau in place.
+
+    The layer is compiled once (see compile_layer), and each gate is then applied to all words of its rows in turn.
+
+    Args:
+        bits (numpy.ndarray): The packed tableau.
+        qubits (numpy.ndarray): Array of shape (G, n) containing the qubits each gate acts on.
+        g (numpy.ndarray): Array of shape (G, 2n, 2n) containing the symplectic matrices.
+        s (numpy.ndarray): Array of shape (G, 2n) containing the sign bits.
+        w (numpy.ndarray): Array of shape (G, 2n) containing the Y counts.
+        Q (numpy.ndarray): Array of shape (G, 2n, 2n) containing the sign forms.
+
+    Returns:
+        None
+    """
+    cols, inputs, num_inputs, terms, num_terms = compile_layer(qubits, g, s, Q)
+    apply_compiled(bits, cols, inputs, num_inputs, terms, num_terms, w, 0, bits.shape[1])
+
+@njit(parallel = True)
+def apply_layer_parallel(bits, qubits, g, s, w, Q):
+    """Applies a layer of Clifford gates like apply_layer, with the words split into one contiguous range per thread.
+
+    Returns:
+        None
+    """
+    W = bits.shape[1]
+    cols, inputs, num_inputs, terms, num_terms = compile_layer(qubits, g, s, Q)
+    chunks = min(W, get_num_threads())
+    size = (W + chunks - 1) // chunks
+    for chunk in prange(chunks):
+        apply_compiled(bits, cols, inputs, num_inputs, terms, num_terms, w, chunk * size, min((chunk + 1) * size, W))
+
+@njit
+def brickwork_pairs(L, even, D):
+    """Lists the qubits acted on by each gate of a brickwork layer.
+
+    Gates act on qudit pairs (2i, 2i + 1) if even, else on (2i + 1, 2i + 2) with periodic boundary conditions.
+
+    Args:
+        L (int): The number of qudits.
+        even (bool): Whether to add gates starting with even or odd qudits.
+        D (int): The number of qubits per qudit.
+
+    Returns:
+        numpy.ndarray: Array of shape (L // 2, 2D) containing the qubits of each gate.
+    """
+    pairs = np.empty((L // 2, 2 * D), dtype = np.int64)
+    for i in range(L // 2):
+        q1 = 2 * i if even else 2 * i + 1
+        q2 = (q1 + 1) % L
+        for j in range(D):
+            pairs[i, j] = q1 * D + j
+            pairs[i, D + j] = q2 * D + j
+    return pairs
+
+@njit
+def measure(bits, q, outcome):
+    """Measures qubit q of a packed stabilizer tableau in the Z basis, in place.
+
+    Outcomes of deterministic measurements are not resolved, since this would require Gaussian elimination; the state is left unchanged.
+
+    Args:
+        bits (numpy.ndarray): The packed tableau.
+        q (int): The qubit to measure.
+        outcome (int): The outcome to record if it is random, 0 or 1.
+
+    Returns:
+        int: The measurement outcome, 0 or 1, or -1 if the outcome is deterministic.
+    """
+    N = (bits.shape[0] - 1) // 2
+    W = bits.shape[1]
+    xq = bits[2 * q]
+    p = -1
+    for k in range(W):
+        if xq[k] != 0:
+            p = 64 * k + lowest_bit(xq[k])
+            break
+    if p < 0:
+        return -1
+    pw = p // 64
+    pb = np.uint64(1) << np.uint64(p % 64)
+    # Stabilizers anticommuting with Z_q, other than the pivot
+    mask = xq.copy()
+    mask[pw] &= ~pb
+    # Multiply the pivot into the masked stabilizers, tracking the power of i in a bit-sliced counter mod 4
+    lo = np.zeros(W, dtype = np.uint64)
+    hi = np.zeros(W, dtype = np.uint64)
+    for j in range(N):
+        xj = bits[2 * j]
+        zj = bits[2 * j + 1]
+        x1 = (xj[pw] & pb) != 0
+        z1 = (zj[pw] & pb) != 0
+        if not (x1 or z1):
+            continue
+        for k in range(W):
+            a = xj[k]
+            b = zj[k]
+            if x1 and z1:
+                plus = b & ~a
+                minus = a & ~b
+            elif x1:
+                plus = a & b
+                minus = b & ~a
+            else:
+                plus = a & ~b
+                minus = a & b
+            plus &= mask[k]
+            minus &= mask[k]
+            hi[k] ^= lo[k] & plus
+            lo[k] ^= plus
+            hi[k] ^= ~lo[k] & minus
+            lo[k] ^= minus
+            if x1:
+                xj[k] ^= mask[k]
+            if z1:
+                zj[k] ^= mask[k]
+    sign = bits[2 * N]
+    pivot_sign = (sign[pw] & pb) != 0
+    for k in range(W):
+        if pivot_sign:
+            sign[k] ^= ~hi[k] & mask[k]
+        else:
+            sign[k] ^= hi[k] & mask[k]
+    # Replace the pivot with +/- Z_q
+    for j in range(2 * N):
+        bits[j, pw] &= ~pb
+    bits[2 * q + 1, pw] |= pb
+    if outcome:
+        sign[pw] |= pb
+    else:
+        sign[pw] &= ~pb
+    return outcome
+
+@njit
+def measure_layer(bits, qubits, outcomes):
+    """Measures several qubits of a packed stabilizer tableau in the Z basis in one sweep, in place.
+
+    Equivalent to calling measure on each qubit in order, but the tableau is only traversed once: the pivots and masks
+    of all measurements are first found on a copy of the measured X rows alone, then every pair of rows goes through all
+    measurements while it is in cache, each touching only the words its mask spans. Deterministic outcomes are skipped.
+
+    Args:
+        bits (numpy.ndarray): The packed tableau.
+        qubits (numpy.ndarray): The qubits to measure, in order.
+        outcomes (numpy.ndarray): The outcomes to record for random measurements, 0 or 1.
+
+    Returns:
+        int: The number of random measurements.
+    """
+    N = (bits.shape[0] - 1) // 2
+    W = bits.shape[1]
+    M = qubits.shape[0]
+    xs = np.empty((M, W), dtype = np.uint64)
+    for m in range(M):
+        xs[m] = bits[2 * qubits[m]]
+    # Pivot (word, bit), mask and word range of each random measurement, in order
+    pw = np.empty(M, dtype = np.int64)
+    pb = np.empty(M, dtype = np.uint64)
+    masks = np.zeros((M, W), dtype = np.uint64)
+    hi_word = np.empty(M, dtype = np.int64)
+    order = np.empty(M, dtype = np.int64)
+    R = 0
+    for m in range(M):
+        p = -1
+        for k in range(W):
+            if xs[m, k] != 0:
+                p = 64 * k + lowest_bit(xs[m, k])
+                break
+        if p < 0:
+            continue
+        w = p // 64
+        b = np.uint64(1) << np.uint64(p % 64)
+        masks[R] = xs[m]
+        masks[R, w] &= ~b
+        last = w
+        for k in range(w, W):
+            if masks[R, k] != 0:
+                last = k
+        pw[R] = w
+        pb[R] = b
+        hi_word[R] = last + 1
+        order[R] = m
+        for n in range(m + 1, M):
+            if xs[n, w] & b:
+                for k in range(w, last + 1):
+                    xs[n, k] ^= masks[R, k]
+                xs[n, w] &= ~b
+        R += 1
+    if R == 0:
+        return 0
+    # Bit-sliced counters mod 4 of the power of i picked up by each measurement, see measure
+    lo = np.zeros((R, W), dtype = np.uint64)
+    hi = np.zeros((R, W), dtype = np.uint64)
+    measured_at = -np.ones(N, dtype = np.int64)
+    for r in range(R):
+        measured_at[qubits[order[r]]] = r
+    for j in range(N):
+        xj = bits[2 * j]
+        zj = bits[2 * j + 1]
+        for r in range(R):
+            w = pw[r]
+            b = pb[r]
+            x1 = (xj[w] & b) != 0
+            z1 = (zj[w] & b) != 0
+            if x1 or z1:
+                for k in range(w, hi_word[r]):
+                    m = masks[r, k]
+                    a = xj[k]
+                    c = zj[k]
+                    if x1 and z1:
+                        plus = c & ~a
+                        minus = a & ~c
+                    elif x1:
+                        plus = a & c
+                        minus = c & ~a
+                    else:
+                        plus = a & ~c
+                        minus = a & c
+                    plus &= m
+                    minus &= m
+                    hi[r, k] ^= lo[r, k] & plus
+                    lo[r, k] ^= plus
+                    hi[r, k] ^= ~lo[r, k] & minus
+                    lo[r, k] ^= minus
+                    if x1:
+                        xj[k] ^= m
+                    if z1:
+                        zj[k] ^= m
+                xj[w] &= ~b
+                zj[w] &= ~b
+            if measured_at[j] == r:
+                zj[w] |= b
+    sign = bits[2 * N]
+    for r in range(R):
+        w = pw[r]
+        b = pb[r]
+        pivot_sign = (sign[w] & b) != 0
+        for k in range(w, hi_word[r]):
+            if pivot_sign:
+                sign[k] ^= ~hi[r, k] & masks[r, k]
+            else:
+                sign[k] ^= hi[r, k] & masks[r, k]
+        if outcomes[order[r]]:
+            sign[w] |= b
+        else:
+            sign[w] &= ~b
+    return R
+
+@njit
+def subsystem_rank(bits, qubits):
+    """Calculates the rank of the stabilizer tableau restricted to a set of qubits.
+
+    Args:
+        bits (numpy.ndarray): The packed tableau.
+        qubits (numpy.ndarray): The qubits of the subsystem.
+
+    Returns:
+        int: The rank over GF(2).
+    """
+    vecs = np.empty((2 * qubits.shape[0], bits.shape[1]), dtype = np.uint64)
+    for a in range(qubits.shape[0]):
+        vecs[2 * a] = bits[2 * qubits[a]]
+        vecs[2 * a + 1] = bits[2 * qubits[a] + 1]
+    return rank(vecs)
+
+@njit
+def prefix_ranks(bits, qubits):
+    """Calculates the rank of the tableau restricted to every prefix of an ordered list of qubits, in a single pass.
+
+    Args:
+        bits (numpy.ndarray): The packed tableau.
+        qubits (numpy.ndarray): The ordered qubits.
+
+    Returns:
+        numpy.ndarray: Array of length n + 1 whose entry k is the rank restricted to qubits[:k].
+    """
+    n = qubits.shape[0]
+    W = bits.shape[1]
+    basis = np.empty((min(2 * n, 64 * W), W), dtype = np.uint64)
+    owner = -np.ones(64 * W, dtype = np.int64)
+    ranks = np.zeros(n + 1, dtype = np.int64)
+    r = 0
+    for a in range(n):
+        r = insert(basis, owner, r, bits[2 * qubits[a]].copy())
+        r = insert(basis, owner, r, bits[2 * qubits[a] + 1].copy())
+        ranks[a + 1] = r
+    return ranks
+
+@njit
+def insert_qubits(bits, basis, owner, r, qubits):
+    """Inserts the columns of a list of qubits into an echelon basis, see gf2.insert.
+
+    Args:
+        bits (numpy.ndarray): The packed tableau.
+        basis (numpy.ndarray): The basis vectors.
+        owner (numpy.ndarray): The pivot owners of the basis.
+        r (int): The current rank.
+        qubits (numpy.ndarray): The qubits to insert.
+
+    Returns:
+        int: The new rank.
+    """
+    for q in qubits:
+        r = insert(basis, owner, r, bits[2 * q].copy())
+        r = insert(basis, owner, r, bits[2 * q + 1].copy())
+    return r
+
+@njit
+def cut_basis(bits, qubits):
+    """Builds an echelon basis of the rows of a subsystem, to be kept up to date by measure_cut.
+
+    Args:
+        bits (numpy.ndarray): The packed tableau.
+        qubits (numpy.ndarray): The qubits of the subsystem.
+
+    Returns:
+        tuple: The basis, its pivot owners and its rank, see gf2.insert.
+    """
+    W = bits.shape[1]
+    basis = np.empty((min(2 * qubits.shape[0], 64 * W), W), dtype = np.uint64)
+    owner = -np.ones(64 * W, dtype = np.int64)
+    r = insert_qubits(bits, basis, owner, 0, qubits)
+    return basis, owner, r
+
+@njit
+def measure_cut(bits, q, outcome, basis, owner, r):
+    """Measures a qubit q outside a subsystem like measure, updating the echelon basis of its rows instead of rebuilding it.
+
+    The measurement multiplies the pivot stabilizer k into the other anticommuting ones, which maps every row v to
+    v + v_k mask and only changes bits above k, so the lowest-bit pivots of the basis survive. Replacing stabilizer k
+    by Z_q then projects bit k out of the rows of the subsystem. Measurements inside the subsystem also depend on
+    which rows span what, not just on their span, so they need the basis to be rebuilt.
+
+    Args:
+        bits (numpy.ndarray): The packed tableau.
+        q (int): The qubit to measure, outside the subsystem.
+        outcome (int): The outcome to record if it is random, 0 or 1.
+        basis (numpy.ndarray): The basis vectors, see cut_basis.
+        owner (numpy.ndarray): The pivot owners of the basis.
+        r (int): The current rank.
+
+    Returns:
+        int: The new rank.
+    """
+    W = bits.shape[1]
+    xq = bits[2 * q]
+    p = -1
+    for k in range(W):
+        if xq[k] != 0:
+            p = 64 * k + lowest_bit(xq[k])
+            break
+    if p < 0:
+        return r # Deterministic, the state is unchanged
+    pw = p // 64
+    pb = np.uint64(1) << np.uint64(p % 64)
+    mask = xq.copy()
+    mask[pw] &= ~pb
+    for i in range(r):
+        if basis[i, pw] & pb:
+            for k in range(pw, W):
+                basis[i, k] ^= mask[k]
+    measure(bits, q, outcome)
+    for j in range(r):
+        basis[j, pw] &= ~pb
+    i = owner[p]
+    if i < 0:
+        return r
+    # Take the vector that pivoted on bit k out of the basis, and reinsert it without bit k
+    v = basis[i].copy()
+    r -= 1
+    owner[p] = -1
+    if i != r:
+        basis[i] = basis[r]
+        k = 0
+        while basis[i, k] == 0:
+            k += 1
+        owner[64 * k + lowest_bit(basis[i, k])] = i
+    return insert(basis, owner, r, v)
+
+def rank_plan(regions):
+    """Sorts subsystems into a trie on their sorted qubits and flattens it into the steps of planned_ranks.
+
+    A region extending another (or sharing a prefix with it) then only inserts the qubits past the common prefix into a
+    copy of the already reduced basis. Single-child chains are one step, and the basis is only copied where the trie
+    branches: the last child of a node continues in the basis of its parent, every other child in a copy of it.
+
+    Args:
+        regions (list): The subsystems, each a list of qubit positions.
+
+    Returns:
+        tuple: For each step in depth-first order, the basis it works in and the basis it starts from (itself to continue,
+            -1 to start empty); the qubits to insert, concatenated, and the bounds of each step's; the step ending each
+            region; and the number of bases.
+    """
+    keys = [tuple(sorted(set(A))) for A in regions]
+    trie = {}
+    for key in keys:
+        node = trie
+        for q in key:
+            node = node.setdefault(q, {})
+        node[None] = key
+    slots, sources, qubits, starts, ends = [], [], [], [0], {}
+
+    def visit(node, slot, source, chain):
+        slots.append(slot)
+        sources.append(source)
+        qubits.extend(chain)
+        starts.append(len(qubits))
+        if None in node:
+            ends[node[None]] = len(slots) - 1
+        children = [q for q in node if q is not None]
+        for c, q in enumerate(children):
+            child, chain = node[q], [q]
+            while len(child) == 1 and None not in child:
+                (q, child), = child.items()
+                chain.append(q)
+            if c == len(children) - 1:
+                visit(child, slot, slot, chain)
+            else:
+                visit(child, max(slots) + 1, slot, chain)
+
+    visit(trie, 0, -1, [])
+    return (np.array(slots), np.array(sources), np.array(qubits, dtype = np.int64), np.array(starts),
+            np.array([ends[key] for key in keys], dtype = np.int64), max(slots) + 1)
+
+@njit
+def planned_ranks(bits, slots, sources, qubits, starts, ends, bases):
+    """Calculates the rank of the tableau restricted to each of several subsystems by the steps of rank_plan.
+
+    Args:
+        bits (numpy.ndarray): The packed tableau.
+        slots, sources, qubits, starts, ends (numpy.ndarray): The plan, see rank_plan.
+        bases (int): The number of bases of the plan.
+
+    Returns:
+        numpy.ndarray: The rank restricted to each region.
+    """
+    N = (bits.shape[0] - 1) // 2
+    W = bits.shape[1]
+    basis = np.empty((bases, N, W), dtype = np.uint64)
+    owner = np.empty((bases, 64 * W), dtype = np.int64)
+    r = np.zeros(bases, dtype = np.int64)
+    step_ranks = np.empty(slots.shape[0], dtype = np.int64)
+    for i in range(slots.shape[0]):
+        s = slots[i]
+        if sources[i] < 0:
+            owner[s] = -1
+            r[s] = 0
+        elif sources[i] != s:
+            basis[s, :r[sources[i]]] = basis[sources[i], :r[sources[i]]]
+            owner[s] = owner[sources[i]]
+            r[s] = r[sources[i]]
+        r[s] = insert_qubits(bits, basis[s], owner[s], r[s], qubits[starts[i]:starts[i + 1]])
+        step_ranks[i] = r[s]
+    return step_ranks[ends]
+
+def subsystem_ranks(bits, regions):
+    """Calculates the rank of the tableau restricted to each of several subsystems, sharing the reduction between them.
+
+    The regions are sorted into a trie on their sorted qubits, see rank_plan.
+
+    Args:
+        bits (numpy.ndarray): The packed tableau.
+        regions (list): The subsystems, each a list of qubit positions.
+
+    Returns:
+        numpy.ndarray: The rank restricted to each region.
+    """
+    return planned_ranks(bits, *rank_plan(regions))
+
+@njit(parallel = True)
+def planned_ranks_batch(bits, slots, sources, qubits, starts, ends, bases):
+    """Calculates the ranks of planned_ranks for every tableau of a batch.
+
+    Returns:
+        numpy.ndarray: Array of shape (B, R) of the rank of each trajectory restricted to each region.
+    """
+    ranks = np.empty((bits.shape[0], ends.shape[0]), dtype = np.int64)
+    for b in prange(bits.shape[0]):
+        ranks[b] = planned_ranks(bits[b], slots, sources, qubits, starts, ends, bases)
+    return ranks
+
+def subsystem_ranks_batch(bits, regions):
+    """Calculates the ranks of subsystem_ranks for every tableau of a batch, in parallel over the trajectories.
+
+    Args:
+        bits (numpy.ndarray): The packed tableaux, of shape (B, 2N + 1, W).
+        regions (list): The subsystems, each a list of qubit positions.
+
+    Returns:
+        numpy.ndarray: Array of shape (B, R) of the rank of each trajectory restricted to each region.
+    """
+    return planned_ranks_batch(bits, *rank_plan(regions))
+
+@njit(parallel = True)
+def prefix_ranks_batch(bits, qubits):
+    """Calculates the ranks of prefix_ranks for every tableau of a batch, in parallel over the trajectories.
+
+    Args:
+        bits (numpy.ndarray): The packed tableaux, of shape (B, 2N + 1, W).
+        qubits (numpy.ndarray): The ordered qubits.
+
+    Returns:
+        numpy.ndarray: Array of shape (B, n + 1) of the ranks of each trajectory.
+    """
+    ranks = np.empty((bits.shape[0], qubits.shape[0] + 1), dtype = np.int64)
+    for b in prange(bits.shape[0]):
+        ranks[b] = prefix_ranks(bits[b], qubits)
+    return ranks
+
+@njit
+def stabilizer_rows(bits):
+    """Transposes a packed tableau into one packed row per stabilizer over the columns xz...xz, the layout of gf2.
+
+    Args:
+        bits (numpy.ndarray): The packed tableau.
+
+    Returns:
+        numpy.ndarray: Array of shape (N, ceil(2N / 64)) of uint64 words, one stabilizer per row, without signs.
+    """
+    N = (bits.shape[0] - 1) // 2
+    rows = np.zeros((N, (2 * N + 63) // 64), dtype = np.uint64)
+    for c in range(2 * N):
+        bit = np.uint64(1) << np.uint64(c % 64)
+        for k in range(bits.shape[1]):
+            v = bits[c, k]
+            while v != 0:
+                rows[64 * k + lowest_bit(v), c // 64] |= bit
+                v &= v - np.uint64(1)
+    return rows
+
+@njit
+def interval_ranks(bits, D):
+    """Calculates the rank of the tableau restricted to every interval of qudits under periodic boundary conditions.
+
+    All intervals come from one reduction of the stabilizers to the clipped gauge of the open chain (gf2.clipped_gauge).
+    There, the stabilizers supported within an interval A that does not wrap around are generated by the generators lying
+    within it, so the rank restricted to A is 2|A| minus their number, which follows for all A from a table of the left
+    and right endpoints of the generators. An interval that wraps around has the entropy of its complement, which does
+    not. This takes O(N^2 W) word operations for the reduction and O(L^2) for the intervals.
+
+    Args:
+        bits (numpy.ndarray): The packed tableau.
+        D (int): The number of qubits per qudit.
+
+    Returns:
+        numpy.ndarray: Array of shape (L, L + 1) whose entry (i, x) is the rank restricted to qudits i, ..., i + x - 1 (mod L).
+    """
+    N = (bits.shape[0] - 1) // 2
+    L = N // D
+    rows = stabilizer_rows(bits)
+    gf2.clipped_gauge(rows)
+    ends = gf2.endpoints(rows) // (2 * D)
+    # inside[a, b] counts the generators within qudits a, ..., b - 1
+    inside = np.zeros((L + 1, L + 1), dtype = np.int64)
+    for g in range(N):
+        inside[ends[g, 0], ends[g, 1] + 1] += 1
+    for a in range(L - 1, -1, -1):
+        inside[a] += inside[a + 1]
+    for b in range(1, L + 1):
+        inside[:, b] += inside[:, b - 1]
+    ranks = np.empty((L, L + 1), dtype = np.int64)
+    for i in range(L):
+        for x in range(L + 1):
+            if i + x <= L:
+                ranks[i, x] = 2 * x * D - inside[i, i + x]
+            else:
+                ranks[i, x] = x * D + (L - x) * D - inside[i + x - L, i]
+    return ranks
+
+@njit(parallel = True)
+def interval_ranks_batch(bits, D):
+    """Calculates the ranks of interval_ranks for every tableau of a batch, in parallel over the trajectories.
+
+    Args:
+        bits (numpy.ndarray): The packed tableaux, of shape (B, 2N + 1, W).
+        D (int): The number of qubits per qudit.
+
+    Returns:
+        numpy.ndarray: Array of shape (B, L, L + 1) of the ranks of each trajectory.
+    """
+    L = (bits.shape[1] - 1) // 2 // D
+    ranks = np.empty((bits.shape[0], L, L + 1), dtype = np.int64)
+    for b in prange(bits.shape[0]):
+        ranks[b] = interval_ranks(bits[b], D)
+    return ranks
+
+@njit(parallel = True)
+def pair_ranks(bits, n):
+    """Calculates the rank of the tableau restricted to every pair of blocks of n consecutive qubits.
+
+    The rows of every block are reduced to an echelon basis of at most 2n vectors once, after which the rank of a pair
+    only takes inserting the basis of one block into that of the other. All pairs then take O(N^2 W) word operations,
+    the order of one Gaussian elimination of the whole tableau rather than one per pair.
+
+    Args:
+        bits (numpy.ndarray): The packed tableau.
+        n (int): The number of qubits per block, dividing N.
+
+    Returns:
+        numpy.ndarray: Array of shape (M, M), M = N / n, whose entry (a, b) is the rank restricted to blocks a and b.
+    """
+    N = (bits.shape[0] - 1) // 2
+    W = bits.shape[1]
+    M = N // n
+    bases = np.empty((M, 2 * n, W), dtype = np.uint64)
+    pivots = np.empty((M, 2 * n), dtype = np.int64)
+    r = np.zeros(M, dtype = np.int64)
+    for a in prange(M):
+        for row in range(2 * a * n, 2 * (a + 1) * n):
+            r[a] = insert_listed(bases[a], pivots[a], r[a], bits[row].copy())
+    ranks = np.empty((M, M), dtype = np.int64)
+    for a in prange(M):
+        basis = np.empty((4 * n, W), dtype = np.uint64)
+        pair_pivots = np.empty(4 * n, dtype = np.int64)
+        ranks[a, a] = r[a]
+        for b in range(a + 1, M):
+            basis[:r[a]] = bases[a, :r[a]]
+            pair_pivots[:r[a]] = pivots[a, :r[a]]
+            rank = r[a]
+            for i in range(r[b]):
+                rank = insert_listed(basis, pair_pivots, rank, bases[b, i].copy())
+            ranks[a, b] = rank
+            ranks[b, a] = rank
+    return ranks
+
+class StabilizerTableau:
+    """A stabilizer state on N qubits, stored as a bit-packed tableau.
+
+    Args:
+        bits (numpy.ndarray): The packed tableau, of shape (2N + 1, ceil(N / 64)).
+    """
+    def __init__(self, bits):
+        self.bits = bits
+        self.N = (bits.shape[0] - 1) // 2
+
+    def copy(self):
+        """Returns a copy of the state."""
+        return StabilizerTableau(self.bits.copy())
+
+    def entropy(self, A):
+        """Calculates the entanglement entropy of a subsystem, in bits.
+
+        Args:
+            A (list): The qubit positions of the subsystem.
+
+        Returns:
+            int: The entanglement entropy.
+        """
+        A = np.asarray(A, dtype = np.int64)
+        return subsystem_rank(self.bits, A) - A.shape[0]
+
+class StabilizerBatch:
+    """A stack of B independent stabilizer states on N qubits, stored as one bit-packed array.
+
+    Args:
+        bits (numpy.ndarray): The packed tableaux, of shape (B, 2N + 1, ceil(N / 64)).
+    """
+    def __init__(self, bits):
+        self.bits = bits
+        self.N = (bits.shape[1] - 1) // 2
+
+    def __len__(self):
+        return self.bits.shape[0]
+
+    def __getitem__(self, b):
+        """Returns trajectory b as a StabilizerTableau sharing memory with the batch."""
+        return StabilizerTableau(self.bits[b])
+
+    def copy(self):
+        """Returns a copy of the batch."""
+        return StabilizerBatch(self.bits.copy())
+
+def zero_state(N):
+    """Creates the state |0...0> on N qubits.
+
+    Args:
+        N (int): The number of qubits.
+
+    Returns:
+        StabilizerTableau: The zero state.
+    """
+    W = (N + 63) // 64
+    bits = np.zeros((2 * N + 1, W), dtype = np.uint64)
+    for q in range(N):
+        bits[2 * q + 1, q // 64] = np.uint64(1) << np.uint64(q % 64)
+    return StabilizerTableau(bits)
+
+def zero_batch(B, N):
+    """Creates a batch of B copies of the state |0...0> on N qubits.
+
+    Args:
+        B (int): The number of trajectories.
+        N (int): The number of qubits.
+
+    Returns:
+        StabilizerBatch: The batch of zero states.
+    """
+    bits = np.repeat(zero_state(N).bits[np.newaxis], B, axis = 0)
+    return StabilizerBatch(bits)
+
+@njit(parallel = True)
+def random_stabilizers(N, rng):
+    """Samples the packed tableau of a uniformly random stabilizer state on N qubits.
+
+    The stabilizer group is grown one generator at a time, each drawn uniformly from the Paulis that commute with the
+    previous ones and are independent of them. Every maximal isotropic subspace is reached by as many such sequences,
+    each equally likely, so the group is uniform, and so is the state with uniform signs. A symplectic basis (E_i, F_i)
+    of the Paulis not yet decided is kept, whose first k E_i are the chosen generators, so that each draw and the update
+    of the basis after it take O(N) vector operations, O(N^3 / 64) word operations in all.
+
+    Args:
+        N (int): The number of qubits.
+        rng (numpy.random.Generator): The random number generator.
+
+    Returns:
+        numpy.ndarray: The packed tableau, of shape (2N + 1, ceil(N / 64)).
+    """
+    V = (2 * N + 63) // 64 # Words per symplectic vector, in the order of the rows of a tableau
+    E = np.zeros((N, V), dtype = np.uint64)
+    F = np.zeros((N, V), dtype = np.uint64)
+    for q in range(N):
+        E[q, (2 * q + 1) // 64] = np.uint64(1) << np.uint64((2 * q + 1) % 64)
+        F[q, 2 * q // 64] = np.uint64(1) << np.uint64(2 * q % 64)
+    b = np.zeros(N, dtype = np.uint8)
+    c = np.zeros(N, dtype = np.uint8)
+    for k in range(N):
+        # Coefficients of the next generator u = sum_i b_i E_i + c_i F_i over the undecided pairs i >= k, not all zero
+        nonzero = False
+        while not nonzero:
+            for i in range(k, N):
+                b[i] = rng.integers(0, 2)
+                c[i] = rng.integers(0, 2)
+                nonzero = nonzero or b[i] == 1 or c[i] == 1
+        u = np.zeros(V, dtype = np.uint64)
+        for v in prange(V):
+            acc = np.uint64(0)
+            for i in range(k, N):
+                if b[i]:
+                    acc ^= E[i, v]
+                if c[i]:
+                    acc ^= F[i, v]
+            u[v] = acc
+        # A partner f of u from pair j, since <u, E_j> = c_j and <u, F_j> = b_j; move pair j to position k
+        j = k
+        while j < N and c[j] == 0:
+            j += 1
+        if j == N:
+            j = k
+            while b[j] == 0:
+                j += 1
+        f = E[j].copy() if c[j] else F[j].copy()
+        E[j] = E[k]
+        F[j] = F[k]
+        b[j], b[k] = b[k], b[j]
+        c[j], c[k] = c[k], c[j]
+        E[k] = u
+        F[k] = f
+        # Make the other pairs orthogonal to u and f: x += <x, u> f, as <x, f> = 0 already
+        for i in prange(k + 1, N):
+            if c[i]:
+                for v in range(V):
+                    E[i, v] ^= f[v]
+            if b[i]:
+                for v in range(V):
+                    F[i, v] ^= f[v]
+    # Generator k is E_k; transpose into the columns of the tableau and draw the signs
+    W = (N + 63) // 64
+    bits = np.zeros((2 * N + 1, W), dtype = np.uint64)
+    for k in range(N):
+        if rng.integers(0, 2):
+            bits[2 * N, k // 64] |= np.uint64(1) << np.uint64(k % 64)
+    for w in prange(W):
+        for k in range(64 * w, min(64 * w + 64, N)):
+            bit = np.uint64(1) << np.uint64(k % 64)
+            for v in range(V):
+                word = E[k, v]
+                while word:
+                    r = 64 * v + lowest_bit(word)
+                    bits[r, w] |= bit
+                    word &= word - np.uint64(1)
+    return bits
+
+def random_state(N, rng = None):
+    """Samples a uniformly random stabilizer state on N qubits, see random_stabilizers.
+
+    Args:
+        N (int): The number of qubits.
+        rng (numpy.random.Generator, optional): The random number generator. Defaults to None (fresh entropy).
+
+    Returns:
+        StabilizerTableau: The random state.
+    """
+    return StabilizerTableau(random_stabilizers(N, generator(rng)))
+
+@njit(parallel = True)
+def apply_layer_batch(bits, qubits, g, s, w, Q):
+    """Applies a different layer of Clifford gates to every trajectory of a batch in place, see apply_layer.
+
+    Args:
+        bits (numpy.ndarray): The packed tableaux, of shape (B, 2N + 1, W).
+        qubits (numpy.ndarray): Array of shape (G, n) containing the qubits each gate acts on.
+        g (numpy.ndarray): Array of shape (B, G, 2n, 2n) containing the symplectic matrices.
+        s (numpy.ndarray): Array of shape (B, G, 2n) containing the sign bits.
+        w (numpy.ndarray): Array of shape (B, G, 2n) containing the Y counts.
+        Q (numpy.ndarray): Array of shape (B, G, 2n, 2n) containing the sign forms.
+
+    Returns:
+        None
+    """
+    for b in prange(bits.shape[0]):
+        apply_layer(bits[b], qubits, g[b], s[b], w[b], Q[b])
+
+def brickwork_batch(bits, even, D, rng = None):
+    """Applies an independent layer of random Clifford gates to every trajectory of a batch, in place.
+
+    Args:
+        bits (numpy.ndarray): The packed tableaux, of shape (B, 2N + 1, W).
+        even (bool): Whether to add gates starting with even or odd qudits, see brickwork_pairs.
+        D (int): The number of qubits per qudit.
+        rng (numpy.random.Generator, optional): The random number generator. Defaults to None (fresh entropy).
+
+    Returns:
+        None
+    """
+    B = bits.shape[0]
+    L = (bits.shape[1] - 1) // 2 // D
+    pairs = brickwork_pairs(L, even, D)
+    layer = random_layer(B * pairs.shape[0], 2 * D, rng)
+    apply_layer_batch(bits, pairs, *[a.reshape((B, pairs.shape[0]) + a.shape[1:]) for a in layer])
+
+@njit(parallel = True)
+def measure_batch(bits, measured, outcomes, D):
+    """Measures the marked qudits of every trajectory of a batch in place, see measure_layer.
+
+    Args:
+        bits (numpy.ndarray): The packed tableaux, of shape (B, 2N + 1, W).
+        measured (numpy.ndarray): Boolean array of shape (B, L) marking the qudits to measure.
+        outcomes (numpy.ndarray): Array of shape (B, N) containing the outcomes to record for random measurements.
+        D (int): The number of qubits per qudit.
+
+    Returns:
+        None
+    """
+    for b in prange(bits.shape[0]):
+        qubits = np.empty(D * np.count_nonzero(measured[b]), dtype = np.int64)
+        n = 0
+        for i in range(measured.shape[1]):
+            if measured[b, i]:
+                for j in range(D):
+                    qubits[n] = i * D + j
+                    n += 1
+        measure_layer(bits[b], qubits, outcomes[b][qubits])
+
+def measurement_batch(bits, p, D, rng = None):
+    """Measures each qudit of every trajectory of a batch independently with probability p, in place.
+
+    Args:
+        bits (numpy.ndarray): The packed tableaux, of shape (B, 2N + 1, W).
+        p (float): The probability of measuring each qudit.
+        D (int): The number of qubits per qudit.
+        rng (numpy.random.Generator, optional): The random number generator. Defaults to None (fresh entropy).
+
+    Returns:
+        None
+    """
+    rng = generator(rng)
+    B = bits.shape[0]
+    N = (bits.shape[1] - 1) // 2
+    measured = rng.random((B, N // D)) < p
+    outcomes = rng.integers(2, size = (B, N))
+    measure_batch(bits, measured, outcomes, D)
+
+@njit(parallel = True)
+def apply_layer_shared(bits, qubits, g, s, w, Q):
+    """Applies the same layer of Clifford gates to every trajectory of a batch in place, compiling it only once, see apply_layer.
+
+    Args:
+        bits (numpy.ndarray): The packed tableaux, of shape (B, 2N + 1, W).
+        qubits (numpy.ndarray): Array of shape (G, n) containing the qubits each gate acts on.
+        g (numpy.ndarray): Array of shape (G, 2n, 2n) containing the symplectic matrices.
+        s (numpy.ndarray): Array of shape (G, 2n) containing the sign bits.
+        w (numpy.ndarray): Array of shape (G, 2n) containing the Y counts.
+        Q (numpy.ndarray): Array of shape (G, 2n, 2n) containing the sign forms.
+
+    Returns:
+        None
+    """
+    B, _, W = bits.shape
+    cols, inputs, num_inputs, terms, num_terms = compile_layer(qubits, g, s, Q)
+    chunks = min(W, (get_num_threads() + B - 1) // B) # Ranges of words per trajectory, to keep all threads busy
+    size = (W + chunks - 1) // chunks
+    for k in prange(B * chunks):
+        start = k % chunks * size
+        apply_compiled(bits[k // chunks], cols, inputs, num_inputs, terms, num_terms, w, start, min(start + size, W))
+
+def brickwork_shared(bits, even, D, rng = None):
+    """Applies one layer of random Clifford gates, the same for every trajectory of a batch, in place.
+
+    Args:
+        bits (numpy.ndarray): The packed tableaux, of shape (B, 2N + 1, W).
+        even (bool): Whether to add gates starting with even or odd qudits, see brickwork_pairs.
+        D (int): The number of qubits per qudit.
+        rng (numpy.random.Generator, optional): The random number generator. Defaults to None (fresh entropy).
+
+    Returns:
+        None
+    """
+    L = (bits.shape[1] - 1) // 2 // D
+    pairs = brickwork_pairs(L, even, D)
+    apply_layer_shared(bits, pairs, *random_layer(pairs.shape[0], 2 * D, rng))
+
+def measurement_sweep(bits, ps, D, rng = None):
+    """Measures qudit i of trajectory b of a batch if u_i < ps[b], for uniforms u_i and outcomes shared by all trajectories, in place.
+
+    Args:
+        bits (numpy.ndarray): The packed tableaux, of shape (B, 2N + 1, W).
+        ps (numpy.ndarray): The measurement probability of each trajectory.
+        D (int): The number of qubits per qudit.
+        rng (numpy.random.Generator, optional): The random number generator. Defaults to None (fresh entropy).
+
+    Returns:
+        None
+    """
+    rng = generator(rng)
+    B = bits.shape[0]
+    N = (bits.shape[1] - 1) // 2
+    u = rng.random(N // D)
+    outcomes = rng.integers(2, size = N)
+    measure_batch(bits, u[np.newaxis, :] < ps[:, np.newaxis], np.repeat(outcomes[np.newaxis], B, axis = 0), D)
+
+@njit(parallel = True)
+def cut_basis_batch(bits, qubits):
+    """Builds the echelon basis of the rows of a subsystem for every trajectory of a batch, see cut_basis.
+
+    Args:
+        bits (numpy.ndarray): The packed tableaux, of shape (B, 2N + 1, W).
+        qubits (numpy.ndarray): The qubits of the subsystem.
+
+    Returns:
+        tuple: The bases, of shape (B, min(2n, 64 W), W), their pivot owners, of shape (B, 64 W), and their ranks.
+    """
+    B, _, W = bits.shape
+    basis = np.empty((B, min(2 * qubits.shape[0], 64 * W), W), dtype = np.uint64)
+    owner = -np.ones((B, 64 * W), dtype = np.int64)
+    r = np.zeros(B, dtype = np.int64)
+    for b in prange(B):
+        r[b] = insert_qubits(bits[b], basis[b], owner[b], 0, qubits)
+    return basis, owner, r
+
+@njit(parallel = True)
+def measure_cut_batch(bits, measured, outcomes, D, basis, owner, r, qubits, inside):
+    """Measures the marked qudits of every trajectory of a batch like measure_batch, keeping the bases of a subsystem up to date.
+
+    Bases are updated by measure_cut, and rebuilt only for trajectories with a measurement inside the subsystem.
+
+    Args:
+        bits (numpy.ndarray): The packed tableaux, of shape (B, 2N + 1, W).
+        measured (numpy.ndarray): Boolean array of shape (B, L) marking the qudits to measure.
+        outcomes (numpy.ndarray): Array of shape (B, N) containing the outcomes to record for random measurements.
+        D (int): The number of qubits per qudit.
+        basis (numpy.ndarray): The bases, see cut_basis_batch.
+        owner (numpy.ndarray): The pivot owners of the bases.
+        r (numpy.ndarray): The ranks of the bases, updated in place.
+        qubits (numpy.ndarray): The qubits of the subsystem.
+        inside (numpy.ndarray): Boolean array of length L marking the qudits of the subsystem.
+
+    Returns:
+        None
+    """
+    for b in prange(bits.shape[0]):
+        stale = False
+        for i in range(measured.shape[1]):
+            if measured[b, i]:
+                for j in range(D):
+                    if inside[i]:
+                        measure(bits[b], i * D + j, outcomes[b, i * D + j])
+                        stale = True
+                    elif not stale:
+                        r[b] = measure_cut(bits[b], i * D + j, outcomes[b, i * D + j], basis[b], owner[b], r[b])
+                    else:
+                        measure(bits[b], i * D + j, outcomes[b, i * D + j])
+        if stale:
+            owner[b, :] = -1
+            r[b] = insert_qubits(bits[b], basis[b], owner[b], 0, qubits)
+
+class Circuit:
+    """A circuit of random Clifford gates and Z measurements acting on a StabilizerTableau.
+
+    Mirrors the subset of the pc.circuit.Circuit interface used by MIPT. Gates are drawn when they are added and
+    measurement outcomes when the circuit is applied, both from the circuit's random number generator.
+
+    Args:
+        N (int): The number of qubits.
+        rng (numpy.random.Generator, optional): The random number generator. Defaults to None (fresh entropy).
+    """
+    def __init__(self, N, rng = None):
+        self.N = N
+        self.rng = generator(rng)
+        self.ops = []
+
+    def gate(self, *qubits):
+        """Adds a uniformly random Clifford gate acting on the given qubits."""
+        self.layer(np.array([qubits], dtype = np.int64))
+
+    def layer(self, qubits):
+        """Adds a layer of uniformly random Clifford gates, drawn together by symplectic.random_layer.
+
+        Args:
+            qubits (numpy.ndarray): Array of shape (G, n) containing the qubits each gate acts on.
+        """
+        self.ops.append((qubits,) + random_layer(*qubits.shape, self.rng))
+
+    def measure(self, *qubits):
+        """Adds Z measurements of the given qubits."""
+        self.ops.append((np.array(qubits, dtype = np.int64),))
+
+    def forward(self, state):
+        """Applies the circuit to a state in place.
+
+        Args:
+            state (StabilizerTableau): The state to evolve.
+
+        Returns:
+            StabilizerTableau: The evolved state.
+        """
+        for op in self.ops:
+            if len(op) == 1:
+                measure_layer(state.bits, op[0], self.rng.integers(2, size = len(op[0])))
+            else:
+                apply_layer_parallel(state.bits, *op)
+        return state
+
+class CompactCircuit:
+    """A random circuit of brickwork layers stored as arrays, which can be drawn in bulk, saved and replayed exactly.
+
+    Layer t applies the brickwork layer of parity even[t] with the gates encoded by choices[t] (see
+    symplectic.random_choices), then measures the qudits marked in measured[t], recording outcomes[t] for random
+    measurements. Mirrors the forward method of Circuit.
+
+    Args:
+        L (int): The number of qudits.
+        D (int): The number of qubits per qudit.
+        even (numpy.ndarray): Boolean array of shape (T,) of the parity of each layer.
+        choices (numpy.ndarray): Array of shape (T, L // 2, K) of the choices of each gate.
+        measured (numpy.ndarray): Boolean array of shape (T, L) marking the measured qudits.
+        outcomes (numpy.ndarray): Array of shape (T, N) of the outcomes to record for random measurements.
+    """
+    def __init__(self, L, D, even, choices, measured, outcomes):
+        self.L = L
+        self.D = D
+        self.N = L * D
+        self.even = even
+        self.choices = choices
+        self.measured = measured
+        self.outcomes = outcomes
+
+    @classmethod
+    def generate(cls, L, layers, p, D = 1, rng = None, even = True):
+        """Draws a circuit of alternating layers, measuring each qudit after each layer with probability p.
+
+        Args:
+            L (int): The number of qudits.
+            layers (int): The number of layers.
+            p (float): The probability of measuring each qudit.
+            D (int, optional): The number of qubits per qudit. Defaults to 1.
+            rng (numpy.random.Generator, optional): The random number generator. Defaults to None (fresh entropy).
+            even (bool, optional): Whether the first layer starts with even or odd qudits. Defaults to True.
+
+        Returns:
+            CompactCircuit: The circuit.
+        """
+        rng = generator(rng)
+        parity = (np.arange(layers) % 2 == 0) == even
+        choices = random_choices(layers * (L // 2), 2 * D, rng)
+        measured = rng.random((layers, L)) < p
+        outcomes = rng.integers(2, size = (layers, L * D), dtype = np.uint8)
+        return cls(L, D, parity, choices.reshape(layers, L // 2, -1), measured, outcomes)
+
+    def __len__(self):
+        return len(self.even)
+
+    def apply_gates(self, state, t):
+        """Applies the gates of layer t to a state in place."""
+        pairs = brickwork_pairs(self.L, self.even[t], self.D)
+        apply_layer_parallel(state.bits, pairs, *decode_layer(self.choices[t], 2 * self.D))
+
+    def apply_measurements(self, state, t):
+        """Applies the measurements of layer t to a state in place."""
+        qubits = np.nonzero(np.repeat(self.measured[t], self.D))[0]
+        if len(qubits):
+            measure_layer(state.bits, qubits, self.outcomes[t][qubits])
+
+    def forward(self, state):
+        """Applies the circuit to a state in place.
+
+        Args:
+            state (StabilizerTableau): The state to evolve.
+
+        Returns:
+            StabilizerTableau: The evolved state.
+        """
+        for t in range(len(self)):
+            self.apply_gates(state, t)
+            self.apply_measurements(state, t)
+        return state
+
+    def save(self, path):
+        """Writes the circuit to a compressed .npz file, with the measured qudits and outcomes packed into bits."""
+        with open(path, 'wb') as f:
+            np.savez_compressed(f, L = self.L, D = self.D, even = self.even, choices = self.choices,
+                                measured = np.packbits(self.measured, axis = 1), outcomes = np.packbits(self.outcomes, axis = 1))
+
+    @classmethod
+    def load(cls, path):
+        """Reads a circuit written by save."""
+        with np.load(path) as data:
+            L, D = int(data['L']), int(data['D'])
+            return cls(L, D, data['even'], data['choices'], np.unpackbits(data['measured'], axis = 1, count = L).astype(bool),
+                       np.unpackbits(data['outcomes'], axis = 1, count = L * D))
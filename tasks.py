@@ -0,0 +1,78 @@
+import numpy as np
+
+# The parameter grids of the SLURM array drivers, mapping an array index t = 1, 2, ... to the parameters of one task.
+
+INFO_TASKS = 330
+ENTROPIES_TASKS = 30
+SWEEP_TASKS = 30
+
+# Critical points used by info.py, with the grid centred on them
+INFO_P = {
+    1: 0.16,
+    2: 0.33,
+    3: 0.418,
+    4: 0.458,
+    5: 0.478
+}
+
+# Critical points used by S_all.py
+ENTROPIES_P = {
+    1: 0.15967,
+    2: 0.32865,
+    3: 0.416,
+    4: 0.458,
+    5: 0.4792
+}
+
+def info_task(t):
+    """Maps an array index of info.py to its parameters.
+
+    The 330 tasks cover D in {1, ..., 5}, L in 2^{4, ..., 9} and 11 values of p spaced by 0.001 around INFO_P[D].
+
+    Args:
+        t (int): The array index, 1 to 330.
+
+    Returns:
+        tuple: L, D and p.
+    """
+    t -= 1
+    D = 1 + t // 66
+    t %= 66
+    L = 2**(4 + t // 11)
+    t %= 11
+    p = INFO_P[D] + 0.001 * (t - 5)
+    return L, D, p
+
+def info_sweep_task(t):
+    """Maps an array index of info_sweep.py to its parameters, the grid of info.py with all values of p in one task.
+
+    Args:
+        t (int): The array index, 1 to 30.
+
+    Returns:
+        tuple: L, D and the array of the 11 values of p.
+    """
+    L, D, _ = info_task(11 * (t - 1) + 1)
+    return L, D, INFO_P[D] + 0.001 * (np.arange(11) - 5)
+
+def entropies_task(t):
+    """Maps an array index of S_all.py to its parameters.
+
+    The 30 tasks cover D in {1, ..., 5} and L in 2^{4, ..., 9}, at p = ENTROPIES_P[D].
+
+    Args:
+        t (int): The array index, 1 to 30.
+
+    Returns:
+        tuple: L, D and p.
+    """
+    t -= 1
+    D = 1 + t // 6
+    L = 2**(4 + t % 6)
+    return L, D, ENTROPIES_P[D]
+
+# For each kind of result: the task mapping, the number of tasks, the driver script and the critical points
+DRIVERS = {
+    'info': (info_task, INFO_TASKS, 'info.py', INFO_P),
+    'entropies_all': (entropies_task, ENTROPIES_TASKS, 'S_all.py', ENTROPIES_P)
+}
@@ -0,0 +1,137 @@
+import time
+import numpy as np
+from multiprocess import Pool, Process, Queue
+from numba import set_num_threads
+
+import MIPT
+from MIPT import sample, sample_sweep
+from streams import generator
+from stats import RunningStats
+
+def worker(f, L, p, D, timesteps, depth, tasks, results):
+    """Evolves the trajectories assigned to one worker process, keeping them and their statistics alive between runs.
+
+    Args:
+        f (function): The function to sample, see MIPT.sample.
+        L (int): The number of qudits in the state.
+        p (float or numpy.ndarray): The probability of measuring each qudit, or several for coupled sweeps, see MIPT.sample_sweep.
+        D (int): The number of qubits per qudit.
+        timesteps (int): The number of timesteps to sample per run.
+        depth (int): The initial depth of the circuit.
+        tasks (multiprocess.Queue): Queue of (trajectory, seed, state, stats, burn_in, decorrelation) tasks, terminated by None.
+        results (multiprocess.Queue): Queue receiving (trajectory, result, state, elapsed seconds, stats.RunningStats) for each
+            task, the statistics being those of the whole trajectory so far.
+
+    Returns:
+        None
+    """
+    set_num_threads(1) # Every worker already has a CPU to itself
+    sampler = sample if np.ndim(p) == 0 else sample_sweep
+    states = {}
+    stats = {}
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        i, seed, state, trajectory_stats, burn_in, decorrelation = task
+        if state is not None:
+            states[i] = state
+        else:
+            decorrelation = 0 # Only states handed over, e.g. forked from a parent, need decorrelating
+        if trajectory_stats is not None:
+            stats[i] = trajectory_stats
+        if burn_in:
+            states.pop(i, None)
+            stats.pop(i, None)
+        start_time = time.time()
+        # Continue the binning analysis of the trajectory, so that blocks spanning runs are formed
+        stats.setdefault(i, RunningStats())
+        result, states[i] = sampler(f, L, p, D, timesteps, depth, state = states.get(i), seed = seed, return_state = True, stats = stats[i],
+                                   decorrelation = decorrelation)
+        results.put((i, result, states[i], time.time() - start_time, stats[i]))
+
+def fork(L, p, D, depth, seeds, shots, num_workers):
+    """Burns in one parent state per seed in parallel, and forks the initial states of shots trajectories from them.
+
+    Children share their parent's state, so they must evolve with independent streams for a decorrelation length of
+    timesteps before they are sampled, see TrajectoryPool.run; this replaces a burn-in of depth layers per trajectory.
+
+    Args:
+        L (int): The number of qudits in the state.
+        p (float): The probability of measuring each qudit.
+        D (int): The number of qubits per qudit.
+        depth (int): The depth of the burn-in circuit.
+        seeds (list): The seed of each parent, e.g. from streams.spawn.
+        shots (int): The number of children.
+        num_workers (int): The number of worker processes.
+
+    Returns:
+        list: The tableau.StabilizerTableau of each child, child i being a copy of parent i % len(seeds).
+    """
+    def parent(seed):
+        set_num_threads(1)
+        return MIPT.burn_in(L, p, D, depth, rng = generator(seed))
+    with Pool(min(num_workers, len(seeds))) as pool:
+        parents = pool.map(parent, seeds)
+    return [parents[i % len(parents)].copy() for i in range(shots)]
+
+class TrajectoryPool:
+    """A fixed set of worker processes, spawned once, that keep their trajectories alive across runs.
+
+    Trajectory i always lives on worker i % num_workers, so the initial circuit is only paid for once per trajectory.
+
+    Args:
+        f (function): The function to sample, see MIPT.sample.
+        L (int): The number of qudits in the state.
+        p (float or numpy.ndarray): The probability of measuring each qudit, or several for coupled sweeps.
+        D (int): The number of qubits per qudit.
+        timesteps (int): The number of timesteps to sample per run.
+        depth (int): The initial depth of the circuit.
+        num_workers (int): The number of worker processes.
+    """
+    def __init__(self, f, L, p, D, timesteps, depth, num_workers):
+        self.timesteps = timesteps
+        self.num_workers = num_workers
+        self.tasks = [Queue() for _ in range(num_workers)]
+        self.results = Queue()
+        self.processes = [Process(target = worker, args = (f, L, p, D, timesteps, depth, tasks, self.results), daemon = True)
+                          for tasks in self.tasks]
+        for process in self.processes:
+            process.start()
+
+    def run(self, seeds, states = None, burn_in = False, decorrelation = 0, stats = None):
+        """Advances every trajectory by one run, yielding results as they arrive.
+
+        Args:
+            seeds (list): The seed of each trajectory for this run, e.g. from streams.spawn.
+            states (list, optional): States to (re)place the trajectories with, e.g. from a checkpoint; None entries are kept. Defaults to None.
+            burn_in (bool, optional): Whether to restart every trajectory from the zero state, as separate sample calls would. Defaults to False.
+            decorrelation (int, optional): The timesteps the trajectories given in states evolve before sampling, see fork. Defaults to 0.
+            stats (list, optional): The stats.RunningStats to continue each trajectory with, e.g. from a checkpoint; None
+                entries are kept. Defaults to None.
+
+        Yields:
+            tuple: The trajectory index, the result of MIPT.sample, the final state, the elapsed seconds, and the
+                stats.RunningStats of the trajectory so far.
+        """
+        if states is None:
+            states = [None] * len(seeds)
+        if stats is None:
+            stats = [None] * len(seeds)
+        for i, (seed, state, trajectory_stats) in enumerate(zip(seeds, states, stats)):
+            self.tasks[i % self.num_workers].put((i, seed, state, trajectory_stats, burn_in, decorrelation))
+        for _ in range(len(seeds)):
+            yield self.results.get()
+
+    def close(self):
+        """Stops the worker processes."""
+        for tasks in self.tasks:
+            tasks.put(None)
+        for process in self.processes:
+            process.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()